@@ -0,0 +1,136 @@
+import sys
+from collections import deque
+
+
+class AdaptiveController:
+    """
+    Điều chỉnh skip frames và imgsz theo độ trễ đo được của từng stage.
+
+    Chi phí mỗi frame của stage inference là độ trễ một lần detect chia cho
+    skip frames; stage chậm nhất quyết định pipeline có theo kịp thời gian thực
+    (deadline = 1 / FPS) hay không.
+
+    - Quá tải (stage chậm nhất vượt headroom x deadline hoặc pipeline phải bỏ
+      frame): tăng skip frames trước, khi skip đã tối đa thì giảm imgsz.
+    - Dư tài nguyên (chi phí dự đoán sau khi nâng chất lượng vẫn dưới
+      low_water x deadline): tăng imgsz trước, sau đó giảm skip frames.
+
+    Mỗi thay đổi được in ra stderr và lưu trong self.changes.
+    """
+
+    def __init__(self, skip_range=(1, 8), imgsz_levels=(256, 320, 416, 512),
+                 headroom=0.85, low_water=0.6, interval=30, alpha=0.2,
+                 on_change=None, verbose=True):
+        """
+        Args:
+            skip_range: (min, max) của detect_skip_frames
+            imgsz_levels: Các mức imgsz được phép, tăng dần
+            headroom: Tỉ lệ deadline tối đa stage chậm nhất được dùng
+            low_water: Chỉ nâng chất lượng khi chi phí dự đoán dưới tỉ lệ deadline này
+            interval: Số frame tối thiểu giữa hai lần điều chỉnh
+            alpha: Hệ số làm mượt (EMA) của độ trễ
+            on_change: Callback on_change(record) khi thay đổi cấu hình
+            verbose: In mỗi thay đổi ra stderr
+        """
+        self.skip_min, self.skip_max = skip_range
+        self.imgsz_levels = sorted(imgsz_levels)
+        self.headroom = headroom
+        self.low_water = low_water
+        self.interval = interval
+        self.alpha = alpha
+        self.on_change = on_change
+        self.verbose = verbose
+
+        self.latency = {}
+        self.changes = deque(maxlen=200)
+        self.last_change_frame = None
+        self.last_dropped = 0
+
+    def record(self, stage, seconds):
+        """Ghi nhận độ trễ của một lần chạy stage ('decode', 'inference', 'annotate')"""
+        previous = self.latency.get(stage)
+        self.latency[stage] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def _bottleneck(self, inference_per_frame):
+        others = [seconds for stage, seconds in self.latency.items() if stage != 'inference']
+        return max([inference_per_frame] + others)
+
+    def update(self, frame_idx, deadline, skip, imgsz, dropped_frames=0):
+        """
+        Quyết định cấu hình cho các frame tiếp theo
+
+        Args:
+            frame_idx: Số frame hiện tại
+            deadline: Thời gian cho mỗi frame để theo kịp thời gian thực (giây)
+            skip: detect_skip_frames hiện tại
+            imgsz: detect_imgsz hiện tại
+            dropped_frames: Tổng số frame pipeline đã bỏ (tăng = đang tụt sau)
+
+        Returns:
+            (skip, imgsz) mới, hoặc None nếu giữ nguyên
+        """
+        inference = self.latency.get('inference')
+        if inference is None or deadline <= 0:
+            return None
+        if self.last_change_frame is None:
+            # Chờ đủ interval frame đầu tiên để độ trễ ổn định
+            self.last_change_frame = frame_idx
+            return None
+        if frame_idx - self.last_change_frame < self.interval:
+            return None
+
+        dropped = dropped_frames - self.last_dropped
+        self.last_dropped = dropped_frames
+        bottleneck = self._bottleneck(inference / skip)
+        lower = [level for level in self.imgsz_levels if level < imgsz]
+        higher = [level for level in self.imgsz_levels if level > imgsz]
+        new_skip, new_imgsz = skip, imgsz
+
+        if bottleneck > self.headroom * deadline or dropped > 0:
+            reason = "dropping frames" if dropped > 0 else "over deadline"
+            if skip < self.skip_max:
+                new_skip = skip + 1
+            elif lower:
+                new_imgsz = lower[-1]
+        else:
+            reason = "headroom"
+            if higher:
+                scaled = inference * (higher[0] / imgsz) ** 2
+                if self._bottleneck(scaled / skip) < self.low_water * deadline:
+                    new_imgsz = higher[0]
+            if new_imgsz == imgsz and skip > self.skip_min:
+                if self._bottleneck(inference / (skip - 1)) < self.low_water * deadline:
+                    new_skip = skip - 1
+
+        if (new_skip, new_imgsz) == (skip, imgsz):
+            return None
+
+        if new_imgsz != imgsz:
+            # Độ trễ inference tỉ lệ xấp xỉ với số pixel đầu vào
+            self.latency['inference'] = inference * (new_imgsz / imgsz) ** 2
+        self.last_change_frame = frame_idx
+        record = {
+            'frame': frame_idx,
+            'skip': [skip, new_skip],
+            'imgsz': [imgsz, new_imgsz],
+            'reason': reason,
+            'inference_ms': round(inference * 1000, 1),
+            'bottleneck_ms': round(bottleneck * 1000, 1),
+            'deadline_ms': round(deadline * 1000, 1)
+        }
+        self.changes.append(record)
+        if self.verbose:
+            print(f"Adaptive control at frame {frame_idx}: skip {skip} -> {new_skip}, "
+                  f"imgsz {imgsz} -> {new_imgsz} ({reason}, inference {record['inference_ms']} ms, "
+                  f"bottleneck {record['bottleneck_ms']} ms, deadline {record['deadline_ms']} ms)",
+                  file=sys.stderr)
+        if self.on_change:
+            self.on_change(record)
+        return new_skip, new_imgsz
+
+    def stats(self):
+        """Độ trễ trung bình (ms) của các stage và lịch sử thay đổi"""
+        return {
+            'latency_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.latency.items()},
+            'changes': list(self.changes)
+        }
@@ -0,0 +1,423 @@
+"""
+Backend chạy inference cho VehicleDetector.
+
+Mọi backend có cùng giao diện predict(frames, imgsz, conf) và trả về cho mỗi
+frame một mảng (N, 6) [x1, y1, x2, y2, conf, cls_id] theo tọa độ frame gốc.
+
+- ultralytics: model .pt chạy bằng PyTorch eager (mặc định)
+- onnx: model .onnx chạy bằng ONNX Runtime (CPU)
+- openvino: thư mục *_openvino_model/ hoặc file .xml chạy bằng OpenVINO
+- torchscript: file .torchscript chạy bằng torch.jit
+
+Model export bằng Ultralytics, ví dụ:
+    yolo export model=yolov8s.pt format=onnx imgsz=416 dynamic=True
+    yolo export model=yolov8s.pt format=openvino imgsz=416 int8=True
+
+So sánh các backend trên cùng một video:
+    python backends.py clip.mp4 --model yolov8s.pt --model yolov8s.onnx --model yolov8s_openvino_model
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from coords import DEFAULT_LONG_SIDE, working_size
+from tracker import box_iou_matrix
+
+
+BACKENDS = ('auto', 'ultralytics', 'onnx', 'openvino', 'torchscript')
+
+
+def letterbox(frame, size, color=(114, 114, 114)):
+    """
+    Resize giữ tỉ lệ và thêm viền để được ảnh vuông size x size
+
+    Returns:
+        (ảnh đã letterbox, tỉ lệ scale, (pad_x, pad_y))
+    """
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    frame = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return frame, ratio, (left, top)
+
+
+def nms(xyxy, conf, cls_id, iou_threshold, max_det=300):
+    """NMS theo từng class (dịch box theo class_id để các class không chồng nhau)"""
+    if len(conf) == 0:
+        return np.empty(0, dtype=np.int64)
+    offset = cls_id.astype(np.float32)[:, None] * 7680.0
+    boxes = xyxy + offset
+    xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+    indices = cv2.dnn.NMSBoxes(xywh.tolist(), conf.tolist(), 0.0, iou_threshold)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    return indices[:max_det]
+
+
+def decode_yolov8(output, conf_threshold, ratio, pad, frame_shape, iou_threshold=0.7):
+    """
+    Giải mã output thô của YOLOv8 đã export (84, N): 4 box cxcywh + 80 điểm class
+
+    Returns:
+        Mảng (N, 6) [x1, y1, x2, y2, conf, cls_id] theo tọa độ frame gốc
+    """
+    pred = output.T
+    scores = pred[:, 4:]
+    cls_id = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), cls_id]
+    keep = conf >= conf_threshold
+    if not keep.any():
+        return np.empty((0, 6), dtype=np.float32)
+
+    pred, conf, cls_id = pred[keep], conf[keep], cls_id[keep]
+    cxcy, wh = pred[:, :2], pred[:, 2:4]
+    xyxy = np.concatenate([cxcy - wh / 2, cxcy + wh / 2], axis=1)
+
+    indices = nms(xyxy, conf, cls_id, iou_threshold)
+    xyxy, conf, cls_id = xyxy[indices], conf[indices], cls_id[indices]
+
+    xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / ratio
+    xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / ratio
+    h, w = frame_shape[:2]
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+
+    return np.concatenate(
+        [xyxy, conf[:, None], cls_id[:, None].astype(np.float32)], axis=1
+    ).astype(np.float32)
+
+
+class UltralyticsBackend:
+    """Model .pt chạy bằng Ultralytics/PyTorch"""
+
+    name = 'ultralytics'
+
+    def __init__(self, model_path, num_threads=None):
+        from ultralytics import YOLO
+
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        self.model = YOLO(model_path)
+
+    def predict(self, frames, imgsz, conf):
+        results = self.model.predict(
+            frames,                # Danh sách ảnh đầu vào (1 batch)
+            verbose=False,         # Tắt log
+            imgsz=imgsz,           # Kích thước resize ảnh
+            conf=conf,             # Ngưỡng độ tin cậy
+            half=False,            # Không dùng FP16 (CPU)
+            device='cpu'           # Chạy trên CPU
+        )
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+
+class ExportedModelBackend(ABC):
+    """Phần chung của các model đã export: letterbox, chạy model, giải mã và NMS"""
+
+    name = 'exported'
+    fixed_imgsz = None     # Kích thước input cố định của model (None = theo imgsz)
+    max_batch = None       # Batch tối đa model chấp nhận (None = không giới hạn)
+
+    @abstractmethod
+    def _infer(self, blob):
+        """Chạy model với blob NCHW float32, trả về mảng (B, 84, N)"""
+
+    def predict(self, frames, imgsz, conf):
+        blob, transforms = self.preprocess(frames, imgsz)
+        return self.postprocess(self.infer(blob), frames, transforms, conf)
+
+    def preprocess(self, frames, imgsz):
+        """Letterbox các frame thành blob NCHW, trả về (blob, [(ratio, pad), ...])"""
+        size = self.fixed_imgsz or imgsz
+        letterboxed = [letterbox(frame, size) for frame in frames]
+        blob = cv2.dnn.blobFromImages(
+            [image for image, _, _ in letterboxed], scalefactor=1 / 255.0, swapRB=True
+        )
+        return blob, [(ratio, pad) for _, ratio, pad in letterboxed]
+
+    def infer(self, blob):
+        """Chạy model theo từng phần không quá max_batch, trả về mảng (B, 84, N)"""
+        step = self.max_batch or len(blob)
+        outputs = [self._infer(blob[i:i + step]) for i in range(0, len(blob), step)]
+        return np.concatenate(outputs, axis=0)
+
+    def postprocess(self, outputs, frames, transforms, conf):
+        """Giải mã và NMS output của model thành kết quả thô theo tọa độ từng frame"""
+        return [
+            decode_yolov8(output, conf, ratio, pad, frame.shape)
+            for output, frame, (ratio, pad) in zip(outputs, frames, transforms)
+        ]
+
+
+class OnnxBackend(ExportedModelBackend):
+    """Model .onnx chạy bằng ONNX Runtime trên CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        if isinstance(batch, int):
+            self.max_batch = batch
+        if isinstance(height, int):
+            self.fixed_imgsz = height
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOBackend(ExportedModelBackend):
+    """Model OpenVINO IR (thư mục *_openvino_model/ hoặc file .xml)"""
+
+    name = 'openvino'
+
+    def __init__(self, model_path, num_threads=None):
+        import openvino as ov
+
+        if os.path.isdir(model_path):
+            xml_files = [f for f in os.listdir(model_path) if f.endswith('.xml')]
+            if not xml_files:
+                raise FileNotFoundError(f"No .xml model in {model_path}")
+            model_path = os.path.join(model_path, xml_files[0])
+
+        core = ov.Core()
+        model = core.read_model(model_path)
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if num_threads:
+            config['INFERENCE_NUM_THREADS'] = num_threads
+        self.compiled = core.compile_model(model, 'CPU', config)
+
+        shape = model.input(0).get_partial_shape()
+        if shape[0].is_static:
+            self.max_batch = shape[0].get_length()
+        if shape[2].is_static:
+            self.fixed_imgsz = shape[2].get_length()
+
+    def _infer(self, blob):
+        return self.compiled(blob)[0]
+
+
+class TorchScriptBackend(ExportedModelBackend):
+    """Model .torchscript chạy bằng torch.jit"""
+
+    name = 'torchscript'
+    max_batch = 1
+
+    def __init__(self, model_path, num_threads=None):
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.torch = torch
+        self.model = torch.jit.load(model_path, map_location='cpu').eval()
+
+    def _infer(self, blob):
+        with self.torch.inference_mode():
+            output = self.model(self.torch.from_numpy(blob))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.numpy()
+
+
+def detect_backend(model_path):
+    """Đoán backend từ đường dẫn model"""
+    path = model_path.rstrip('/\\')
+    if path.endswith('.onnx'):
+        return 'onnx'
+    if path.endswith('_openvino_model') or path.endswith('.xml'):
+        return 'openvino'
+    if path.endswith('.torchscript'):
+        return 'torchscript'
+    return 'ultralytics'
+
+
+def create_backend(model_path, backend='auto', num_threads=None):
+    """
+    Tạo backend inference
+
+    Args:
+        model_path: Đường dẫn model (.pt, .onnx, .torchscript, *_openvino_model/)
+        backend: Tên backend trong BACKENDS ('auto' = đoán từ model_path)
+        num_threads: Số thread inference (None = mặc định của runtime)
+    """
+    if backend == 'auto':
+        backend = detect_backend(model_path)
+    if backend == 'ultralytics':
+        return UltralyticsBackend(model_path, num_threads)
+    if backend == 'onnx':
+        return OnnxBackend(model_path, num_threads)
+    if backend == 'openvino':
+        return OpenVINOBackend(model_path, num_threads)
+    if backend == 'torchscript':
+        return TorchScriptBackend(model_path, num_threads)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def quantize_onnx(model_path, output_path):
+    """Lượng tử hóa INT8 (dynamic) một model ONNX, dùng với backend onnx"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    return output_path
+
+
+def match_boxes(reference, candidate, iou_threshold=0.5):
+    """
+    Ghép từng cặp box của hai kết quả detect (N, 6) của cùng một frame:
+    box khớp khi cùng class và IoU >= iou_threshold, mỗi box khớp tối đa một box
+
+    Returns:
+        Mảng bool theo reference: box nào đã được ghép
+    """
+    matched = np.zeros(len(reference), dtype=bool)
+    if len(reference) == 0 or len(candidate) == 0:
+        return matched
+
+    iou = box_iou_matrix(reference[:, :4], candidate[:, :4])
+    iou[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0
+    while True:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matched[i] = True
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched
+
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """
+    Độ trùng khớp (F1) giữa hai kết quả detect của cùng một frame:
+    box khớp khi cùng class và IoU >= iou_threshold
+    """
+    if len(reference) == 0 and len(candidate) == 0:
+        return 1.0
+    matches = int(match_boxes(reference, candidate, iou_threshold).sum())
+    return 2 * matches / (len(reference) + len(candidate))
+
+
+def read_frames(video_path, max_frames, frame_size=DEFAULT_LONG_SIDE):
+    """
+    Đọc trước frame của video để mọi backend chạy trên cùng dữ liệu, ở kích thước
+    làm việc như pipeline (frame_size theo quy ước của coords.working_size)
+    """
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        size = working_size((frame.shape[1], frame.shape[0]), frame_size)
+        if size != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def benchmark(video_path, model_specs, imgsz=416, conf=0.4, num_threads=None,
+              max_frames=200, batch_size=1, warmup=2, frame_size=DEFAULT_LONG_SIDE):
+    """
+    So sánh các backend trên cùng một video
+
+    Args:
+        video_path: Video dùng để đo
+        model_specs: Danh sách (model_path, backend)
+        batch_size: Số frame mỗi lần predict
+        frame_size: Kích thước frame làm việc (xem coords.working_size)
+
+    Returns:
+        Danh sách kết quả mỗi backend: latency (ms/frame), throughput (FPS) và
+        độ trùng khớp với backend đầu tiên
+    """
+    frames = read_frames(video_path, max_frames, frame_size)
+    if not frames:
+        raise IOError(f"Cannot read frames from {video_path}")
+
+    reports = []
+    reference = None
+    for model_path, backend_name in model_specs:
+        backend = create_backend(model_path, backend_name, num_threads)
+        for _ in range(warmup):
+            backend.predict(frames[:batch_size], imgsz, conf)
+
+        outputs = []
+        latencies = []
+        start_time = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            batch = frames[i:i + batch_size]
+            t0 = time.perf_counter()
+            outputs.extend(backend.predict(batch, imgsz, conf))
+            latencies.append((time.perf_counter() - t0) * 1000 / len(batch))
+        elapsed = time.perf_counter() - start_time
+
+        if reference is None:
+            reference = outputs
+        scores = [agreement(ref, out) for ref, out in zip(reference, outputs)]
+        reports.append({
+            'model': model_path,
+            'backend': backend.name,
+            'frames': len(frames),
+            'latency_ms_p50': round(float(np.percentile(latencies, 50)), 2),
+            'latency_ms_p95': round(float(np.percentile(latencies, 95)), 2),
+            'throughput_fps': round(len(frames) / elapsed, 2),
+            'agreement': round(float(np.mean(scores)), 4)
+        })
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh các backend inference trên cùng một video")
+    parser.add_argument("video", help="Video dùng để đo")
+    parser.add_argument("--model", action="append", required=True,
+                        help="Model cần so sánh, dạng path hoặc path:backend (có thể lặp lại)")
+    parser.add_argument("--imgsz", type=int, default=416, help="Kích thước ảnh khi detect")
+    parser.add_argument("--conf", type=float, default=0.4, help="Ngưỡng confidence (0-1)")
+    parser.add_argument("--threads", type=int, default=None, help="Số thread inference")
+    parser.add_argument("--frames", type=int, default=200, help="Số frame dùng để đo")
+    parser.add_argument("--batch-size", type=int, default=1, help="Số frame mỗi lần predict")
+    parser.add_argument("-o", "--output", default="-", help="File JSON kết quả ('-' = stdout)")
+    args = parser.parse_args(argv)
+
+    model_specs = []
+    for spec in args.model:
+        model_path, _, backend_name = spec.rpartition(":")
+        if backend_name not in BACKENDS:
+            model_path, backend_name = spec, 'auto'
+        model_specs.append((model_path, backend_name))
+
+    reports = benchmark(args.video, model_specs, args.imgsz, args.conf,
+                        args.threads, args.frames, args.batch_size)
+    data = json.dumps(reports, indent=2)
+    if args.output == "-":
+        print(data)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
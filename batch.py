@@ -0,0 +1,672 @@
+"""
+Xử lý hàng loạt video không cần giao diện (không import PyQt5).
+
+Ví dụ:
+    python batch.py data/input/*.mp4 --roi 0,100,600,400 --classes car,truck -o results.json
+    python batch.py data/input/*.mp4 --workers 8 --journal run.jsonl -o results.json
+    python batch.py data/input/*.mp4 --detection-cache .detection_cache -o results.json
+    python batch.py rtsp://camera/stream --metrics-port 9108 --metrics-log 60 -o results.json
+    python batch.py data/input/*.mp4 --roi 0.0,0.2,0.66,0.77 --frame-size native -o results.json
+    python batch.py data/input/*.mp4 --line 0.0,0.6,1.0,0.6 --zone 0.1,0.3,0.6,0.3,0.9,0.9,0.0,0.9 -o results.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from coords import DEFAULT_LONG_SIDE, REFERENCE_SIZE, is_normalized
+from counting import DIRECTIONS
+from detector import VehicleDetector
+from roi_manager import ROIManager
+from vehicle_processor import VehicleProcessor
+from snapshot_writer import SnapshotWriter
+from motion_gate import MotionGate
+from adaptive import AdaptiveController
+from detection_cache import DetectionCache
+from record_sink import JsonlSink, FanoutSink
+from event_store import EventStore
+from metrics import MetricsRegistry, MetricsServer, MetricsLogger, install_profile_signal
+from video_source import open_source
+from pipeline import FramePipeline, BLOCK
+from orchestrator import run_parallel
+from batching import MicroBatcher
+from backends import BACKENDS
+from roi_manager import TRACKERS
+
+
+DEFAULT_CLASSES = ['car', 'truck', 'bus', 'motorcycle']
+
+
+def snapshot_dir(save_dir, video_path):
+    """
+    Thư mục ảnh riêng của một video trong save_dir: <tên video>-<hash đường dẫn>
+
+    ID xe bắt đầu lại từ 0 ở mỗi video, nên ảnh car_<id> của các video (và các
+    worker) không được ghi chung một thư mục.
+    """
+    stem = os.path.splitext(os.path.basename(video_path.rstrip("/")))[0]
+    stem = re.sub(r"[^\w.-]+", "_", stem) or "video"
+    return os.path.join(save_dir, f"{stem}-{hashlib.sha1(video_path.encode('utf-8')).hexdigest()[:8]}")
+
+
+def process_video(video_path, detector, roi_coords, target_classes,
+                  detect_skip_frames=2, frame_size=DEFAULT_LONG_SIDE, save_dir=None,
+                  batch_size=1, max_wait=0.02, batcher=None, source_id=0,
+                  tracker_type='centroid', roi_detect=False, motion_gate=None, adaptive=None,
+                  decoder='auto', detection_cache=None, evict_after=None, records_out=None,
+                  event_db=None, metrics=None, tiling=None, zones=None, lines=None):
+    """
+    Chạy toàn bộ pipeline trên một video, không giữ nhịp và không vẽ
+
+    Args:
+        video_path: Đường dẫn video
+        detector: VehicleDetector đã khởi tạo
+        roi_coords: Danh sách ROI [(x1, y1, x2, y2), ...]: pixel của frame làm việc (int)
+            hoặc chuẩn hóa 0-1 theo kích thước frame (float)
+        target_classes: Danh sách loại phương tiện cần đếm
+        detect_skip_frames: Số frames bỏ qua giữa các lần detect
+        frame_size: Kích thước frame làm việc: cạnh dài (int, giữ tỉ lệ video), (width, height)
+            cố định hoặc None = độ phân giải gốc (xem coords.working_size)
+        save_dir: Thư mục lưu ảnh vehicles, mỗi video một thư mục con (snapshot_dir)
+            (None = không lưu)
+        batch_size: Số frame mỗi lần predict khi không truyền batcher
+        max_wait: Thời gian tối đa (giây) chờ gom đủ batch
+        batcher: MicroBatcher dùng chung giữa nhiều video chạy đồng thời
+        source_id: ID của video trong batcher dùng chung
+        tracker_type: Loại tracker dùng chung cho các ROI (xem roi_manager.TRACKERS)
+        roi_detect: Chỉ detect phần ảnh quanh các ROI thay vì cả frame
+        motion_gate: Tham số MotionGate (dict) để bỏ qua YOLO khi ROI đứng yên (None = tắt)
+        adaptive: Tham số AdaptiveController (dict) để tự chỉnh skip frames/imgsz theo
+            độ trễ so với FPS của video (None = tắt, không dùng được với batch_size > 1)
+        decoder: Cách decode video (xem video_source.open_source)
+        detection_cache: Tham số DetectionCache (dict) để lưu/dùng lại kết quả detect
+            thô trên đĩa (None = tắt)
+        evict_after: Bỏ record của xe khỏi bộ nhớ sau chừng này giây không xuất hiện
+            (None = giữ hết; kết quả 'tracks' khi đó chỉ còn các xe chưa bị bỏ)
+        records_out: File JSON Lines lưu record của mọi xe (None = không lưu)
+        event_db: File SQLite (event_store.EventStore) lưu xe, sự kiện vào/ra và số xe
+            theo khung thời gian (None = không lưu)
+        metrics: metrics.MetricsRegistry nhận số liệu của pipeline (None = không đo)
+        tiling: Tham số VehicleDetector.tile_plan (dict) để detect các tile quanh ROI trên
+            frame gốc, giúp thấy xe nhỏ ở xa (None = detect trên frame làm việc)
+        zones: Danh sách zone đa giác [[(x, y), ...], ...] (pixel hoặc chuẩn hóa), được đếm
+            như ROI
+        lines: Danh sách vạch đếm theo hướng [(x1, y1, x2, y2), ...] (pixel hoặc chuẩn hóa)
+
+    Returns:
+        Dictionary kết quả: video, số frame, thời gian chạy, counts và tracks theo ROI,
+        số lượt cắt theo hướng và loại xe của mỗi vạch đếm
+    """
+    source = open_source(video_path, frame_size, decoder)
+
+    # Luồng trực tiếp chỉ biết kích thước khi có frame đầu: ROI pixel khi đó theo frame
+    # tham chiếu rồi được đổi tỉ lệ (nên dùng ROI chuẩn hóa)
+    roi_manager = ROIManager(tracker_type=tracker_type, frame_size=source.frame_size or REFERENCE_SIZE)
+    for coords in roi_coords:
+        if is_normalized(coords):
+            roi_manager.add_roi_normalized(*coords)
+        else:
+            roi_manager.add_roi(*coords)
+    for points in zones or ():
+        if is_normalized([value for point in points for value in point]):
+            roi_manager.add_zone_normalized(points)
+        else:
+            roi_manager.add_zone(points)
+    for coords in lines or ():
+        if is_normalized(coords):
+            roi_manager.lines.add_line_normalized(*coords)
+        else:
+            roi_manager.lines.add_line(*coords)
+    # Offline: writer chờ khi đĩa chậm thay vì bỏ ảnh
+    if save_dir:
+        save_dir = snapshot_dir(save_dir, video_path)
+    snapshot_writer = SnapshotWriter(save_dir, block=True) if save_dir else None
+    sinks = []
+    if records_out:
+        sinks.append(JsonlSink(records_out, {'video': video_path}))
+    event_store = recorder = None
+    if event_db:
+        event_store = EventStore(event_db)
+        recorder = event_store.recorder(video_path, source.fps)
+        sinks.append(recorder)
+    vehicle_processor = VehicleProcessor(
+        save_dir=save_dir, snapshot_writer=snapshot_writer,
+        evict_after=int(evict_after * (source.fps or 25)) if evict_after is not None else None,
+        sink=sinks[0] if len(sinks) == 1 else FanoutSink(*sinks) if sinks else None,
+        on_event=recorder.on_event if recorder else None
+    )
+    detector.reset_cache()
+    video_cache = None
+    if detection_cache is not None and not source.is_live and source.frame_size:
+        video_cache = DetectionCache(**detection_cache).open(video_path, detector.cache_key(), source.frame_size)
+
+    own_batcher = None
+    if batcher is None and batch_size > 1:
+        own_batcher = batcher = MicroBatcher(detector, batch_size, max_wait, detect_skip_frames)
+        own_batcher.start()
+    if batcher is not None:
+        batcher.reset_source(source_id)
+
+    pipeline = FramePipeline(
+        source, detector, roi_manager, vehicle_processor,
+        detect_skip_frames=detect_skip_frames,
+        drop_policy=BLOCK,
+        queue_size=max(4, batcher.batch_size if batcher else 1),
+        realtime=False,
+        annotate=False,
+        batcher=batcher,
+        source_id=source_id,
+        roi_detect=roi_detect,
+        motion_gate=MotionGate(**motion_gate) if motion_gate is not None else None,
+        controller=AdaptiveController(**adaptive) if adaptive is not None else None,
+        frame_cache_size=0,
+        result_cache_size=0,
+        detection_cache=video_cache,
+        metrics=metrics,
+        tiling=tiling
+    )
+    pipeline.set_target_classes(target_classes)
+
+    initial_imgsz = detector.detect_imgsz
+    start_time = time.perf_counter()
+    try:
+        pipeline.start()
+        pipeline.wait()
+    finally:
+        pipeline.stop()
+        source.release()
+        if own_batcher:
+            own_batcher.stop()
+        vehicle_processor.close()
+        for sink in sinks:
+            if isinstance(sink, JsonlSink):
+                sink.close()
+        if event_store:
+            event_store.close()
+        if video_cache:
+            try:
+                video_cache.save()
+            except OSError as e:
+                print(f"Cannot save detection cache for {video_path}: {e}", file=sys.stderr)
+        detector.detect_imgsz = initial_imgsz
+    elapsed = time.perf_counter() - start_time
+    memory = vehicle_processor.memory_stats()
+
+    summary = vehicle_processor.get_roi_summary()
+    rois = {}
+    for roi_id, roi_data in roi_manager.get_all_rois().items():
+        roi_summary = summary.get(roi_id, {'counts': {}, 'entries': 0, 'exits': 0, 'tracks': []})
+        rois[str(roi_id)] = {
+            'coords': list(roi_data['coords']),
+            'normalized': [round(value, 6) for value in roi_data['normalized']],
+            'counts': roi_summary['counts'],
+            'entries': roi_summary['entries'],
+            'exits': roi_summary['exits'],
+            'tracks': roi_summary['tracks']
+        }
+        if evict_after is not None:
+            rois[str(roi_id)]['evicted'] = roi_summary.get('evicted', 0)
+        if 'polygon' in roi_data:
+            rois[str(roi_id)]['polygon'] = [list(point) for point in roi_data['polygon']]
+
+    line_summary = vehicle_processor.get_line_summary()
+    count_lines = {}
+    for line_id, line in roi_manager.lines.lines.items():
+        line_result = line_summary.get(line_id, {'in': {}, 'out': {}, 'total': 0})
+        count_lines[str(line_id)] = {
+            'coords': list(line.coords),
+            'normalized': [round(value, 6) for point in line.normalized for value in point],
+            **line_result
+        }
+
+    result = {
+        'video': video_path,
+        'frames': pipeline.current_frame,
+        'elapsed': round(elapsed, 3),
+        'fps': round(pipeline.current_frame / elapsed, 2) if elapsed > 0 else 0.0,
+        'frame_size': [pipeline.frame_width, pipeline.frame_height],
+        'rois': rois
+    }
+    if count_lines:
+        result['lines'] = count_lines
+    if snapshot_writer:
+        result['snapshots'] = snapshot_writer.stats()
+    if pipeline.motion_gate:
+        result['motion_gate'] = pipeline.motion_gate.stats()
+    if pipeline.controller:
+        result['adaptive'] = pipeline.controller.stats()
+    if video_cache:
+        result['detection_cache'] = video_cache.stats()
+    if evict_after is not None:
+        result['memory'] = memory
+    if source.is_live:
+        result['stream'] = source.stats()
+        result['latency'] = pipeline.latency.stats()
+    return result
+
+
+def run_batch(video_paths, roi_coords, target_classes, model_path="yolov8s.pt",
+              class_file="coco.txt", confidence_threshold=40, detect_imgsz=416,
+              backend='auto', num_threads=None, low_confidence=None, detect_skip_frames=2,
+              frame_size=DEFAULT_LONG_SIDE, save_dir=None, batch_size=1, max_wait=0.02,
+              tracker_type='centroid', roi_detect=False, motion_gate=None, adaptive=None,
+              decoder='auto', detection_cache=None, evict_after=None, records_out=None,
+              event_db=None, concurrent_videos=1, metrics=None, tiling=None, zones=None, lines=None):
+    """
+    Xử lý nhiều video với cùng một detector
+
+    Với concurrent_videos > 1, các video chạy đồng thời và dùng chung một
+    MicroBatcher để frame của nhiều video được gom vào cùng một batch.
+    Mọi video ghi số liệu vào cùng metrics (nếu có), phân biệt theo nhãn source.
+    """
+    detector = VehicleDetector(
+        model_path=model_path,
+        class_file=class_file,
+        confidence_threshold=confidence_threshold,
+        detect_imgsz=detect_imgsz,
+        backend=backend,
+        num_threads=num_threads,
+        low_confidence=low_confidence
+    )
+    run_kwargs = {
+        'detect_skip_frames': detect_skip_frames,
+        'frame_size': frame_size,
+        'save_dir': save_dir,
+        'batch_size': batch_size,
+        'max_wait': max_wait,
+        'tracker_type': tracker_type,
+        'roi_detect': roi_detect,
+        'motion_gate': motion_gate,
+        'adaptive': adaptive,
+        'decoder': decoder,
+        'detection_cache': detection_cache,
+        'evict_after': evict_after,
+        'records_out': records_out,
+        'event_db': event_db,
+        'metrics': metrics,
+        'tiling': tiling,
+        'zones': zones,
+        'lines': lines
+    }
+
+    if concurrent_videos <= 1:
+        return [
+            process_video(video_path, detector, roi_coords, target_classes, **run_kwargs)
+            for video_path in video_paths
+        ]
+
+    batcher = MicroBatcher(detector, batch_size, max_wait, detect_skip_frames)
+    batcher.start()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrent_videos) as executor:
+            futures = [
+                executor.submit(process_video, video_path, detector, roi_coords, target_classes,
+                                batcher=batcher, source_id=source_id, **run_kwargs)
+                for source_id, video_path in enumerate(video_paths)
+            ]
+            return [future.result() for future in futures]
+    finally:
+        batcher.stop()
+
+
+def _flatten_counts(result):
+    """{'roi<id>/<class>': số xe, 'line<id>/<in|out>/<class>': số lượt} của một kết quả process_video"""
+    counts = {}
+    for roi_id, roi_result in result['rois'].items():
+        for cls_name, count in roi_result['counts'].items():
+            counts[f"roi{roi_id}/{cls_name}"] = count
+    for line_id, line_result in result.get('lines', {}).items():
+        for direction in DIRECTIONS:
+            for cls_name, count in line_result[direction].items():
+                counts[f"line{line_id}/{direction}/{cls_name}"] = count
+    return counts
+
+
+def skip_report(video_paths, detector, roi_coords, target_classes, skips=(1, 2, 4, 8), **run_kwargs):
+    """
+    Đo độ chính xác đếm xe khi tăng skip frames trên các video tham chiếu
+
+    Mỗi video được chạy lại với từng giá trị skip; kết quả với skip nhỏ nhất
+    được dùng làm chuẩn để tính sai số số xe theo ROI và loại phương tiện.
+
+    Returns:
+        Danh sách báo cáo mỗi video: fps, tổng số xe, sai số tuyệt đối/tương đối mỗi skip
+    """
+    skips = sorted(set(skips))
+    report = []
+    for video_path in video_paths:
+        runs = [
+            process_video(video_path, detector, roi_coords, target_classes,
+                          detect_skip_frames=skip, **run_kwargs)
+            for skip in skips
+        ]
+        reference = _flatten_counts(runs[0])
+        reference_total = sum(reference.values())
+
+        entries = []
+        for skip, result in zip(skips, runs):
+            counts = _flatten_counts(result)
+            keys = set(reference) | set(counts)
+            abs_error = sum(abs(counts.get(key, 0) - reference.get(key, 0)) for key in keys)
+            entries.append({
+                'skip': skip,
+                'fps': result['fps'],
+                'elapsed': result['elapsed'],
+                'total': sum(counts.values()),
+                'abs_error': abs_error,
+                'relative_error': round(abs_error / reference_total, 4) if reference_total else 0.0,
+                'counts': counts
+            })
+        report.append({'video': video_path, 'reference_skip': skips[0], 'runs': entries})
+    return report
+
+
+def merge_results(results):
+    """
+    Gộp counts theo ROI của nhiều video thành một báo cáo
+
+    Returns:
+        {'videos': số video, 'frames': tổng frame,
+         'rois': {roi_id: {'coords', 'normalized', 'counts', 'entries', 'exits'}},
+         'lines': {line_id: {'coords', 'normalized', 'in', 'out', 'total'}} (nếu có vạch đếm)}
+        coords là pixel của video đầu tiên; normalized không phụ thuộc độ phân giải
+    """
+    merged = {'videos': len(results), 'frames': 0, 'rois': {}}
+    for result in results:
+        merged['frames'] += result['frames']
+        for roi_id, roi_result in result['rois'].items():
+            roi_merged = merged['rois'].setdefault(
+                roi_id, {'coords': roi_result['coords'], 'normalized': roi_result.get('normalized'),
+                         'counts': {}, 'entries': 0, 'exits': 0}
+            )
+            roi_merged['entries'] += roi_result.get('entries', 0)
+            roi_merged['exits'] += roi_result.get('exits', 0)
+            for cls_name, count in roi_result['counts'].items():
+                roi_merged['counts'][cls_name] = roi_merged['counts'].get(cls_name, 0) + count
+        for line_id, line_result in result.get('lines', {}).items():
+            line_merged = merged.setdefault('lines', {}).setdefault(
+                line_id, {'coords': line_result['coords'], 'normalized': line_result['normalized'],
+                          'in': {}, 'out': {}, 'total': 0}
+            )
+            line_merged['total'] += line_result['total']
+            for direction in DIRECTIONS:
+                for cls_name, count in line_result[direction].items():
+                    line_merged[direction][cls_name] = line_merged[direction].get(cls_name, 0) + count
+    return merged
+
+
+def write_results(results, output_path, failures=None):
+    """Ghi kết quả ra file JSON (hoặc stdout nếu output_path là '-')"""
+    report = {
+        'summary': merge_results(results),
+        'videos': results,
+        'failures': failures or []
+    }
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if output_path == "-":
+        print(data)
+        return
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(data)
+
+
+def parse_roi(value):
+    """Chuyển 'x1,y1,x2,y2' thành tuple: int (pixel) hoặc float nếu có dấu chấm (chuẩn hóa 0-1)"""
+    number = float if "." in value else int
+    try:
+        x1, y1, x2, y2 = (number(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ROI must be x1,y1,x2,y2: {value}")
+    if x1 >= x2 or y1 >= y2 or (number is float and not is_normalized((x1, y1, x2, y2))):
+        raise argparse.ArgumentTypeError(f"Invalid ROI: {value}")
+    return (x1, y1, x2, y2)
+
+
+def _parse_numbers(value, kind):
+    """Các số trong 'a,b,c,...': int (pixel) hoặc float nếu có dấu chấm (chuẩn hóa 0-1)"""
+    number = float if "." in value else int
+    try:
+        values = [number(v) for v in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid {kind}: {value}")
+    if number is float and not is_normalized(values):
+        raise argparse.ArgumentTypeError(f"Normalized {kind} values must be in [0, 1]: {value}")
+    return values
+
+
+def parse_zone(value):
+    """Chuyển 'x1,y1,x2,y2,x3,y3,...' (>= 3 đỉnh) thành [(x, y), ...]"""
+    values = _parse_numbers(value, "zone")
+    if len(values) < 6 or len(values) % 2:
+        raise argparse.ArgumentTypeError(f"Zone must be x1,y1,x2,y2,x3,y3[,...]: {value}")
+    return list(zip(values[::2], values[1::2]))
+
+
+def parse_line(value):
+    """Chuyển 'x1,y1,x2,y2' thành vạch đếm (x1, y1) -> (x2, y2)"""
+    values = _parse_numbers(value, "line")
+    if len(values) != 4 or values[:2] == values[2:]:
+        raise argparse.ArgumentTypeError(f"Line must be x1,y1,x2,y2 with two distinct points: {value}")
+    return tuple(values)
+
+
+def parse_size(value):
+    """Chuyển 'WxH' thành tuple, 'N' thành cạnh dài N, 'native' thành None"""
+    if value.lower() == "native":
+        return None
+    try:
+        if "x" not in value.lower():
+            return int(value)
+        width, height = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Size must be WIDTHxHEIGHT, LONG_SIDE or native: {value}")
+    return (width, height)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Đếm phương tiện hàng loạt không cần giao diện")
+    parser.add_argument("videos", nargs="+", help="Các file video cần xử lý")
+    parser.add_argument("--roi", type=parse_roi, action="append",
+                        help="ROI dạng x1,y1,x2,y2 theo pixel của frame làm việc, hoặc 0-1 "
+                             "(ví dụ 0.0,0.2,0.66,0.77) theo kích thước frame "
+                             "(có thể lặp lại, mặc định 0,100,600,400)")
+    parser.add_argument("--zone", type=parse_zone, action="append",
+                        help="Zone đa giác x1,y1,x2,y2,x3,y3,... (pixel hoặc chuẩn hóa 0-1), "
+                             "được đếm như ROI (có thể lặp lại)")
+    parser.add_argument("--line", type=parse_line, action="append",
+                        help="Vạch đếm theo hướng x1,y1,x2,y2 (pixel hoặc chuẩn hóa 0-1); 'in' là "
+                             "đi sang bên phải của hướng (x1,y1)->(x2,y2) (có thể lặp lại)")
+    parser.add_argument("--classes", default=",".join(DEFAULT_CLASSES),
+                        help="Loại phương tiện, phân cách bằng dấu phẩy")
+    parser.add_argument("--model", default="yolov8s.pt",
+                        help="Model YOLO (.pt, .onnx, .torchscript, *_openvino_model/)")
+    parser.add_argument("--backend", default="auto", choices=BACKENDS,
+                        help="Backend inference ('auto' = theo đuôi file model)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Số thread inference (mặc định của runtime)")
+    parser.add_argument("--class-file", default="coco.txt", help="File danh sách class")
+    parser.add_argument("--conf", type=int, default=40, help="Ngưỡng confidence (%%)")
+    parser.add_argument("--imgsz", type=int, default=416, help="Kích thước ảnh khi detect")
+    parser.add_argument("--skip", type=int, default=2, help="Số frames bỏ qua giữa các lần detect")
+    parser.add_argument("--frame-size", type=parse_size, default=DEFAULT_LONG_SIDE,
+                        help="Kích thước frame làm việc: cạnh dài (giữ tỉ lệ video, mặc định "
+                             f"{DEFAULT_LONG_SIDE}), WIDTHxHEIGHT cố định hoặc native (không resize)")
+    parser.add_argument("--save-dir", default=None, help="Thư mục lưu ảnh vehicles, mỗi video một thư mục con (mặc định không lưu)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Số frame mỗi lần predict (1 = không gom batch)")
+    parser.add_argument("--max-wait", type=float, default=0.02,
+                        help="Thời gian tối đa (giây) chờ gom đủ batch")
+    parser.add_argument("--concurrent-videos", type=int, default=1,
+                        help="Số video chạy đồng thời trong một tiến trình, dùng chung batch")
+    parser.add_argument("--tracker", default="centroid", choices=sorted(TRACKERS),
+                        help="Loại tracker: centroid hoặc motion (Kalman, dự đoán vị trí khi skip)")
+    parser.add_argument("--low-conf", type=float, default=None,
+                        help="Ngưỡng confidence thấp (0-1) để giữ track với tracker motion")
+    parser.add_argument("--roi-detect", action="store_true",
+                        help="Chỉ detect phần ảnh quanh các ROI (imgsz thu nhỏ theo tỉ lệ)")
+    parser.add_argument("--tiles", action="store_true",
+                        help="Detect các tile chồng nhau quanh ROI trên frame gốc (xe nhỏ ở xa)")
+    parser.add_argument("--tile-size", type=int, default=640,
+                        help="Cạnh tile (pixel của frame gốc) cho --tiles")
+    parser.add_argument("--tile-overlap", type=float, default=0.2,
+                        help="Tỉ lệ chồng lấn giữa các tile cho --tiles")
+    parser.add_argument("--no-global-pass", action="store_true",
+                        help="Không detect thêm cả frame làm việc khi dùng --tiles (xe lớn bị cắt)")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Bỏ qua YOLO khi các ROI đứng yên (frame differencing)")
+    parser.add_argument("--motion-method", default="diff", choices=["diff", "mog2"],
+                        help="Cách phát hiện chuyển động của motion gate")
+    parser.add_argument("--motion-threshold", type=int, default=25,
+                        help="Độ chênh mức xám tối thiểu để coi pixel là thay đổi")
+    parser.add_argument("--motion-area", type=float, default=0.005,
+                        help="Tỉ lệ pixel thay đổi tối thiểu trong ROI để coi là có chuyển động")
+    parser.add_argument("--motion-refresh", type=int, default=150,
+                        help="Vẫn detect sau chừng này frame đứng yên")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Tự chỉnh skip frames/imgsz để theo kịp FPS của video")
+    parser.add_argument("--skip-range", default="1,8",
+                        help="Khoảng skip frames MIN,MAX cho --adaptive")
+    parser.add_argument("--imgsz-levels", default="256,320,416,512",
+                        help="Các mức imgsz cho --adaptive")
+    parser.add_argument("--decoder", default="auto", choices=["auto", "pyav", "opencv"],
+                        help="Cách decode video (auto = PyAV nếu đã cài)")
+    parser.add_argument("--detection-cache", default=None,
+                        help="Thư mục cache kết quả detect thô; chạy lại cùng video với ROI, "
+                             "loại xe hoặc ngưỡng khác không cần detect lại")
+    parser.add_argument("--cache-size", type=int, default=512,
+                        help="Dung lượng tối đa của cache detect (MB)")
+    parser.add_argument("--cache-floor", type=float, default=0.05,
+                        help="Confidence thấp nhất (0-1) được lưu trong cache detect")
+    parser.add_argument("--evict-after", type=float, default=None,
+                        help="Bỏ record xe khỏi bộ nhớ sau chừng này giây không xuất hiện (chạy dài)")
+    parser.add_argument("--records-out", default=None,
+                        help="File JSON Lines lưu record của mọi xe (kể cả xe đã bỏ khỏi bộ nhớ)")
+    parser.add_argument("--event-db", default=None,
+                        help="File SQLite lưu xe, sự kiện vào/ra và số xe theo khung 5 phút "
+                             "(truy vấn bằng python event_store.py)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Cổng HTTP cục bộ xuất /metrics (Prometheus) và /profile")
+    parser.add_argument("--metrics-log", type=float, default=None,
+                        help="Ghi số liệu ra stderr mỗi chừng này giây (một dòng JSON)")
+    parser.add_argument("--profile-signal", action="store_true",
+                        help="Lấy mẫu stack 10 giây khi nhận SIGUSR1 (kill -USR1 <pid>)")
+    parser.add_argument("--skip-report", default=None,
+                        help="Chỉ đo sai số đếm xe theo skip frames, ví dụ 1,2,4,8")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Số tiến trình xử lý song song (mỗi tiến trình load model riêng)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Số thread tính toán mỗi tiến trình (mặc định chia đều CPU)")
+    parser.add_argument("--journal", default=None,
+                        help="File journal JSON Lines để chạy tiếp sau khi bị crash")
+    parser.add_argument("-o", "--output", default="-", help="File JSON kết quả ('-' = stdout)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.adaptive and (args.batch_size > 1 or args.concurrent_videos > 1):
+        parser.error("--adaptive requires --batch-size 1 and --concurrent-videos 1")
+    use_metrics = args.metrics_port is not None or args.metrics_log is not None
+    if use_metrics and (args.workers > 1 or args.journal):
+        parser.error("--metrics-port/--metrics-log require --workers 1 without --journal")
+    # ROI mặc định chỉ khi không có ROI, zone hay vạch đếm nào
+    roi_coords = args.roi or ([] if args.zone or args.line else [(0, 100, 600, 400)])
+    target_classes = [c.strip() for c in args.classes.split(",") if c.strip()]
+
+    detector_kwargs = {
+        'model_path': args.model,
+        'class_file': args.class_file,
+        'confidence_threshold': args.conf,
+        'detect_imgsz': args.imgsz,
+        'backend': args.backend
+    }
+    if args.threads:
+        detector_kwargs['num_threads'] = args.threads
+    if args.low_conf is not None:
+        detector_kwargs['low_confidence'] = args.low_conf
+    run_kwargs = {
+        'roi_coords': roi_coords,
+        'zones': args.zone,
+        'lines': args.line,
+        'target_classes': target_classes,
+        'detect_skip_frames': args.skip,
+        'frame_size': args.frame_size,
+        'save_dir': args.save_dir,
+        'batch_size': args.batch_size,
+        'max_wait': args.max_wait,
+        'tracker_type': args.tracker,
+        'roi_detect': args.roi_detect,
+        'tiling': {
+            'tile_size': args.tile_size,
+            'overlap': args.tile_overlap,
+            'global_pass': not args.no_global_pass
+        } if args.tiles else None,
+        'motion_gate': {
+            'method': args.motion_method,
+            'diff_threshold': args.motion_threshold,
+            'min_area': args.motion_area,
+            'refresh_interval': args.motion_refresh
+        } if args.motion_gate else None,
+        'adaptive': {
+            'skip_range': tuple(int(v) for v in args.skip_range.split(",")),
+            'imgsz_levels': tuple(int(v) for v in args.imgsz_levels.split(","))
+        } if args.adaptive else None,
+        'decoder': args.decoder,
+        'detection_cache': {
+            'cache_dir': args.detection_cache,
+            'max_bytes': args.cache_size << 20,
+            'floor': args.cache_floor
+        } if args.detection_cache else None,
+        'evict_after': args.evict_after,
+        'records_out': args.records_out,
+        'event_db': args.event_db
+    }
+
+    if args.skip_report:
+        skips = [int(v) for v in args.skip_report.split(",")]
+        run_kwargs.pop('detect_skip_frames')
+        detector = VehicleDetector(**detector_kwargs)
+        report = skip_report(args.videos, detector, skips=skips, **run_kwargs)
+        data = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.output == "-":
+            print(data)
+        else:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(data)
+        return 0
+
+    if args.profile_signal:
+        install_profile_signal()
+
+    if args.workers > 1 or args.journal:
+        results, failures = run_parallel(
+            args.videos, detector_kwargs, run_kwargs,
+            workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+            journal_path=args.journal
+        )
+    else:
+        metrics = MetricsRegistry() if use_metrics else None
+        server = MetricsServer(metrics, args.metrics_port) if args.metrics_port is not None else None
+        metrics_log = MetricsLogger(metrics, args.metrics_log) if args.metrics_log else None
+        try:
+            results = run_batch(args.videos, **run_kwargs, **detector_kwargs,
+                                concurrent_videos=args.concurrent_videos, metrics=metrics)
+        finally:
+            if metrics_log:
+                metrics_log.close()
+            if server:
+                server.close()
+        failures = []
+
+    write_results(results, args.output, failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+
+from detections import Detections
+
+
+class DetectionRequest:
+    """Yêu cầu detect một frame, kết quả có sau khi batch chứa nó chạy xong"""
+
+    __slots__ = ('source_id', 'frame_idx', 'frame', 'target_classes',
+                 'regions', 'cache', 'depends_on', 'result', 'error', '_event')
+
+    def __init__(self, source_id, frame_idx, frame=None, target_classes=None, depends_on=None,
+                 regions=None, cache=None):
+        self.source_id = source_id
+        self.frame_idx = frame_idx
+        self.frame = frame
+        self.target_classes = target_classes
+        self.regions = regions
+        self.cache = cache
+        # Frame bị skip dùng lại kết quả của lần detect gần nhất của cùng nguồn
+        self.depends_on = depends_on
+        self.result = Detections.empty()
+        self.error = None
+        self._event = threading.Event()
+        if frame is None:
+            self._event.set()
+
+    def done(self, result=None, error=None):
+        self.result = result if result is not None else Detections.empty()
+        self.error = error
+        self.frame = None
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """Chờ và trả về kết quả detect của frame"""
+        if self.depends_on is not None:
+            return self.depends_on.wait(timeout)
+        if not self._event.wait(timeout):
+            raise TimeoutError(f"Detection timed out for source {self.source_id} frame {self.frame_idx}")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class MicroBatcher:
+    """
+    Gom frame từ một hoặc nhiều nguồn thành micro-batch và chạy một lần predict.
+
+    Mỗi nguồn (source_id) có trạng thái skip frames riêng; frame bị skip không
+    vào batch mà dùng lại kết quả của lần detect gần nhất của nguồn đó.
+    """
+
+    def __init__(self, detector, batch_size=4, max_wait=0.02, detect_skip_frames=2):
+        """
+        Args:
+            detector: VehicleDetector
+            batch_size: Số frame tối đa trong một batch
+            max_wait: Thời gian tối đa (giây) chờ gom đủ batch
+            detect_skip_frames: Số frames bỏ qua giữa các lần detect của mỗi nguồn
+        """
+        self.detector = detector
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.detect_skip_frames = detect_skip_frames
+
+        self.requests = queue.Queue()
+        self.sources = {}
+        self.sources_lock = threading.Lock()
+
+        self.batches = 0
+        self.batched_frames = 0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def average_batch_size(self):
+        return self.batched_frames / self.batches if self.batches else 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def reset_source(self, source_id):
+        """Xóa trạng thái skip frames của một nguồn (khi mở video mới/seek)"""
+        with self.sources_lock:
+            self.sources.pop(source_id, None)
+
+    def submit(self, source_id, frame, target_classes, frame_idx, force=False, regions=None, cache=None):
+        """
+        Gửi frame để detect, không chờ kết quả
+        
+        Args:
+            regions: RegionPlan chỉ detect trong các vùng ROI (None = cả frame)
+            cache: detection_cache.VideoDetections của nguồn (None = không cache)
+
+        Returns:
+            DetectionRequest, gọi .wait() để lấy kết quả
+        """
+        with self.sources_lock:
+            last_request = self.sources.get(source_id)
+            if (not force and last_request is not None
+                    and (frame_idx - last_request.frame_idx) < self.detect_skip_frames):
+                return DetectionRequest(source_id, frame_idx, depends_on=last_request)
+
+            if not target_classes:
+                request = DetectionRequest(source_id, frame_idx)
+            else:
+                request = DetectionRequest(source_id, frame_idx, frame, list(target_classes),
+                                           regions=regions, cache=cache)
+                self.requests.put(request)
+            self.sources[source_id] = request
+            return request
+
+    def reuse(self, source_id, frame_idx):
+        """
+        Dùng lại kết quả detect gần nhất của nguồn cho frame_idx (không detect)
+        
+        Returns:
+            DetectionRequest phụ thuộc request gần nhất, hoặc None nếu nguồn chưa detect lần nào
+        """
+        with self.sources_lock:
+            last_request = self.sources.get(source_id)
+        if last_request is None:
+            return None
+        return DetectionRequest(source_id, frame_idx, depends_on=last_request)
+    
+    def detect(self, source_id, frame, target_classes, frame_idx, force=False, regions=None, cache=None):
+        """Detect một frame và chờ kết quả (có thể gọi từ nhiều thread)"""
+        return self.submit(source_id, frame, target_classes, frame_idx, force, regions, cache).wait()
+
+    def _collect_batch(self):
+        """Lấy request đầu tiên rồi gom thêm cho đến khi đủ batch hoặc hết max_wait"""
+        try:
+            batch = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            try:
+                results = self.detector.detect_batch(
+                    [request.frame for request in batch],
+                    [request.target_classes for request in batch],
+                    [request.regions for request in batch],
+                    [request.cache for request in batch],
+                    [request.frame_idx for request in batch]
+                )
+            except Exception as e:
+                for request in batch:
+                    request.done(error=e)
+                continue
+
+            self.batches += 1
+            self.batched_frames += len(batch)
+            for request, result in zip(batch, results):
+                request.done(result)
+
+        # Giải phóng các request còn đang chờ khi dừng
+        while True:
+            try:
+                self.requests.get_nowait().done()
+            except queue.Empty:
+                break
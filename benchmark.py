@@ -0,0 +1,611 @@
+"""
+Benchmark tốc độ và độ chính xác đếm xe của pipeline, đo từng stage riêng.
+
+Các stage được chạy tuần tự trên một thread để thời gian của stage này không
+lẫn với stage khác (không có hàng đợi, giữ nhịp hay vẽ GUI):
+
+- decode: cv2.VideoCapture.read() ở độ phân giải gốc
+- resize: thu nhỏ về kích thước làm việc
+- preprocess / inference / postprocess: letterbox, chạy model, giải mã + NMS +
+  lọc class (backend ultralytics tự letterbox và NMS trong inference)
+- tracking: tracker, ROI và record xe (VehicleProcessor.process_rois)
+- annotate: vẽ ROI và xe lên frame
+- snapshot: encode và ghi từng ảnh xe (thread của SnapshotWriter)
+
+Mỗi stage có p50/p95/p99, trung bình, lớn nhất và throughput; cả lượt chạy có
+FPS, RSS lớn nhất và sai số đếm xe so với file ground truth. Kết quả ghi ra
+JSON kèm commit, phiên bản thư viện và cấu hình để so sánh giữa các lần chạy.
+
+Ví dụ:
+    python benchmark.py data/input/clip.mp4 --ground-truth gt.json -o bench.json
+    python benchmark.py --synthetic 2 --frames 300 -o bench.json
+    python benchmark.py --compare bench_old.json bench.json
+    python benchmark.py clip_4k.mp4 --tile-report 512,640,960 --frames 200
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from coords import DEFAULT_LONG_SIDE, is_normalized, scale_distance, to_pixels, working_size
+from batch import DEFAULT_CLASSES, parse_roi, parse_size, process_video, _flatten_counts
+from backends import BACKENDS, match_boxes
+from detector import VehicleDetector
+from pipeline import draw_roi_overlay
+from roi_manager import ROIManager, TRACKERS
+from snapshot_writer import SnapshotWriter
+from sysinfo import process_rss
+from vehicle_processor import VehicleProcessor
+
+
+STAGES = ('decode', 'resize', 'preprocess', 'inference', 'postprocess', 'tracking', 'annotate', 'snapshot')
+
+
+def latency_stats(samples):
+    """p50/p95/p99, trung bình, lớn nhất (ms) và throughput (lần/giây) của các mẫu (giây)"""
+    if len(samples) == 0:
+        return {'count': 0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    mean = float(ms.mean())
+    return {
+        'count': len(ms),
+        'mean_ms': round(mean, 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(ms.max()), 3),
+        'throughput': round(1000 / mean, 2) if mean > 0 else None
+    }
+
+
+class StageTimer:
+    """Gom thời gian từng lần chạy của mỗi stage, bỏ các frame warmup"""
+
+    def __init__(self, warmup=0):
+        self.warmup = warmup
+        self.samples = {stage: [] for stage in STAGES}
+        self.frame_samples = []
+
+    def add(self, stage, seconds, frame_idx):
+        if frame_idx > self.warmup:
+            self.samples[stage].append(seconds)
+
+    def add_frame(self, seconds, frame_idx):
+        """Tổng thời gian các stage của một frame"""
+        if frame_idx > self.warmup:
+            self.frame_samples.append(seconds)
+
+    def stats(self):
+        stats = {stage: latency_stats(samples) for stage, samples in self.samples.items() if samples}
+        stats['frame'] = latency_stats(self.frame_samples)
+        return stats
+
+
+def make_synthetic_clip(path, frames=300, size=(1280, 720), fps=25, vehicles=12, seed=0):
+    """
+    Tạo video tổng hợp có thể tái lập (cùng seed = cùng nội dung)
+
+    Nền có nhiễu và các hình chữ nhật chuyển động qua khung hình. Không phải
+    xe thật nên chỉ dùng đo tốc độ, không dùng đo độ chính xác.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = rng.integers(60, 110, (height, width, 3), dtype=np.uint8)
+    cv2.rectangle(background, (0, height // 3), (width, 2 * height // 3), (80, 80, 80), -1)
+
+    starts = rng.integers(0, frames, vehicles)
+    lanes = rng.integers(height // 3, 2 * height // 3 - 60, vehicles)
+    speeds = rng.uniform(4, 14, vehicles) * rng.choice([-1, 1], vehicles)
+    sizes = rng.integers(50, 160, (vehicles, 2))
+    colors = rng.integers(0, 255, (vehicles, 3))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        raise IOError(f"Cannot write video: {path}")
+    try:
+        for frame_idx in range(frames):
+            frame = background.copy()
+            for i in range(vehicles):
+                age = (frame_idx - starts[i]) % frames
+                x = int(age * speeds[i]) % (width + sizes[i][0]) - sizes[i][0]
+                if speeds[i] < 0:
+                    x = width - x - sizes[i][0]
+                y = int(lanes[i])
+                cv2.rectangle(frame, (x, y), (x + int(sizes[i][0]), y + int(sizes[i][1]) // 2),
+                              tuple(int(c) for c in colors[i]), -1)
+            noise = rng.integers(0, 12, (height, width, 3), dtype=np.uint8)
+            writer.write(cv2.add(frame, noise))
+    finally:
+        writer.release()
+    return path
+
+
+def _detect(detector, frame, target_classes, timer, frame_idx):
+    """Detect một frame, đo riêng preprocess/inference/postprocess"""
+    backend = detector.backend
+    conf = detector.confidence_threshold / 100.0
+    floor = conf if detector.low_confidence is None else min(conf, detector.low_confidence)
+
+    if hasattr(backend, 'preprocess'):
+        start = time.perf_counter()
+        blob, transforms = backend.preprocess([frame], detector.detect_imgsz)
+        timer.add('preprocess', time.perf_counter() - start, frame_idx)
+        start = time.perf_counter()
+        outputs = backend.infer(blob)
+        timer.add('inference', time.perf_counter() - start, frame_idx)
+        start = time.perf_counter()
+        raw = backend.postprocess(outputs, [frame], transforms, floor)[0]
+    else:
+        start = time.perf_counter()
+        raw = backend.predict([frame], detector.detect_imgsz, floor)[0]
+        timer.add('inference', time.perf_counter() - start, frame_idx)
+        start = time.perf_counter()
+    vehicle_boxes = detector._filter_boxes(raw, target_classes, floor)
+    vehicle_boxes.high_threshold = conf
+    timer.add('postprocess', time.perf_counter() - start, frame_idx)
+    return vehicle_boxes
+
+
+def run_stages(video_path, detector, roi_coords, target_classes, detect_skip_frames=2,
+               frame_size=DEFAULT_LONG_SIDE, tracker_type='centroid', save_dir=None,
+               max_frames=None, warmup=10):
+    """
+    Chạy từng stage tuần tự trên một video và đo thời gian
+
+    Args:
+        video_path: Đường dẫn video
+        detector: VehicleDetector đã khởi tạo
+        roi_coords: Danh sách ROI [(x1, y1, x2, y2), ...] (pixel hoặc chuẩn hóa 0-1)
+        target_classes: Danh sách loại phương tiện cần đếm
+        detect_skip_frames: Số frames bỏ qua giữa các lần detect
+        frame_size: Kích thước frame làm việc (xem coords.working_size)
+        tracker_type: Loại tracker (xem roi_manager.TRACKERS)
+        save_dir: Thư mục ghi ảnh xe (None = không đo stage snapshot)
+        max_frames: Số frame tối đa (None = cả video)
+        warmup: Số frame đầu không tính vào thống kê
+
+    Returns:
+        Dictionary: số frame, FPS, RSS lớn nhất, thời gian từng stage, counts theo ROI
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+    native_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    frame_size = working_size(native_size, frame_size)
+
+    roi_manager = ROIManager(tracker_type=tracker_type, frame_size=frame_size)
+    for coords in roi_coords:
+        if is_normalized(coords):
+            roi_manager.add_roi_normalized(*coords)
+        else:
+            roi_manager.add_roi(*coords)
+    snapshot_writer = SnapshotWriter(save_dir, block=True) if save_dir else None
+    vehicle_processor = VehicleProcessor(save_dir=save_dir, snapshot_writer=snapshot_writer)
+    detector.reset_cache()
+
+    timer = StageTimer(warmup)
+    peak_rss = process_rss() or 0
+    frame_idx = 0
+    last_detect = None
+    vehicle_boxes = None
+    start_time = time.perf_counter()
+    try:
+        while max_frames is None or frame_idx < max_frames:
+            frame_start = start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_idx += 1
+            timer.add('decode', time.perf_counter() - start, frame_idx)
+
+            if (frame.shape[1], frame.shape[0]) != frame_size:
+                start = time.perf_counter()
+                frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
+                timer.add('resize', time.perf_counter() - start, frame_idx)
+
+            fresh = last_detect is None or frame_idx - last_detect >= detect_skip_frames
+            if fresh:
+                vehicle_boxes = _detect(detector, frame, target_classes, timer, frame_idx)
+                last_detect = frame_idx
+
+            start = time.perf_counter()
+            vehicle_processor.process_rois(frame, vehicle_boxes, roi_manager, frame_idx,
+                                           draw=False, fresh=fresh)
+            timer.add('tracking', time.perf_counter() - start, frame_idx)
+
+            start = time.perf_counter()
+            draw_roi_overlay(frame, roi_manager.get_all_rois())
+            vehicle_processor.draw_tracks(frame)
+            timer.add('annotate', time.perf_counter() - start, frame_idx)
+
+            timer.add_frame(time.perf_counter() - frame_start, frame_idx)
+            rss = process_rss()
+            if rss and rss > peak_rss:
+                peak_rss = rss
+    finally:
+        cap.release()
+        vehicle_processor.close()
+    elapsed = time.perf_counter() - start_time
+
+    if snapshot_writer:
+        timer.samples['snapshot'] = list(snapshot_writer.write_samples)
+    counted = max(0, frame_idx - warmup)
+    measured = sum(timer.frame_samples)
+    summary = vehicle_processor.get_roi_summary()
+    return {
+        'frames': frame_idx,
+        'frame_size': list(frame_size),
+        'measured_frames': counted,
+        'elapsed': round(elapsed, 3),
+        'fps': round(counted / measured, 2) if measured > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss / (1 << 20), 1) if peak_rss else None,
+        'stages': timer.stats(),
+        'counts': _flatten_counts({'rois': {
+            str(roi_id): {'counts': roi_summary['counts']} for roi_id, roi_summary in summary.items()
+        }})
+    }
+
+
+def count_accuracy(counts, expected):
+    """
+    Sai số đếm xe so với ground truth {'roi<id>/<class>': số xe}
+
+    Returns:
+        {'expected', 'counted', 'abs_error', 'relative_error', 'errors': {key: counted - expected}}
+    """
+    keys = sorted(set(counts) | set(expected))
+    errors = {key: counts.get(key, 0) - expected.get(key, 0) for key in keys}
+    abs_error = sum(abs(error) for error in errors.values())
+    total = sum(expected.values())
+    return {
+        'expected': total,
+        'counted': sum(counts.values()),
+        'abs_error': abs_error,
+        'relative_error': round(abs_error / total, 4) if total else None,
+        'errors': {key: error for key, error in errors.items() if error}
+    }
+
+
+def load_ground_truth(path):
+    """
+    Đọc file ground truth JSON, dạng:
+        {"clip.mp4": {"rois": [[x1, y1, x2, y2], ...], "counts": {"roi1/car": 12, ...}}}
+
+    Khóa là đường dẫn hoặc tên file của video; "rois" là tùy chọn (mặc định
+    dùng --roi) và được đánh số từ 1 theo thứ tự.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _truth_for(ground_truth, video_path):
+    if not ground_truth:
+        return None
+    return ground_truth.get(video_path) or ground_truth.get(os.path.basename(video_path))
+
+
+def environment(detector):
+    """Phiên bản code, thư viện và phần cứng để so sánh giữa các lần chạy"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+        'numpy': np.__version__,
+        'backend': detector.backend.name,
+        'model': detector.model_path
+    }
+
+
+def run_benchmark(video_paths, detector, roi_coords, target_classes, ground_truth=None,
+                  pipeline=False, **kwargs):
+    """
+    Benchmark nhiều video
+
+    Args:
+        video_paths: Danh sách video
+        detector: VehicleDetector đã khởi tạo
+        roi_coords: ROI mặc định (ground truth có thể ghi đè theo video)
+        target_classes: Danh sách loại phương tiện cần đếm
+        ground_truth: Kết quả load_ground_truth() (None = không đo độ chính xác)
+        pipeline: Chạy thêm FramePipeline nhiều thread (batch.process_video) để đo FPS thực tế
+        kwargs: Tham số của run_stages
+
+    Returns:
+        Danh sách kết quả mỗi video
+    """
+    results = []
+    for video_path in video_paths:
+        truth = _truth_for(ground_truth, video_path)
+        rois = [tuple(coords) for coords in truth['rois']] if truth and truth.get('rois') else roi_coords
+        print(f"Benchmarking {video_path}", file=sys.stderr)
+        result = {'video': video_path}
+        result.update(run_stages(video_path, detector, rois, target_classes, **kwargs))
+        if truth:
+            result['accuracy'] = count_accuracy(result['counts'], truth['counts'])
+
+        if pipeline:
+            run = process_video(video_path, detector, rois, target_classes,
+                                detect_skip_frames=kwargs.get('detect_skip_frames', 2),
+                                frame_size=kwargs.get('frame_size', DEFAULT_LONG_SIDE),
+                                tracker_type=kwargs.get('tracker_type', 'centroid'),
+                                decoder='opencv')
+            counts = _flatten_counts(run)
+            result['pipeline'] = {'frames': run['frames'], 'elapsed': run['elapsed'],
+                                  'fps': run['fps'], 'counts': counts}
+            if truth:
+                result['pipeline']['accuracy'] = count_accuracy(counts, truth['counts'])
+        results.append(result)
+    return results
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    So sánh hai file kết quả benchmark theo từng video và stage
+
+    Returns:
+        (các dòng báo cáo, số chỉ số chậm hơn baseline quá threshold)
+    """
+    base_clips = {os.path.basename(clip['video']): clip for clip in baseline['clips']}
+    lines = [f"baseline {baseline['environment'].get('commit')} -> current {current['environment'].get('commit')}"]
+    regressions = 0
+    for clip in current['clips']:
+        name = os.path.basename(clip['video'])
+        base = base_clips.get(name)
+        if base is None:
+            lines.append(f"{name}: not in baseline")
+            continue
+        lines.append(f"{name}: fps {base['fps']} -> {clip['fps']}")
+        for stage, stats in clip['stages'].items():
+            base_stats = base['stages'].get(stage)
+            if not base_stats or not base_stats.get('count') or not stats.get('count'):
+                continue
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                before, after = base_stats[key], stats[key]
+                change = (after - before) / before if before else 0.0
+                flag = ""
+                if change > threshold:
+                    flag = "  SLOWER"
+                    regressions += 1
+                lines.append(f"  {stage:<12} {key:<7} {before:>9.3f} -> {after:>9.3f} ({change:+.1%}){flag}")
+        if 'accuracy' in clip and 'accuracy' in base:
+            lines.append(f"  abs_error {base['accuracy']['abs_error']} -> {clip['accuracy']['abs_error']}")
+    return lines, regressions
+
+
+def _as_raw(vehicle_boxes):
+    """Detections -> mảng (N, 6) [x1, y1, x2, y2, conf, cls_id] cho match_boxes"""
+    return np.column_stack([vehicle_boxes.xyxy, vehicle_boxes.conf,
+                            vehicle_boxes.cls_id]).astype(np.float32).reshape(-1, 6)
+
+
+def tile_report(video_paths, detector, roi_coords, target_classes, frame_size=DEFAULT_LONG_SIDE,
+                tile_sizes=(512, 640, 960), overlap=0.2, small_size=24, max_frames=200, warmup=5):
+    """
+    So sánh detect một lượt trên frame làm việc với detect theo tile trên frame gốc
+
+    Mốc so sánh là cấu hình tile nhỏ nhất (nhiều pixel nhất cho mỗi xe, có lượt
+    detect cả frame). Mỗi cấu hình có độ trễ detect p50/p95, số box và recall so
+    với mốc (cùng class, IoU >= 0.5), riêng recall của xe nhỏ (cạnh dài của box
+    trên frame làm việc < small_size pixel theo frame tham chiếu 900x520).
+
+    Returns:
+        Dictionary {'reference': tên cấu hình mốc, 'configs': {tên: kết quả}}
+    """
+    configs = {f"single_{detector.detect_imgsz}": None}
+    for tile_size in sorted(tile_sizes):
+        configs[f"tiles_{tile_size}"] = {'tile_size': tile_size, 'overlap': overlap}
+    reference = f"tiles_{min(tile_sizes)}"
+
+    timings = {name: [] for name in configs}
+    boxes = {name: 0 for name in configs}
+    matched = {name: 0 for name in configs}
+    matched_small = {name: 0 for name in configs}
+    tiles = {name: 0 for name in configs}
+    total = total_small = 0
+    for video_path in video_paths:
+        print(f"Tile report {video_path}", file=sys.stderr)
+        cap = cv2.VideoCapture(video_path)
+        frame_idx = 0
+        while max_frames is None or frame_idx < max_frames:
+            ret, native = cap.read()
+            if not ret:
+                break
+            frame_idx += 1
+            native_size = (native.shape[1], native.shape[0])
+            size = working_size(native_size, frame_size)
+            frame = native if size == native_size else cv2.resize(native, size, interpolation=cv2.INTER_AREA)
+            rois = [to_pixels(coords, size) if is_normalized(coords) else coords for coords in roi_coords]
+
+            results = {}
+            for name, tiling in configs.items():
+                regions = None
+                if tiling is not None:
+                    regions = detector.tile_plan(rois, native_size, size, **tiling).bind(native)
+                    tiles[name] = len(regions.rects)
+                start = time.perf_counter()
+                results[name] = _as_raw(detector.detect_batch([frame], [target_classes], [regions])[0])
+                if frame_idx > warmup:
+                    timings[name].append(time.perf_counter() - start)
+            if frame_idx <= warmup:
+                continue
+
+            truth = results[reference]
+            small = np.max(truth[:, 2:4] - truth[:, 0:2], axis=1) < scale_distance(small_size, size)
+            total += len(truth)
+            total_small += int(small.sum())
+            for name, raw in results.items():
+                hit = match_boxes(truth, raw)
+                boxes[name] += len(raw)
+                matched[name] += int(hit.sum())
+                matched_small[name] += int((hit & small).sum())
+        cap.release()
+
+    report = {}
+    for name in configs:
+        stats = latency_stats(timings[name])
+        report[name] = {
+            'tiles': tiles[name],
+            'p50_ms': stats.get('p50_ms'),
+            'p95_ms': stats.get('p95_ms'),
+            'boxes': boxes[name],
+            'recall': round(matched[name] / total, 4) if total else None,
+            'recall_small': round(matched_small[name] / total_small, 4) if total_small else None
+        }
+    return {'reference': reference, 'reference_boxes': total, 'reference_small': total_small,
+            'configs': report}
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark tốc độ từng stage và độ chính xác đếm xe")
+    parser.add_argument("videos", nargs="*", help="Các video dùng để đo")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Tạo thêm chừng này video tổng hợp (chỉ đo tốc độ)")
+    parser.add_argument("--synthetic-size", type=parse_size, default=(1280, 720),
+                        help="Độ phân giải video tổng hợp WIDTHxHEIGHT")
+    parser.add_argument("--seed", type=int, default=0, help="Seed của video tổng hợp")
+    parser.add_argument("--ground-truth", default=None, help="File JSON số xe đúng của từng video")
+    parser.add_argument("--roi", type=parse_roi, action="append",
+                        help="ROI dạng x1,y1,x2,y2 (có thể lặp lại, mặc định 0,100,600,400)")
+    parser.add_argument("--classes", default=",".join(DEFAULT_CLASSES),
+                        help="Loại phương tiện, phân cách bằng dấu phẩy")
+    parser.add_argument("--model", default="yolov8s.pt",
+                        help="Model YOLO (.pt, .onnx, .torchscript, *_openvino_model/)")
+    parser.add_argument("--backend", default="auto", choices=BACKENDS,
+                        help="Backend inference ('auto' = theo đuôi file model)")
+    parser.add_argument("--threads", type=int, default=None, help="Số thread inference")
+    parser.add_argument("--class-file", default="coco.txt", help="File danh sách class")
+    parser.add_argument("--conf", type=int, default=40, help="Ngưỡng confidence (%%)")
+    parser.add_argument("--imgsz", type=int, default=416, help="Kích thước ảnh khi detect")
+    parser.add_argument("--skip", type=int, default=2, help="Số frames bỏ qua giữa các lần detect")
+    parser.add_argument("--frame-size", type=parse_size, default=DEFAULT_LONG_SIDE,
+                        help="Kích thước frame làm việc: cạnh dài, WIDTHxHEIGHT hoặc native")
+    parser.add_argument("--tracker", default="centroid", choices=sorted(TRACKERS), help="Loại tracker")
+    parser.add_argument("--frames", type=int, default=None, help="Số frame tối đa mỗi video")
+    parser.add_argument("--warmup", type=int, default=10, help="Số frame đầu không tính vào thống kê")
+    parser.add_argument("--snapshots", action="store_true",
+                        help="Ghi ảnh xe vào thư mục tạm để đo stage snapshot")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Chạy thêm pipeline nhiều thread để đo FPS thực tế")
+    parser.add_argument("--tile-report", default=None,
+                        help="Chỉ so sánh detect một lượt với detect theo tile trên frame gốc, "
+                             "theo các cạnh tile, ví dụ 512,640,960")
+    parser.add_argument("--tile-overlap", type=float, default=0.2,
+                        help="Tỉ lệ chồng lấn giữa các tile cho --tile-report")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), default=None,
+                        help="So sánh hai file kết quả thay vì chạy benchmark")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Tỉ lệ chậm hơn tối đa khi --compare trước khi trả mã lỗi")
+    parser.add_argument("-o", "--output", default="-", help="File JSON kết quả ('-' = stdout)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, "r", encoding="utf-8") as f:
+                reports.append(json.load(f))
+        lines, regressions = compare(*reports, threshold=args.threshold)
+        print("\n".join(lines))
+        return 1 if regressions else 0
+
+    if not args.videos and not args.synthetic:
+        parser.error("no videos given (use --synthetic N to generate clips)")
+
+    detector_kwargs = {
+        'model_path': args.model,
+        'class_file': args.class_file,
+        'confidence_threshold': args.conf,
+        'detect_imgsz': args.imgsz,
+        'backend': args.backend
+    }
+    if args.threads:
+        detector_kwargs['num_threads'] = args.threads
+    detector = VehicleDetector(**detector_kwargs)
+    ground_truth = load_ground_truth(args.ground_truth) if args.ground_truth else None
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as work_dir:
+        video_paths = list(args.videos)
+        for i in range(args.synthetic):
+            path = os.path.join(work_dir, f"synthetic_{args.seed + i}.mp4")
+            video_paths.append(make_synthetic_clip(path, frames=args.frames or 300,
+                                                   size=args.synthetic_size, seed=args.seed + i))
+
+        if args.tile_report:
+            report = tile_report(
+                video_paths, detector, args.roi or [(0, 100, 600, 400)],
+                [c.strip() for c in args.classes.split(",") if c.strip()],
+                frame_size=args.frame_size, overlap=args.tile_overlap,
+                tile_sizes=[int(v) for v in args.tile_report.split(",")],
+                max_frames=args.frames or 200
+            )
+            report['environment'] = environment(detector)
+            _write_report(report, args.output)
+            return 0
+
+        config = {
+            'rois': [list(coords) for coords in args.roi or [(0, 100, 600, 400)]],
+            'classes': [c.strip() for c in args.classes.split(",") if c.strip()],
+            'conf': args.conf,
+            'imgsz': args.imgsz,
+            'skip': args.skip,
+            'frame_size': list(args.frame_size) if isinstance(args.frame_size, tuple) else args.frame_size,
+            'tracker': args.tracker,
+            'frames': args.frames,
+            'warmup': args.warmup,
+            'synthetic': args.synthetic,
+            'synthetic_size': list(args.synthetic_size),
+            'seed': args.seed,
+            'ground_truth': args.ground_truth
+        }
+        clips = run_benchmark(
+            video_paths, detector, [tuple(coords) for coords in config['rois']], config['classes'],
+            ground_truth=ground_truth, pipeline=args.pipeline,
+            detect_skip_frames=args.skip, frame_size=args.frame_size, tracker_type=args.tracker,
+            save_dir=os.path.join(work_dir, "snapshots") if args.snapshots else None,
+            max_frames=args.frames, warmup=args.warmup
+        )
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'environment': environment(detector),
+        'config': config,
+        'clips': clips
+    }
+    _write_report(report, args.output)
+    return 0
+
+
+def _write_report(report, output_path):
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if output_path == "-":
+        print(data)
+    else:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
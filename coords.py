@@ -0,0 +1,84 @@
+"""
+Không gian tọa độ của frame làm việc.
+
+Frame làm việc giữ tỉ lệ của video (cạnh dài mặc định 900 pixel), hoặc là
+chính frame gốc, nên tọa độ pixel phụ thuộc nguồn video. ROI được lưu chuẩn
+hóa theo kích thước frame (0-1) và đổi ra pixel khi biết kích thước làm việc;
+các ngưỡng tính bằng pixel (khoảng cách của tracker, lề quanh ROI) được chỉnh
+theo đường chéo của frame so với REFERENCE_SIZE, kích thước mà các giá trị
+mặc định được chọn.
+"""
+import math
+
+
+REFERENCE_SIZE = (900, 520)
+DEFAULT_LONG_SIDE = 900
+
+
+def working_size(native_size, frame_size=DEFAULT_LONG_SIDE):
+    """
+    Kích thước frame làm việc (width, height)
+
+    Args:
+        native_size: Kích thước gốc của video (width, height)
+        frame_size: (width, height) = kích thước cố định (có thể méo hình);
+            số nguyên = cạnh dài, giữ tỉ lệ của video và không phóng to;
+            None = độ phân giải gốc (không resize)
+    """
+    if frame_size is None:
+        return tuple(native_size)
+    if isinstance(frame_size, int):
+        width, height = native_size
+        scale = frame_size / max(width, height)
+        if scale >= 1:
+            return tuple(native_size)
+        # Kích thước chẵn cho các bộ chuyển màu/encoder
+        return (max(2, int(round(width * scale / 2)) * 2), max(2, int(round(height * scale / 2)) * 2))
+    return tuple(frame_size)
+
+
+def is_normalized(rect):
+    """True nếu (x1, y1, x2, y2) là tọa độ chuẩn hóa (số thực trong [0, 1])"""
+    return all(isinstance(value, float) and 0.0 <= value <= 1.0 for value in rect)
+
+
+def normalize_rect(rect, frame_size):
+    """Tọa độ pixel -> tọa độ chuẩn hóa theo kích thước frame"""
+    width, height = frame_size
+    x1, y1, x2, y2 = rect
+    return (x1 / width, y1 / height, x2 / width, y2 / height)
+
+
+def to_pixels(rect, frame_size):
+    """Tọa độ chuẩn hóa -> tọa độ pixel (int, nằm trong frame)"""
+    width, height = frame_size
+    x1, y1, x2, y2 = rect
+    return (
+        min(max(int(round(x1 * width)), 0), width),
+        min(max(int(round(y1 * height)), 0), height),
+        min(max(int(round(x2 * width)), 0), width),
+        min(max(int(round(y2 * height)), 0), height)
+    )
+
+
+def normalize_points(points, frame_size):
+    """[(x, y), ...] pixel -> tọa độ chuẩn hóa theo kích thước frame"""
+    width, height = frame_size
+    return [(x / width, y / height) for x, y in points]
+
+
+def points_to_pixels(points, frame_size):
+    """[(x, y), ...] chuẩn hóa -> pixel (int, nằm trong frame)"""
+    width, height = frame_size
+    return [(min(max(int(round(x * width)), 0), width), min(max(int(round(y * height)), 0), height))
+            for x, y in points]
+
+
+def distance_scale(frame_size, reference=REFERENCE_SIZE):
+    """Tỉ lệ đường chéo của frame so với frame tham chiếu"""
+    return math.hypot(*frame_size) / math.hypot(*reference)
+
+
+def scale_distance(value, frame_size, reference=REFERENCE_SIZE):
+    """Ngưỡng pixel chọn theo frame tham chiếu, đổi sang frame_size"""
+    return max(1, int(round(value * distance_scale(frame_size, reference))))
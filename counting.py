@@ -0,0 +1,193 @@
+"""
+Đếm xe qua vạch đếm (count line) theo hướng.
+
+Mỗi track giữ vị trí tâm ở lần cập nhật trước; đoạn di chuyển từ vị trí trước
+tới vị trí hiện tại chỉ được kiểm tra với các vạch đi qua các ô lưới mà đoạn đó
+chạm tới, nên chi phí mỗi frame tỉ lệ với số track chứ không với số vạch. Một
+track chỉ được đếm một lần cho mỗi vạch (lần cắt đầu tiên): xe dừng trên vạch
+hay box rung quanh vạch không bị đếm lặp. Tâm nằm đúng trên vạch không thuộc
+phía nào: track giữ phía trước đó cho đến khi rời vạch, nên chạm vạch rồi quay
+lại không bị tính là cắt.
+
+Hướng 'in' là đi từ bên trái sang bên phải của vạch p1 -> p2 khi nhìn trên màn
+hình (trục y hướng xuống), 'out' là ngược lại.
+"""
+import math
+
+from coords import normalize_points, points_to_pixels
+
+
+DIRECTIONS = ('in', 'out')
+
+
+class CountLine:
+    """Vạch đếm p1 -> p2, tọa độ chuẩn hóa và tọa độ pixel của frame làm việc"""
+
+    __slots__ = ('line_id', 'normalized', 'p1', 'p2', 'dx', 'dy')
+
+    def __init__(self, line_id, normalized, frame_size):
+        self.line_id = line_id
+        self.normalized = tuple(normalized)
+        self.place(frame_size)
+
+    def place(self, frame_size):
+        """Tính tọa độ pixel theo kích thước frame làm việc"""
+        self.p1, self.p2 = points_to_pixels(self.normalized, frame_size)
+        self.dx = self.p2[0] - self.p1[0]
+        self.dy = self.p2[1] - self.p1[1]
+
+    @property
+    def coords(self):
+        return (*self.p1, *self.p2)
+
+    def side(self, x, y):
+        """1 nếu điểm nằm bên phải vạch, -1 nếu bên trái, 0 nếu nằm trên vạch"""
+        cross = self.dx * (y - self.p1[1]) - self.dy * (x - self.p1[0])
+        return (cross > 0) - (cross < 0)
+
+    def spans(self, x0, y0, x1, y1):
+        """Đoạn (x0, y0) -> (x1, y1) đi qua vạch trong khoảng p1..p2 (không chỉ đường thẳng kéo dài)"""
+        mx, my = x1 - x0, y1 - y0
+        o1 = mx * (self.p1[1] - y0) - my * (self.p1[0] - x0)
+        o2 = mx * (self.p2[1] - y0) - my * (self.p2[0] - x0)
+        return o1 * o2 <= 0
+
+
+class LineCounter:
+    """
+    Các vạch đếm của một luồng video và vị trí trước của từng track
+
+    Lưới đều (ô cell_size pixel) ánh xạ ô -> các vạch đi qua ô đó (kể cả ô kề,
+    để điểm cắt nằm sát mép ô không bị sót).
+    """
+
+    def __init__(self, frame_size, cell_size=64):
+        """
+        Args:
+            frame_size: Kích thước frame làm việc (width, height)
+            cell_size: Cạnh ô lưới (pixel)
+        """
+        self.frame_size = tuple(frame_size)
+        self.cell_size = cell_size
+        self.lines = {}
+        self.next_line_id = 1
+        self.cells = {}
+        self.last_points = {}   # {track_id: (cx, cy)} ở lần cập nhật trước
+        self.counted = {}       # {track_id: {line_id, ...}} các vạch track đã được đếm
+        self.touching = {}      # {(track_id, line_id): phía trước khi tâm nằm trên vạch}
+
+    def add_line(self, x1, y1, x2, y2):
+        """line_id của vạch mới (tọa độ pixel của frame làm việc)"""
+        return self.add_line_normalized(*(value for point in normalize_points(
+            [(x1, y1), (x2, y2)], self.frame_size) for value in point))
+
+    def add_line_normalized(self, x1, y1, x2, y2):
+        """line_id của vạch mới (tọa độ chuẩn hóa 0-1)"""
+        line_id = self.next_line_id
+        self.next_line_id += 1
+        self.lines[line_id] = CountLine(line_id, ((x1, y1), (x2, y2)), self.frame_size)
+        self._rebuild()
+        return line_id
+
+    def remove_line(self, line_id):
+        if self.lines.pop(line_id, None) is None:
+            return False
+        for done in self.counted.values():
+            done.discard(line_id)
+        self.touching = {key: side for key, side in self.touching.items() if key[1] != line_id}
+        self._rebuild()
+        return True
+
+    def set_frame_size(self, frame_size):
+        """Tính lại tọa độ pixel của các vạch (vị trí trước của track không còn đúng)"""
+        self.frame_size = tuple(frame_size)
+        for line in self.lines.values():
+            line.place(self.frame_size)
+        self.last_points = {}
+        self.touching = {}
+        self._rebuild()
+
+    def reset(self):
+        """Quên vị trí và các vạch đã đếm của mọi track (tracker được tạo lại)"""
+        self.last_points = {}
+        self.counted = {}
+        self.touching = {}
+
+    def _rebuild(self):
+        """Gán mỗi vạch vào các ô lưới nó đi qua"""
+        size = self.cell_size
+        cells = {}
+        for line_id, line in self.lines.items():
+            # Lấy mẫu dày hơn cạnh ô; thêm ô kề để bù phần vạch cắt qua góc ô
+            steps = max(1, int(math.ceil(math.hypot(line.dx, line.dy) / (size / 4))))
+            touched = set()
+            for i in range(steps + 1):
+                gx = int(line.p1[0] + line.dx * i / steps) // size
+                gy = int(line.p1[1] + line.dy * i / steps) // size
+                for nx in (gx - 1, gx, gx + 1):
+                    for ny in (gy - 1, gy, gy + 1):
+                        touched.add((nx, ny))
+            for cell in touched:
+                cells.setdefault(cell, []).append(line_id)
+        self.cells = cells
+
+    def bounds(self, padding=0):
+        """{line_id: (x1, y1, x2, y2)} hình chữ nhật bao mỗi vạch, thêm lề padding"""
+        return {
+            line_id: (min(line.p1[0], line.p2[0]) - padding, min(line.p1[1], line.p2[1]) - padding,
+                      max(line.p1[0], line.p2[0]) + padding, max(line.p1[1], line.p2[1]) + padding)
+            for line_id, line in self.lines.items()
+        }
+
+    def update(self, tracked, alive):
+        """
+        Cập nhật vị trí tâm của các track và tìm các lần cắt vạch
+
+        Args:
+            tracked: [[x1, y1, x2, y2, id] hoặc None, ...] kết quả của tracker
+            alive: Các track tracker còn giữ (để bỏ trạng thái của track đã xóa)
+
+        Returns:
+            [(line_id, track_id, 'in' hoặc 'out'), ...]
+        """
+        crossings = []
+        size = self.cell_size
+        for tracked_box in tracked:
+            if tracked_box is None:
+                continue
+            x1, y1, x2, y2, track_id = tracked_box
+            cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+            previous = self.last_points.get(track_id)
+            self.last_points[track_id] = (cx, cy)
+            if previous is None or not self.cells:
+                continue
+
+            px, py = previous
+            candidates = set()
+            for gx in range(int(min(px, cx)) // size, int(max(px, cx)) // size + 1):
+                for gy in range(int(min(py, cy)) // size, int(max(py, cy)) // size + 1):
+                    candidates.update(self.cells.get((gx, gy), ()))
+            for line_id in candidates:
+                line = self.lines[line_id]
+                after = line.side(cx, cy)
+                before = line.side(px, py) or self.touching.pop((track_id, line_id), 0)
+                if not after:
+                    # Tâm nằm trên vạch: giữ phía trước đó cho đến khi rời vạch
+                    if before:
+                        self.touching[(track_id, line_id)] = before
+                    continue
+                if not before or before == after or not line.spans(px, py, cx, cy):
+                    continue
+                done = self.counted.setdefault(track_id, set())
+                if line_id in done:
+                    continue
+                done.add(line_id)
+                crossings.append((line_id, track_id, 'in' if after > 0 else 'out'))
+
+        if len(self.last_points) > 2 * len(alive) + 64:
+            self.last_points = {track_id: point for track_id, point in self.last_points.items()
+                                if track_id in alive}
+            self.counted = {track_id: done for track_id, done in self.counted.items()
+                            if track_id in alive}
+            self.touching = {key: side for key, side in self.touching.items() if key[0] in alive}
+        return crossings
@@ -0,0 +1,209 @@
+"""
+Cache kết quả detect thô trên đĩa để phân tích lại video mà không chạy YOLO.
+
+Mỗi file .npz chứa kết quả thô (mọi class, confidence >= floor) của một video
+với một model, imgsz và kích thước frame làm việc. Lần chạy sau đọc lại kết
+quả thô theo số frame rồi mới lọc class/confidence, nên đổi ROI, loại phương
+tiện hay ngưỡng confidence không cần detect lại. Tổng dung lượng cache có giới
+hạn, file dùng lâu nhất bị xóa trước.
+"""
+import hashlib
+import itertools
+import os
+import sys
+import threading
+
+import numpy as np
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """
+    Hash nội dung của file (hoặc thư mục model) mà không đọc toàn bộ
+
+    Hash kích thước file cùng các đoạn đầu, giữa và cuối file; thư mục
+    (ví dụ *_openvino_model/) được hash theo từng file bên trong.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            digest.update(name.encode())
+            digest.update(file_fingerprint(os.path.join(path, name), chunk_size).encode())
+        return digest.hexdigest()
+
+    size = os.path.getsize(path)
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - chunk_size // 2), max(0, size - chunk_size)}):
+            f.seek(offset)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+class VideoDetections:
+    """Kết quả detect thô đã cache của một video với một model, theo imgsz và số frame"""
+
+    def __init__(self, cache, video_hash, model_key, frame_size):
+        self.cache = cache
+        self.floor = cache.floor
+        self.prefix = video_hash[:16]
+        self.key = hashlib.sha1(
+            f"{model_key}|{frame_size[0]}x{frame_size[1]}|{self.floor}".encode()
+        ).hexdigest()[:12]
+
+        self.frames = {}   # {imgsz: {frame_idx: mảng (N, 6)}}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, imgsz):
+        return os.path.join(self.cache.cache_dir, f"{self.prefix}_{self.key}_{imgsz}.npz")
+
+    def _frames_for(self, imgsz):
+        frames = self.frames.get(imgsz)
+        if frames is None:
+            frames = self.frames[imgsz] = self.cache.load(self.path_for(imgsz))
+        return frames
+
+    def get(self, imgsz, frame_idx):
+        """Kết quả thô (N, 6) [x1, y1, x2, y2, conf, cls_id] của frame, hoặc None nếu chưa có"""
+        with self.lock:
+            raw = self._frames_for(imgsz).get(frame_idx)
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return raw
+
+    def put(self, imgsz, frame_idx, raw):
+        """Lưu kết quả thô của frame (chỉ giữ box có confidence >= floor)"""
+        if hasattr(raw, 'cpu'):
+            raw = raw.cpu().numpy()
+        raw = np.asarray(raw, dtype=np.float32).reshape(-1, 6)
+        raw = raw[raw[:, 4] >= self.floor]
+        with self.lock:
+            self._frames_for(imgsz)[frame_idx] = raw
+            self.dirty.add(imgsz)
+
+    def save(self):
+        """Ghi các kết quả mới ra đĩa rồi dọn cache nếu vượt dung lượng"""
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            for imgsz in dirty:
+                self.cache.store(self.path_for(imgsz), self.frames[imgsz])
+        if dirty:
+            self.cache.evict(keep={self.path_for(imgsz) for imgsz in dirty})
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'cached_frames': sum(len(frames) for frames in self.frames.values())
+        }
+
+
+class DetectionCache:
+    """Thư mục cache kết quả detect thô, giới hạn tổng dung lượng"""
+
+    def __init__(self, cache_dir=".detection_cache", max_bytes=512 << 20, floor=0.05):
+        """
+        Args:
+            cache_dir: Thư mục chứa các file cache
+            max_bytes: Tổng dung lượng tối đa của cache
+            floor: Confidence thấp nhất được lưu (0-1); detector có ngưỡng thấp
+                hơn floor sẽ không dùng cache
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.floor = floor
+        self._fingerprints = {}
+        # Thứ tự dùng file trong tiến trình này, phân định các file có cùng mtime
+        # (hệ thống file chỉ lưu mtime theo giây)
+        self._sequence = itertools.count(1)
+        self._used = {}
+
+    def fingerprint(self, path):
+        """file_fingerprint có nhớ theo (đường dẫn, kích thước, thời gian sửa)"""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        if key not in self._fingerprints:
+            self._fingerprints[key] = file_fingerprint(path)
+        return self._fingerprints[key]
+
+    def open(self, video_path, model_key, frame_size):
+        """
+        Mở cache của một video
+
+        Args:
+            video_path: Đường dẫn video
+            model_key: Định danh model (VehicleDetector.cache_key())
+            frame_size: Kích thước frame làm việc (width, height)
+
+        Returns:
+            VideoDetections
+        """
+        return VideoDetections(self, self.fingerprint(video_path), model_key, frame_size)
+
+    def load(self, path):
+        """Đọc file cache thành {frame_idx: mảng (N, 6)} ({} nếu chưa có hoặc hỏng)"""
+        try:
+            with np.load(path) as data:
+                frame_ids, counts, boxes = data['frames'], data['counts'], data['boxes']
+        except FileNotFoundError:
+            return {}
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring unreadable detection cache {path}: {e}", file=sys.stderr)
+            return {}
+        # Đánh dấu vừa dùng để eviction xóa file khác trước
+        self._used[path] = next(self._sequence)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return dict(zip(frame_ids.tolist(), np.split(boxes, np.cumsum(counts)[:-1])))
+
+    def store(self, path, frames):
+        """Ghi {frame_idx: mảng (N, 6)} ra file (ghi file tạm rồi đổi tên)"""
+        frame_ids = sorted(frames)
+        boxes = [frames[frame_idx] for frame_idx in frame_ids]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                frames=np.array(frame_ids, dtype=np.int64),
+                counts=np.array([len(raw) for raw in boxes], dtype=np.int64),
+                boxes=np.concatenate(boxes) if boxes else np.empty((0, 6), dtype=np.float32)
+            )
+        os.replace(tmp_path, path)
+        self._used[path] = next(self._sequence)
+
+    def evict(self, keep=()):
+        """
+        Xóa các file dùng lâu nhất cho đến khi tổng dung lượng <= max_bytes
+
+        Các file có cùng mtime được xếp theo thứ tự dùng trong tiến trình này, nên
+        file vừa ghi không bị xóa trước file cũ ghi cùng giây.
+        """
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, self._used.get(path, 0), stat.st_size, path))
+
+        total = sum(size for _, _, size, _ in files)
+        for _, _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class Detections:
+    """
+    Kết quả detect của một frame dưới dạng mảng NumPy
+
+    Attributes:
+        xyxy: Tọa độ bounding boxes, shape (N, 4), int32
+        conf: Confidence, shape (N,), float32
+        cls_id: ID class trong danh sách coco, shape (N,), int32
+        class_names: Danh sách tên class (dùng chung, không copy)
+        high_threshold: Ngưỡng confidence của detector; box thấp hơn chỉ dùng để
+            giữ track (khi detector trả thêm box confidence thấp)
+    """
+
+    __slots__ = ('xyxy', 'conf', 'cls_id', 'class_names', 'high_threshold')
+
+    def __init__(self, xyxy, conf, cls_id, class_names, high_threshold=0.0):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls_id = cls_id
+        self.class_names = class_names
+        self.high_threshold = high_threshold
+
+    @classmethod
+    def empty(cls, class_names=()):
+        return cls(
+            np.empty((0, 4), dtype=np.int32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int32),
+            class_names
+        )
+
+    @classmethod
+    def from_raw(cls, data, class_mask, conf_threshold, class_names):
+        """
+        Lọc kết quả thô của YOLO bằng các phép toán mảng
+
+        Args:
+            data: Mảng (N, 6) [x1, y1, x2, y2, conf, cls_id] (numpy hoặc torch tensor)
+            class_mask: Mảng bool theo class_id, True = class cần giữ
+            conf_threshold: Ngưỡng confidence (0-1)
+            class_names: Danh sách tên class
+        """
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        if len(data) == 0:
+            return cls.empty(class_names)
+
+        cls_id = data[:, 5].astype(np.int32)
+        keep = (cls_id >= 0) & (cls_id < len(class_mask))
+        keep[keep] = class_mask[cls_id[keep]]
+        keep &= data[:, 4] >= conf_threshold
+
+        return cls(
+            data[keep, :4].astype(np.int32),
+            data[keep, 4],
+            cls_id[keep],
+            class_names
+        )
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, index):
+        """Lấy tập con theo mask bool hoặc mảng chỉ số"""
+        return Detections(self.xyxy[index], self.conf[index], self.cls_id[index],
+                          self.class_names, self.high_threshold)
+
+    def high(self):
+        """Các box có confidence >= high_threshold"""
+        if len(self) == 0 or self.conf.min() >= self.high_threshold:
+            return self
+        return self[self.conf >= self.high_threshold]
+
+    def __iter__(self):
+        """Duyệt từng box dạng (x1, y1, x2, y2, cls_name, conf), dùng khi vẽ"""
+        names = self.class_names
+        for (x1, y1, x2, y2), conf, cls_id in zip(self.xyxy.tolist(), self.conf.tolist(), self.cls_id.tolist()):
+            yield x1, y1, x2, y2, names[cls_id], conf
+
+    @property
+    def centers(self):
+        """Tâm các bounding boxes, shape (N, 2), int32"""
+        return (self.xyxy[:, :2] + self.xyxy[:, 2:]) // 2
+
+    def names(self):
+        """Tên class của từng box"""
+        names = self.class_names
+        return [names[cls_id] for cls_id in self.cls_id.tolist()]
@@ -1,40 +1,120 @@
-import pandas as pd
-from ultralytics import YOLO
+import os
+
+import numpy as np
+
+from backends import create_backend
+from detection_cache import file_fingerprint
+from detections import Detections
+from regions import merge_tile_boxes, plan_regions, plan_tiles, shift_raw
 
 
 class VehicleDetector:
     """Class để nhận diện phương tiện sử dụng YOLO"""
     
-    def __init__(self, model_path, class_file, confidence_threshold=40, detect_imgsz=416):
+    def __init__(self, model_path, class_file, confidence_threshold=40, detect_imgsz=416,
+                 backend='auto', num_threads=None, low_confidence=None):
         """
         Khởi tạo detector
         
         Args:
-            model_path: Đường dẫn đến file model YOLO (.pt)
+            model_path: Đường dẫn đến file model YOLO (.pt, .onnx, .torchscript, *_openvino_model/)
             class_file: Đường dẫn đến file danh sách class (coco.txt)
             confidence_threshold: Ngưỡng confidence (%)
             detect_imgsz: Kích thước ảnh khi detect (nhỏ hơn = nhanh hơn)
+            backend: Backend inference (xem backends.BACKENDS, 'auto' = theo đuôi file model)
+            num_threads: Số thread inference (None = mặc định của runtime)
+            low_confidence: Ngưỡng confidence thấp (0-1) cho MotionTracker; box giữa ngưỡng
+                này và confidence_threshold chỉ dùng để giữ track (None = không lấy)
         """
         self.model_path = model_path
         self.class_file = class_file
         self.confidence_threshold = confidence_threshold
         self.detect_imgsz = detect_imgsz
+        self.low_confidence = low_confidence
         
         with open(class_file, "r") as f:
             self.class_list = f.read().split("\n")
         
-        self.yolo_model = YOLO(model_path)
+        self.backend = create_backend(model_path, backend, num_threads)
+        self._cache_key = None
         
         self.last_detect_frame = -1
-        self.last_detections = []
+        self.last_detections = Detections.empty(self.class_list)
+        self._class_masks = {}
+        self._region_plans = {}
     
     def set_confidence_threshold(self, threshold):
         """Thay đổi confidence threshold"""
         self.confidence_threshold = threshold
+        self.reset_cache()
+    
+    def reset_cache(self):
+        """Xóa kết quả detect đã cache (khi mở video mới hoặc đổi cấu hình)"""
         self.last_detect_frame = -1
-        self.last_detections = []
+        self.last_detections = Detections.empty(self.class_list)
+    
+    def use_cached(self, detections, current_frame):
+        """Dùng kết quả có sẵn (ví dụ khi tua lại) như thể vừa detect ở current_frame"""
+        self.last_detections = detections
+        self.last_detect_frame = current_frame
+    
+    def cache_key(self):
+        """Định danh model cho DetectionCache: backend và hash nội dung file model"""
+        if self._cache_key is None:
+            # Model chưa có trên đĩa (Ultralytics tự tải theo tên): dùng tên model
+            fingerprint = self.model_path
+            if os.path.exists(self.model_path):
+                fingerprint = file_fingerprint(self.model_path)
+            self._cache_key = f"{self.backend.name}:{fingerprint}"
+        return self._cache_key
+    
+    def class_mask(self, target_classes):
+        """Mảng bool theo class_id cho các loại phương tiện cần detect (có cache)"""
+        key = frozenset(target_classes)
+        mask = self._class_masks.get(key)
+        if mask is None:
+            mask = np.array([name in key for name in self.class_list], dtype=bool)
+            self._class_masks[key] = mask
+        return mask
+    
+    def region_plan(self, roi_coords, frame_size, padding=32):
+        """
+        Vùng ảnh cần detect để phủ các ROI (có cache theo tọa độ ROI)
+        
+        Returns:
+            regions.RegionPlan, hoặc None nếu detect cả frame rẻ hơn
+        """
+        key = (tuple(tuple(coords) for coords in roi_coords), tuple(frame_size), self.detect_imgsz, padding)
+        if key not in self._region_plans:
+            if len(self._region_plans) > 64:
+                self._region_plans.clear()
+            self._region_plans[key] = plan_regions(
+                roi_coords, frame_size, self.detect_imgsz, padding,
+                fixed_imgsz=getattr(self.backend, 'fixed_imgsz', None)
+            )
+        return self._region_plans[key]
+    
+    def tile_plan(self, roi_coords, native_size, frame_size, tile_size=640, overlap=0.2,
+                  global_pass=True, padding=32):
+        """
+        Các tile trên frame gốc phủ các ROI (có cache, xem regions.plan_tiles)
+        
+        Returns:
+            regions.TilePlan; plan.bind(frame_gốc) được truyền làm regions khi detect
+        """
+        key = ('tiles', tuple(tuple(coords) for coords in roi_coords), tuple(native_size),
+               tuple(frame_size), tile_size, overlap, global_pass, self.detect_imgsz, padding)
+        if key not in self._region_plans:
+            if len(self._region_plans) > 64:
+                self._region_plans.clear()
+            self._region_plans[key] = plan_tiles(
+                native_size, frame_size, roi_coords, tile_size, overlap, padding, global_pass,
+                self.detect_imgsz, fixed_imgsz=getattr(self.backend, 'fixed_imgsz', None)
+            )
+        return self._region_plans[key]
     
-    def detect(self, frame, target_classes, current_frame, detect_skip_frames=2, force=False):
+    def detect(self, frame, target_classes, current_frame, detect_skip_frames=2, force=False, regions=None,
+               cache=None):
         """
         Nhận diện phương tiện trong frame
         
@@ -44,44 +124,122 @@ class VehicleDetector:
             current_frame: Số frame hiện tại
             detect_skip_frames: Số frames bỏ qua giữa các lần detect
             force: Buộc detect ngay cả khi skip frames
+            regions: RegionPlan chỉ detect trong các vùng ROI, hoặc TilePlan.bind(frame gốc)
+                để detect các tile của frame gốc (None = cả frame)
+            cache: detection_cache.VideoDetections của video đang xử lý (None = không cache)
             
         Returns:
-            List các bounding boxes: [[x1, y1, x2, y2, cls_name, confidence], ...]
+            Detections: bounding boxes, confidence và class của các phương tiện
         """
         if not force and (current_frame - self.last_detect_frame) < detect_skip_frames:
             return self.last_detections
         
         if not target_classes:
-            self.last_detections = []
-            return []
+            self.last_detections = Detections.empty(self.class_list)
+            return self.last_detections
         
-        conf_threshold = self.confidence_threshold / 100.0
-        results = self.yolo_model.predict(
-            frame,                 # Ảnh đầu vào
-            verbose=False,         # Tắt log
-            imgsz=self.detect_imgsz,  # Kích thước resize ảnh
-            conf=conf_threshold,   # Ngưỡng độ tin cậy
-            half=False,            # Không dùng FP16 (CPU)
-            device='cpu'           # Chạy trên CPU
-        )
-
-        boxes = results[0].boxes.data
-        df = pd.DataFrame(boxes).astype(float)
-
-        vehicle_boxes = []
-        for _, row in df.iterrows():
-            x1, y1, x2, y2 = int(row[0]), int(row[1]), int(row[2]), int(row[3])
-            cls_id = int(row[5]) # id trong danh sách coco
-            confidence = float(row[4]) # tỷ lệ %
-            
-            if cls_id < len(self.class_list):
-                cls_name = self.class_list[cls_id]
-                
-                if cls_name in target_classes and confidence >= conf_threshold:
-                    vehicle_boxes.append([x1, y1, x2, y2, cls_name, confidence])
+        vehicle_boxes = self.detect_batch([frame], [target_classes], [regions],
+                                          [cache], [current_frame])[0]
         
         self.last_detections = vehicle_boxes
         self.last_detect_frame = current_frame
         
         return vehicle_boxes
-
+    
+    def detect_batch(self, frames, target_classes_list, regions_list=None, caches=None, frame_indices=None):
+        """
+        Nhận diện nhiều frame trong một lần gọi predict (không áp dụng skip frames)
+        
+        Frame có RegionPlan được thay bằng các ảnh cắt của nó; các ảnh cùng imgsz
+        được detect chung một lần gọi predict rồi dịch về tọa độ frame. Với tile
+        của frame gốc, box được đổi về tọa độ frame làm việc và box trùng giữa
+        các tile được gộp.
+        
+        Frame có cache được lấy kết quả thô từ cache nếu có; nếu chưa có thì
+        detect cả frame (bỏ qua RegionPlan, để kết quả vẫn đúng khi ROI thay
+        đổi) và lưu vào cache. Lọc class/confidence luôn làm sau cùng.
+        
+        Args:
+            frames: Danh sách frame (numpy array), có thể từ nhiều nguồn khác nhau
+            target_classes_list: Danh sách target_classes tương ứng với từng frame
+            regions_list: RegionPlan (hoặc None = cả frame) tương ứng với từng frame
+            caches: VideoDetections (hoặc None) tương ứng với từng frame
+            frame_indices: Số frame tương ứng với từng frame (bắt buộc khi có caches)
+            
+        Returns:
+            List kết quả cho từng frame, cùng định dạng với detect()
+        """
+        if not frames:
+            return []
+        
+        conf_threshold = self.confidence_threshold / 100.0
+        floor = conf_threshold
+        if self.low_confidence is not None:
+            floor = min(floor, self.low_confidence)
+        regions_list = list(regions_list) if regions_list is not None else [None] * len(frames)
+        caches = list(caches) if caches is not None else [None] * len(frames)
+        raw_results = [None] * len(frames)
+        predict_floor = floor
+        for index, cache in enumerate(caches):
+            regions = regions_list[index]
+            if cache is None or floor < cache.floor or (regions is not None and not regions.cacheable):
+                # Cache không có các box dưới floor của nó, và chỉ lưu kết quả detect cả frame
+                caches[index] = None
+                continue
+            raw_results[index] = cache.get(self.detect_imgsz, frame_indices[index])
+            regions_list[index] = None
+            predict_floor = min(predict_floor, cache.floor)
+        
+        missing = [index for index, raw in enumerate(raw_results) if raw is None]
+        if missing:
+            outputs = self._predict([frames[index] for index in missing],
+                                    [regions_list[index] for index in missing], predict_floor)
+            for index, raw in zip(missing, outputs):
+                raw_results[index] = raw
+                if caches[index] is not None:
+                    caches[index].put(self.detect_imgsz, frame_indices[index], raw)
+        
+        detections = []
+        for raw, target_classes in zip(raw_results, target_classes_list):
+            vehicle_boxes = self._filter_boxes(raw, target_classes, floor)
+            vehicle_boxes.high_threshold = conf_threshold
+            detections.append(vehicle_boxes)
+        return detections
+    
+    def _predict(self, frames, regions_list, conf):
+        """Kết quả thô theo tọa độ frame của từng frame"""
+        if not any(regions_list):
+            return self.backend.predict(frames, self.detect_imgsz, conf)
+        return self._predict_regions(frames, regions_list, conf)
+    
+    def _predict_regions(self, frames, regions_list, conf):
+        """Detect các ảnh cắt theo nhóm imgsz, trả về kết quả thô theo tọa độ frame"""
+        groups = {}
+        for index, (frame, regions) in enumerate(zip(frames, regions_list)):
+            if regions is None:
+                groups.setdefault(self.detect_imgsz, []).append((index, frame, (0, 0), None))
+                continue
+            for rect, crop in zip(regions.rects, regions.crops(frame)):
+                groups.setdefault(regions.imgsz, []).append((index, crop, rect[:2], regions.scale))
+            if regions.global_imgsz:
+                groups.setdefault(regions.global_imgsz, []).append((index, frame, (0, 0), None))
+        
+        parts = [[] for _ in frames]
+        for imgsz, items in groups.items():
+            outputs = self.backend.predict([image for _, image, _, _ in items], imgsz, conf)
+            for (index, _, offset, scale), raw in zip(items, outputs):
+                parts[index].append(shift_raw(raw, offset, scale))
+        
+        results = []
+        for part, regions in zip(parts, regions_list):
+            raw = np.concatenate(part) if part else np.empty((0, 6), dtype=np.float32)
+            if regions is not None and regions.overlapping:
+                raw = merge_tile_boxes(raw)
+            results.append(raw)
+        return results
+    
+    def _filter_boxes(self, boxes, target_classes, conf_threshold):
+        """Lọc kết quả YOLO theo loại phương tiện và confidence"""
+        if not target_classes:
+            return Detections.empty(self.class_list)
+        return Detections.from_raw(boxes, self.class_mask(target_classes), conf_threshold, self.class_list)
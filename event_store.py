@@ -0,0 +1,353 @@
+"""
+Lưu sự kiện và số xe vào SQLite để giữ lại sau khi tắt chương trình và truy vấn nhanh.
+
+- tracks: mỗi xe trong một ROI một dòng (loại, frame/thời điểm đầu và cuối,
+  confidence cao nhất, ảnh), ghi khi VehicleProcessor bỏ record khỏi bộ nhớ
+  hoặc khi đổi nguồn/đóng. Ghi lại cùng một xe (cùng nguồn, ROI, track và
+  thời điểm đầu) chỉ cập nhật dòng cũ.
+- events: sự kiện vào/ra ROI, sự kiện ghi lặp bị bỏ qua.
+- rollups: số xe, lượt vào, lượt ra theo (nguồn, ROI, loại, khung thời gian),
+  cộng dồn ngay khi ghi nên truy vấn theo tuần chỉ đọc vài nghìn dòng.
+
+Ghi trên một thread nền, gom nhiều dòng vào một transaction; database ở chế
+độ WAL nên truy vấn không chặn việc ghi.
+
+Ví dụ truy vấn số xe tải mỗi 5 phút của ROI 1:
+    python event_store.py events.db --roi 1 --class truck --bucket 300
+"""
+import argparse
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    roi_id INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    class TEXT NOT NULL,
+    first_frame INTEGER,
+    last_frame INTEGER,
+    first_time REAL NOT NULL,
+    last_time REAL NOT NULL,
+    frames INTEGER,
+    best_conf REAL,
+    snapshot TEXT
+);
+CREATE INDEX IF NOT EXISTS tracks_time ON tracks (first_time);
+CREATE INDEX IF NOT EXISTS tracks_key ON tracks (source, roi_id, track_id, first_time);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    roi_id INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    class TEXT NOT NULL,
+    event TEXT NOT NULL,
+    frame INTEGER,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_key ON events (source, roi_id, track_id, time);
+CREATE TABLE IF NOT EXISTS rollups (
+    source TEXT NOT NULL,
+    roi_id INTEGER NOT NULL,
+    class TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    vehicles INTEGER NOT NULL DEFAULT 0,
+    entries INTEGER NOT NULL DEFAULT 0,
+    exits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, roi_id, class, bucket)
+);
+CREATE INDEX IF NOT EXISTS rollups_bucket ON rollups (bucket);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (source, roi_id, class, bucket, vehicles, entries, exits)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, roi_id, class, bucket) DO UPDATE SET
+    vehicles = vehicles + excluded.vehicles,
+    entries = entries + excluded.entries,
+    exits = exits + excluded.exits
+"""
+
+_STOP = object()
+
+
+class EventStore:
+    """Database SQLite (WAL) chứa tracks, events và rollups theo khung thời gian"""
+
+    def __init__(self, path, bucket_seconds=300, batch_size=500, flush_interval=1.0):
+        """
+        Args:
+            path: File database
+            bucket_seconds: Độ dài một khung thời gian của rollups (giây); truy vấn
+                được theo bội số của giá trị này
+            batch_size: Số dòng tối đa mỗi transaction
+            flush_interval: Thời gian tối đa (giây) một dòng nằm chờ trước khi được ghi
+        """
+        self.path = path
+        self.bucket_seconds = int(bucket_seconds)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'bucket_seconds'").fetchone()
+        if row is None:
+            conn.execute("INSERT INTO meta VALUES ('bucket_seconds', ?)", (str(self.bucket_seconds),))
+            conn.commit()
+        elif int(row[0]) != self.bucket_seconds:
+            # Rollups đã có theo khung khác: dùng khung của database
+            self.bucket_seconds = int(row[0])
+        conn.close()
+
+        self.queue = queue.Queue()
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds) * self.bucket_seconds
+
+    def recorder(self, source, fps=0.0, start_time=None):
+        """
+        Ghi sự kiện của một nguồn video, đổi số frame sang thời điểm
+
+        Args:
+            source: Tên nguồn (đường dẫn video hoặc URL camera)
+            fps: FPS của nguồn (0 = 25)
+            start_time: Thời điểm (epoch) của frame đầu tiên (None = bây giờ)
+        """
+        return EventRecorder(self, source, fps, start_time)
+
+    def add_track(self, source, roi_id, record, first_time, last_time):
+        self.queue.put(('track', (
+            source, roi_id, record['id'], record['type'], record.get('first_frame'),
+            record.get('last_frame'), first_time, last_time, record.get('count'),
+            record.get('best_conf'), record.get('snapshot')
+        )))
+
+    def add_event(self, source, roi_id, track_id, cls_name, event, frame_idx, timestamp):
+        self.queue.put(('event', (source, roi_id, track_id, cls_name, event, frame_idx, timestamp)))
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    items = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if _STOP in items:
+                    stopping = True
+                    items = [item for item in items if item is not _STOP]
+                    while True:
+                        try:
+                            items.append(self.queue.get_nowait())
+                        except queue.Empty:
+                            break
+                if items:
+                    self._write(conn, items)
+        finally:
+            conn.close()
+
+    def _write(self, conn, items):
+        """
+        Ghi một nhóm dòng và cộng dồn rollups trong cùng một transaction
+
+        Xe đã có dòng (cùng nguồn, ROI, track, thời điểm đầu) chỉ được cập nhật
+        và không được đếm lại; sự kiện đã có bị bỏ qua.
+        """
+        tracks, events, rollups = {}, {}, {}
+        for kind, row in items:
+            if kind == 'track':
+                # Lần ghi sau cùng của một xe trong nhóm là mới nhất
+                tracks[(row[0], row[1], row[2], row[6])] = row
+            else:
+                events.setdefault((row[0], row[1], row[2], row[6], row[4]), row)
+        try:
+            with conn:
+                for key, row in tracks.items():
+                    existing = conn.execute(
+                        "SELECT id FROM tracks WHERE source = ? AND roi_id = ? AND track_id = ? "
+                        "AND first_time = ?", key
+                    ).fetchone()
+                    if existing:
+                        conn.execute(
+                            "UPDATE tracks SET last_frame = ?, last_time = ?, frames = ?, best_conf = ?, "
+                            "snapshot = ? WHERE id = ?", (row[5], row[7], row[8], row[9], row[10], existing[0])
+                        )
+                        continue
+                    conn.execute(
+                        "INSERT INTO tracks (source, roi_id, track_id, class, first_frame, last_frame, "
+                        "first_time, last_time, frames, best_conf, snapshot) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        row
+                    )
+                    rollup = (row[0], row[1], row[3], self._bucket(row[6]))
+                    rollups.setdefault(rollup, [0, 0, 0])[0] += 1
+                for key, row in events.items():
+                    if conn.execute(
+                        "SELECT 1 FROM events WHERE source = ? AND roi_id = ? AND track_id = ? "
+                        "AND time = ? AND event = ?", key
+                    ).fetchone():
+                        continue
+                    conn.execute(
+                        "INSERT INTO events (source, roi_id, track_id, class, event, frame, time) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", row
+                    )
+                    rollup = (row[0], row[1], row[3], self._bucket(row[6]))
+                    rollups.setdefault(rollup, [0, 0, 0])[1 if row[4] == 'enter' else 2] += 1
+                conn.executemany(UPSERT_ROLLUP, [key + tuple(counts) for key, counts in rollups.items()])
+            self.written += len(items)
+        except sqlite3.Error as e:
+            print(f"Cannot write {len(items)} rows to event store {self.path}: {e}", file=sys.stderr)
+
+    def counts(self, since=None, until=None, roi_id=None, cls_name=None, source=None, bucket_seconds=None):
+        """
+        Số xe, lượt vào, lượt ra theo khung thời gian (đọc từ rollups)
+
+        Args:
+            since, until: Khoảng thời gian (epoch giây, None = không giới hạn), được mở
+                rộng ra khung trọn vẹn của database: since làm tròn xuống, until làm
+                tròn lên, nên khung chứa since và khung chứa until đều được tính
+            roi_id, cls_name, source: Lọc theo ROI, loại xe, nguồn (None = tất cả)
+            bucket_seconds: Độ dài khung khi trả về, bội số của bucket_seconds của
+                database (None = bằng bucket_seconds; 0 = gộp cả khoảng thời gian)
+
+        Returns:
+            [{'bucket', 'source', 'roi_id', 'class', 'vehicles', 'entries', 'exits'}, ...]
+        """
+        if bucket_seconds is None:
+            bucket_seconds = self.bucket_seconds
+        if bucket_seconds and bucket_seconds % self.bucket_seconds:
+            raise ValueError(f"bucket_seconds must be a multiple of {self.bucket_seconds}")
+
+        where, params = [], []
+        for column, value in (('roi_id', roi_id), ('class', cls_name), ('source', source)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            where.append("bucket >= ?")
+            params.append(self._bucket(since))
+        if until is not None:
+            where.append("bucket < ?")
+            params.append(-int(-until // self.bucket_seconds) * self.bucket_seconds)
+        bucket_expr = f"(bucket / {int(bucket_seconds)}) * {int(bucket_seconds)}" if bucket_seconds else "NULL"
+        sql = (f"SELECT {bucket_expr} AS b, source, roi_id, class, SUM(vehicles), SUM(entries), SUM(exits) "
+               f"FROM rollups {'WHERE ' + ' AND '.join(where) if where else ''} "
+               f"GROUP BY b, source, roi_id, class ORDER BY b, source, roi_id, class")
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        keys = ('bucket', 'source', 'roi_id', 'class', 'vehicles', 'entries', 'exits')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def tracks(self, since=None, until=None, roi_id=None, cls_name=None, source=None, limit=1000):
+        """Các xe (mới nhất trước) có thời điểm xuất hiện đầu tiên trong khoảng thời gian"""
+        where, params = [], []
+        for column, value in (('roi_id', roi_id), ('class', cls_name), ('source', source)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            where.append("first_time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("first_time < ?")
+            params.append(until)
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM tracks {'WHERE ' + ' AND '.join(where) if where else ''} "
+                f"ORDER BY first_time DESC LIMIT ?", params + [limit]
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        """Ghi hết các dòng đang chờ và dừng thread ghi"""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+
+class EventRecorder:
+    """
+    Cầu nối giữa VehicleProcessor và EventStore cho một nguồn video:
+    dùng làm sink (write) và on_event của VehicleProcessor
+    """
+
+    def __init__(self, store, source, fps=0.0, start_time=None):
+        self.store = store
+        self.source = source
+        self.fps = fps or 25.0
+        self.start_time = time.time() if start_time is None else start_time
+
+    def frame_time(self, frame_idx):
+        """Thời điểm (epoch) của frame"""
+        return self.start_time + (frame_idx or 0) / self.fps
+
+    def write(self, roi_id, record):
+        """Ghi một xe đã kết thúc (giao diện sink của VehicleProcessor)"""
+        self.store.add_track(self.source, roi_id, record,
+                             self.frame_time(record.get('first_frame')),
+                             self.frame_time(record.get('last_frame')))
+
+    def on_event(self, record):
+        """Ghi sự kiện vào/ra ROI (callback on_event của VehicleProcessor)"""
+        self.store.add_event(self.source, record['roi_id'], record['id'], record['type'],
+                             record['event'], record['frame'], self.frame_time(record['frame']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Truy vấn số xe theo khung thời gian từ event store")
+    parser.add_argument("database", help="File SQLite của EventStore")
+    parser.add_argument("--roi", type=int, default=None, help="Chỉ lấy một ROI")
+    parser.add_argument("--class", dest="cls_name", default=None, help="Chỉ lấy một loại xe")
+    parser.add_argument("--source", default=None, help="Chỉ lấy một nguồn video")
+    parser.add_argument("--since", type=float, default=None, help="Từ thời điểm (epoch giây)")
+    parser.add_argument("--until", type=float, default=None, help="Đến thời điểm (epoch giây)")
+    parser.add_argument("--bucket", type=int, default=None,
+                        help="Độ dài khung (giây), bội số của khung trong database (0 = gộp tất cả)")
+    parser.add_argument("--tracks", action="store_true", help="Liệt kê từng xe thay vì số xe")
+    args = parser.parse_args(argv)
+
+    store = EventStore(args.database)
+    try:
+        if args.tracks:
+            rows = store.tracks(args.since, args.until, args.roi, args.cls_name, args.source)
+        else:
+            rows = store.counts(args.since, args.until, args.roi, args.cls_name, args.source, args.bucket)
+    finally:
+        store.close()
+    print(json.dumps(rows, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
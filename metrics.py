@@ -0,0 +1,428 @@
+"""
+Số liệu vận hành của pipeline: thời gian từng stage, hàng đợi, frame bị bỏ,
+số lần detect bị bỏ qua, số track và ảnh chờ ghi.
+
+- MetricsRegistry: counter, gauge, histogram theo nhãn; giá trị đọc từ trạng
+  thái sẵn có (độ sâu hàng đợi, số track, ...) được lấy qua collector chỉ khi
+  có người đọc, nên không tốn gì mỗi frame.
+- MetricsServer: HTTP cục bộ, /metrics theo định dạng text của Prometheus,
+  /profile?seconds=N lấy mẫu stack của mọi thread.
+- MetricsLogger: mỗi interval ghi một dòng JSON các số liệu.
+
+Khi không truyền registry (metrics=None), pipeline không đo gì thêm.
+"""
+import bisect
+import json
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter as StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sysinfo import process_rss
+
+
+# Biên trên (giây) của các bucket thời gian, từ 1 ms đến 2.5 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Một metric theo tên, giá trị riêng cho mỗi bộ giá trị nhãn"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def samples(self):
+        """[(tên, nhãn, giá trị), ...] để xuất"""
+        with self.lock:
+            return [(self.name, labels, value) for labels, value in self.values.items()]
+
+
+class Counter(Metric):
+    """Giá trị chỉ tăng"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """Giá trị tùy ý tại thời điểm đọc"""
+
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    """Phân bố giá trị theo bucket cộng dồn, kèm tổng và số lần"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                # [số lần theo bucket (thêm +Inf), tổng, số lần]
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels, cumulative, f'le="{_format_value(float(bound))}"'))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+    def totals(self):
+        """{nhãn: (tổng, số lần)} để tính trung bình theo khoảng thời gian"""
+        with self.lock:
+            return {labels: (total, count) for labels, (_, total, count) in self.values.items()}
+
+
+class MetricsRegistry:
+    """
+    Tập các metric của tiến trình
+
+    Collector là hàm trả về [(tên, kiểu, help, {nhãn: giá trị}, giá trị), ...],
+    được gọi mỗi lần xuất số liệu. Collector là method của đối tượng (ví dụ
+    FramePipeline) được giữ bằng tham chiếu yếu, tự bỏ khi đối tượng bị hủy.
+    """
+
+    def __init__(self, process_metrics=True):
+        """
+        Args:
+            process_metrics: Xuất RSS và thời gian chạy của tiến trình
+        """
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        if process_metrics:
+            self.add_collector(self._process_samples)
+
+    def _get(self, cls, name, help_text, label_names, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, label_names, **kwargs)
+            elif not isinstance(metric, cls) or metric.label_names != tuple(label_names):
+                raise ValueError(f"Metric {name} already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._get(Counter, name, help_text, label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._get(Gauge, name, help_text, label_names)
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, label_names, buckets=buckets)
+
+    def add_collector(self, collector):
+        """Đăng ký collector (method được giữ bằng tham chiếu yếu)"""
+        ref = weakref.WeakMethod(collector) if hasattr(collector, '__self__') else (lambda: collector)
+        with self.lock:
+            self.collectors.append(ref)
+
+    def error(self, where):
+        """Đếm một lỗi theo nơi xảy ra (errors_total{where=...})"""
+        self.counter('errors_total', "Errors by component", ('where',)).inc(1, where)
+
+    def _process_samples(self):
+        samples = [('process_uptime_seconds', 'gauge', "Seconds since the registry was created",
+                    {}, round(time.time() - self.start_time, 3))]
+        rss = process_rss()
+        if rss is not None:
+            samples.append(('process_resident_memory_bytes', 'gauge', "Resident memory size", {}, rss))
+        return samples
+
+    def _collected(self):
+        """Kết quả của các collector còn sống, gom theo tên metric"""
+        with self.lock:
+            refs = list(self.collectors)
+        collected = {}
+        alive = []
+        for ref in refs:
+            collector = ref()
+            if collector is None:
+                continue
+            alive.append(ref)
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}", file=sys.stderr)
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                entry = collected.setdefault(name, {'kind': kind, 'help': help_text, 'samples': []})
+                entry['samples'].append((labels, value))
+        if len(alive) != len(refs):
+            with self.lock:
+                self.collectors = [ref for ref in self.collectors if ref in alive]
+        return collected
+
+    def render(self):
+        """Toàn bộ số liệu theo định dạng text của Prometheus (version 0.0.4)"""
+        lines = []
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample in metric.samples():
+                name, label_values, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else None
+                lines.append(f"{name}{_format_labels(metric.label_names, label_values, extra)} {_format_value(value)}")
+        for name, entry in sorted(self._collected().items()):
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['kind']}")
+            for labels, value in entry['samples']:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Số liệu dạng dict cho log: {tên{nhãn}: giá trị}; histogram được ghi
+        dưới dạng {'count', 'sum'} (cộng dồn từ đầu)
+        """
+        values = {}
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            if isinstance(metric, Histogram):
+                for labels, (total, count) in metric.totals().items():
+                    key = metric.name + _format_labels(metric.label_names, labels)
+                    values[key] = {'count': count, 'sum': round(total, 6)}
+                continue
+            for name, labels, value in metric.samples():
+                values[name + _format_labels(metric.label_names, labels)] = value
+        for name, entry in self._collected().items():
+            for labels, value in entry['samples']:
+                values[name + _format_labels(labels.keys(), labels.values())] = value
+        return values
+
+
+def sample_stacks(seconds=5.0, interval=0.005, include_idle=False):
+    """
+    Lấy mẫu stack của mọi thread trong seconds giây (sampling profiler)
+
+    Returns:
+        Counter {stack dạng 'thread;module:hàm:dòng;...': số mẫu}, dùng được
+        trực tiếp với flamegraph.pl/speedscope (định dạng collapsed)
+    """
+    me = threading.get_ident()
+    deadline = time.perf_counter() + seconds
+    stacks = StackCounter()
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            entries = traceback.extract_stack(frame)
+            if not include_idle and entries and entries[-1].name in ('wait', 'select', 'poll', 'accept'):
+                # Thread đang chờ (hàng đợi, socket): không tốn CPU
+                continue
+            frames = ";".join(f"{entry.filename.rsplit('/', 1)[-1]}:{entry.name}:{entry.lineno}"
+                              for entry in entries)
+            stacks[f"{names.get(ident, ident)};{frames}"] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def format_stacks(stacks, limit=None):
+    """Stack dạng collapsed, mỗi dòng '<stack> <số mẫu>', nhiều mẫu nhất trước"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common(limit)) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+    max_profile_seconds = 60.0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = self.registry.render()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif url.path == "/profile":
+            query = parse_qs(url.query)
+            try:
+                seconds = min(float(query.get('seconds', ['5'])[0]), self.max_profile_seconds)
+                limit = int(query.get('limit', ['50'])[0])
+            except ValueError:
+                self.send_error(400, "seconds and limit must be numbers")
+                return
+            body = format_stacks(sample_stacks(seconds, include_idle='idle' in query), limit)
+            content_type = "text/plain; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    HTTP cục bộ cho số liệu: GET /metrics (Prometheus) và
+    GET /profile?seconds=5&limit=50 (stack nóng nhất trong khoảng thời gian)
+    """
+
+    def __init__(self, registry, port=9108, host="127.0.0.1"):
+        """
+        Args:
+            registry: MetricsRegistry
+            port: Cổng HTTP (0 = chọn cổng trống, xem self.port)
+            host: Địa chỉ lắng nghe (mặc định chỉ máy này)
+        """
+        handler = type("MetricsHandler", (_MetricsHandler,), {'registry': registry})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join(timeout=2)
+
+
+class MetricsLogger:
+    """
+    Ghi số liệu định kỳ, mỗi lần một dòng JSON
+
+    Ngoài giá trị hiện tại, mỗi histogram có thêm 'mean_ms' và 'rate' (lần/giây)
+    tính trên khoảng thời gian kể từ dòng trước.
+    """
+
+    def __init__(self, registry, interval=30.0, path=None):
+        """
+        Args:
+            registry: MetricsRegistry
+            interval: Khoảng thời gian (giây) giữa hai dòng log
+            path: File ghi nối tiếp (None = stderr)
+        """
+        self.registry = registry
+        self.interval = interval
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self._previous = {}
+        self._previous_time = time.time()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        now = time.time()
+        values = self.registry.snapshot()
+        elapsed = max(now - self._previous_time, 1e-9)
+        for key, value in values.items():
+            if isinstance(value, dict):
+                before = self._previous.get(key, {'count': 0, 'sum': 0.0})
+                count = value['count'] - before['count']
+                value['rate'] = round(count / elapsed, 3)
+                if count > 0:
+                    value['mean_ms'] = round(1000 * (value['sum'] - before['sum']) / count, 3)
+        self._previous = {key: dict(value) for key, value in values.items() if isinstance(value, dict)}
+        self._previous_time = now
+
+        line = json.dumps({'ts': round(now, 3), 'metrics': values}, ensure_ascii=False)
+        stream = self.file or sys.stderr
+        stream.write(line + "\n")
+        stream.flush()
+
+    def close(self):
+        """Dừng và ghi dòng cuối cùng"""
+        self._stop_event.set()
+        self._thread.join(timeout=2)
+        self.write()
+        if self.file:
+            self.file.close()
+
+
+def install_profile_signal(seconds=10.0, path=None):
+    """
+    Lấy mẫu stack khi tiến trình nhận SIGUSR1 (chỉ POSIX, gọi từ main thread)
+
+    Ví dụ: kill -USR1 <pid>; kết quả ghi vào path (thêm thời điểm) hoặc stderr.
+
+    Returns:
+        True nếu đã đăng ký được
+    """
+    import signal
+
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+
+    def dump():
+        text = format_stacks(sample_stacks(seconds), 100)
+        if path:
+            target = f"{path}.{time.strftime('%Y%m%d-%H%M%S')}"
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(text)
+            print(f"Profile written to {target}", file=sys.stderr)
+        else:
+            sys.stderr.write(text)
+
+    def handler(signum, frame):
+        # Không lấy mẫu trong signal handler: main thread cũng cần được lấy mẫu
+        threading.Thread(target=dump, name="profile-dump", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, handler)
+    return True
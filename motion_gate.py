@@ -0,0 +1,137 @@
+import cv2
+
+
+class MotionGate:
+    """
+    Bộ lọc chuyển động rẻ chạy trước YOLO.
+
+    Frame được thu nhỏ và chuyển sang ảnh xám, sau đó so với frame trước
+    (frame differencing) hoặc với mô hình nền (background subtraction). ROI
+    nào có đủ pixel thay đổi thì coi là có chuyển động. Khi mọi ROI đứng yên,
+    pipeline dùng lại kết quả detect cũ thay vì chạy YOLO; khi chuyển động bắt
+    đầu thì detect ngay, không chờ hết skip frames.
+    """
+
+    def __init__(self, scale=0.25, method='diff', diff_threshold=25, min_area=0.005,
+                 refresh_interval=150):
+        """
+        Args:
+            scale: Tỉ lệ thu nhỏ frame trước khi so sánh
+            method: 'diff' (so với frame trước) hoặc 'mog2' (background subtraction)
+            diff_threshold: Độ chênh mức xám tối thiểu để coi một pixel là thay đổi
+            min_area: Tỉ lệ pixel thay đổi tối thiểu trong ROI để coi là có chuyển động
+            refresh_interval: Vẫn detect sau chừng này frame đứng yên (None = không bao giờ)
+        """
+        if method not in ('diff', 'mog2'):
+            raise ValueError(f"Unknown motion gate method: {method}")
+        self.scale = scale
+        self.method = method
+        self.diff_threshold = diff_threshold
+        self.min_area = min_area
+        self.refresh_interval = refresh_interval
+        self.reset()
+
+    def reset(self):
+        """Xóa frame nền và thống kê (khi mở video mới/seek)"""
+        self.previous = None
+        self.subtractor = None
+        if self.method == 'mog2':
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=200, varThreshold=self.diff_threshold, detectShadows=False
+            )
+        self.moving = True
+        self.last_detect_frame = None
+        self.last_due_frame = None
+
+        self.frames = 0
+        self.static_frames = 0
+        self.skipped_inferences = 0
+        self.motion_starts = 0
+        self.roi_stats = {}
+
+    def _changed_mask(self, frame):
+        """Mask (uint8) các pixel thay đổi trên frame đã thu nhỏ"""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self.subtractor is not None:
+            return self.subtractor.apply(gray)
+
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return None
+        _, mask = cv2.threshold(cv2.absdiff(gray, previous), self.diff_threshold, 255, cv2.THRESH_BINARY)
+        return mask
+
+    def update(self, frame, rois):
+        """
+        Cập nhật với frame mới
+
+        Args:
+            frame: Frame BGR (chưa vẽ)
+            rois: {roi_id: (x1, y1, x2, y2)}; rỗng = xét cả frame
+
+        Returns:
+            True nếu có chuyển động trong ít nhất một ROI
+        """
+        mask = self._changed_mask(frame)
+        if mask is None:
+            return True
+
+        if not rois:
+            rois = {None: (0, 0, frame.shape[1], frame.shape[0])}
+        moving = False
+        for roi_id, (x1, y1, x2, y2) in rois.items():
+            region = mask[int(y1 * self.scale):int(y2 * self.scale) + 1,
+                          int(x1 * self.scale):int(x2 * self.scale) + 1]
+            roi_moving = region.size > 0 and cv2.countNonZero(region) >= self.min_area * region.size
+            stats = self.roi_stats.setdefault(roi_id, {'frames': 0, 'motion_frames': 0})
+            stats['frames'] += 1
+            if roi_moving:
+                stats['motion_frames'] += 1
+                moving = True
+        return moving
+
+    def decide(self, frame, rois, frame_idx, detect_skip_frames):
+        """
+        Quyết định có chạy YOLO cho frame này không
+
+        Returns:
+            (run, force): run=False thì dùng lại kết quả detect cũ;
+            force=True khi chuyển động vừa bắt đầu (detect ngay, bỏ qua skip frames)
+        """
+        moving = self.update(frame, rois)
+        started = moving and not self.moving
+        self.moving = moving
+        self.frames += 1
+
+        if started:
+            self.motion_starts += 1
+            return True, True
+        if moving:
+            return True, False
+        if self.last_detect_frame is None or (
+                self.refresh_interval is not None
+                and frame_idx - self.last_detect_frame >= self.refresh_interval):
+            return True, False
+
+        self.static_frames += 1
+        # Chỉ tính là bỏ qua một lần detect khi frame này lẽ ra phải detect
+        if frame_idx - self.last_due_frame >= detect_skip_frames:
+            self.skipped_inferences += 1
+            self.last_due_frame = frame_idx
+        return False, False
+
+    def detected(self, frame_idx):
+        """Báo cho gate biết YOLO vừa chạy ở frame_idx"""
+        self.last_detect_frame = frame_idx
+        self.last_due_frame = frame_idx
+
+    def stats(self):
+        """Thống kê số frame đứng yên và số lần detect đã bỏ qua"""
+        return {
+            'frames': self.frames,
+            'static_frames': self.static_frames,
+            'skipped_inferences': self.skipped_inferences,
+            'motion_starts': self.motion_starts,
+            'rois': {str(roi_id): dict(stats) for roi_id, stats in self.roi_stats.items()}
+        }
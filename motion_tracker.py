@@ -0,0 +1,244 @@
+from collections import deque
+
+import numpy as np
+
+from tracker import assign, box_iou_matrix
+
+
+class KalmanBoxFilter:
+    """
+    Kalman filter vận tốc không đổi cho một bounding box.
+    Trạng thái: [cx, cy, w, h, vx, vy, vw, vh] (vận tốc tính theo pixel/frame)
+    """
+
+    std_weight_position = 1.0 / 20
+    std_weight_velocity = 1.0 / 160
+    _H = np.eye(4, 8)
+
+    def __init__(self, box):
+        x1, y1, x2, y2 = box
+        w, h = max(x2 - x1, 1.0), max(y2 - y1, 1.0)
+        self.mean = np.array([(x1 + x2) / 2, (y1 + y2) / 2, w, h, 0, 0, 0, 0], dtype=np.float64)
+        std = np.array([
+            2 * self.std_weight_position * h, 2 * self.std_weight_position * h,
+            2 * self.std_weight_position * h, 2 * self.std_weight_position * h,
+            10 * self.std_weight_velocity * h, 10 * self.std_weight_velocity * h,
+            10 * self.std_weight_velocity * h, 10 * self.std_weight_velocity * h
+        ])
+        self.covariance = np.diag(std ** 2)
+
+    def predict(self, dt=1):
+        """Dự đoán trạng thái sau dt frame"""
+        if dt <= 0:
+            return
+        h = self.mean[3]
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        std = np.array([
+            self.std_weight_position * h, self.std_weight_position * h,
+            self.std_weight_position * h, self.std_weight_position * h,
+            self.std_weight_velocity * h, self.std_weight_velocity * h,
+            self.std_weight_velocity * h, self.std_weight_velocity * h
+        ])
+        Q = np.diag(std ** 2) * dt
+        self.mean = F @ self.mean
+        self.covariance = F @ self.covariance @ F.T + Q
+        self.mean[2:4] = np.maximum(self.mean[2:4], 1.0)
+
+    def update(self, box):
+        """Cập nhật trạng thái với box quan sát được"""
+        x1, y1, x2, y2 = box
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, max(x2 - x1, 1.0), max(y2 - y1, 1.0)])
+        h = self.mean[3]
+        R = np.diag(np.array([self.std_weight_position * h] * 4) ** 2)
+        S = self._H @ self.covariance @ self._H.T + R
+        K = np.linalg.solve(S, self._H @ self.covariance).T
+        self.mean = self.mean + K @ (z - self._H @ self.mean)
+        self.covariance = self.covariance - K @ S @ K.T
+
+    @property
+    def box(self):
+        """Box hiện tại dạng (x1, y1, x2, y2)"""
+        cx, cy, w, h = self.mean[:4]
+        return (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+
+
+class MotionTrack:
+    """Trạng thái của một track có mô hình chuyển động"""
+
+    __slots__ = ('id', 'kf', 'history', 'score', 'last_update', 'lost')
+
+    def __init__(self, track_id, box, score, frame_idx, max_history):
+        self.id = track_id
+        self.kf = KalmanBoxFilter(box)
+        self.history = deque(maxlen=max_history)
+        self.score = score
+        self.last_update = frame_idx
+        self.lost = False
+
+    def int_box(self):
+        x1, y1, x2, y2 = self.kf.box
+        return [int(x1), int(y1), int(x2), int(y2)]
+
+
+class MotionTracker:
+    """
+    Tracker kiểu ByteTrack: Kalman filter vận tốc không đổi và ghép cặp hai lượt.
+
+    - Frame có detect: dự đoán vị trí mọi track, ghép detection confidence cao
+      trước, sau đó dùng detection confidence thấp để giữ các track còn lại.
+      Detection confidence thấp không bao giờ tạo track mới.
+    - Frame bị skip (không detect): predict() trả về vị trí dự đoán của các track
+      thay vì box cũ đứng yên.
+    """
+
+    uses_scores = True
+
+    def __init__(self, max_distance=100, max_history=30, max_age=30,
+                 high_conf=0.4, min_iou=0.2, low_min_iou=0.5):
+        """
+        Args:
+            max_distance: Khoảng cách tâm tối đa khi box dự đoán và detection không chồng nhau
+            max_history: Số điểm lịch sử tối đa lưu cho mỗi track
+            max_age: Số frame tối đa một track được giữ khi không khớp detection nào
+            high_conf: Ngưỡng confidence mặc định của detection "cao" (tạo được track mới)
+            min_iou: IoU tối thiểu ở lượt ghép thứ nhất
+            low_min_iou: IoU tối thiểu ở lượt ghép detection confidence thấp
+        """
+        self.tracks = {}
+        self.id_count = 0
+        self.frame_idx = 0
+        self.max_distance = max_distance
+        self.max_history = max_history
+        self.max_age = max_age
+        self.high_conf = high_conf
+        self.min_iou = min_iou
+        self.low_min_iou = low_min_iou
+
+    @property
+    def track_history(self):
+        """Lịch sử tâm của các track đang hoạt động {id: [(cx, cy), ...]}"""
+        return {track_id: list(track.history) for track_id, track in self.tracks.items()}
+
+    def _advance(self, frame_idx):
+        """Dự đoán mọi track đến frame_idx (mặc định frame tiếp theo)"""
+        if frame_idx is None:
+            frame_idx = self.frame_idx + 1
+        dt = frame_idx - self.frame_idx
+        if dt < 0:
+            # Tua lùi: bỏ các track được cập nhật sau frame_idx để chúng không
+            # chiếm detection mới và tuổi của các track còn lại không bị âm
+            self.tracks = {track_id: track for track_id, track in self.tracks.items()
+                           if track.last_update <= frame_idx}
+        for track in self.tracks.values():
+            track.kf.predict(dt)
+        self.frame_idx = frame_idx
+
+    def _cost(self, rects, tracks, min_iou, use_distance):
+        """
+        Ma trận cost (detections x tracks) và ngưỡng cost tối đa.
+        Cặp có IoU >= min_iou: cost = 1 - IoU (< 1).
+        Cặp không đủ IoU nhưng tâm gần (use_distance): cost trong [1, 1.5).
+        """
+        track_boxes = np.array([track.kf.box for track in tracks], dtype=np.float64)
+        iou = box_iou_matrix(rects, track_boxes)
+        cost = np.full(iou.shape, 2.0)
+        overlap = iou >= min_iou
+        cost[overlap] = 1.0 - iou[overlap]
+
+        if use_distance:
+            centers = (rects[:, :2] + rects[:, 2:]) / 2.0
+            track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2.0
+            diff = centers[:, None, :] - track_centers[None, :, :]
+            distance = np.hypot(diff[..., 0], diff[..., 1])
+            near = ~overlap & (distance < self.max_distance)
+            cost[near] = 1.0 + 0.5 * distance[near] / self.max_distance
+        return cost, 1.5
+
+    def predict(self, frame_idx=None):
+        """
+        Dự đoán vị trí các track cho frame không detect
+
+        Returns:
+            [[x1, y1, x2, y2, id], ...] của các track chưa bị mất
+        """
+        self._advance(frame_idx)
+        results = []
+        for track in self.tracks.values():
+            if track.lost:
+                continue
+            box = track.int_box()
+            track.history.append(((box[0] + box[2]) // 2, (box[1] + box[3]) // 2))
+            results.append(box + [track.id])
+        return results
+
+    def update(self, objects_rect, scores=None, high_threshold=None, frame_idx=None):
+        """
+        Cập nhật tracker với detection của frame mới
+
+        Args:
+            objects_rect: [(x1, y1, x2, y2), ...]
+            scores: Confidence của từng box (None = coi tất cả là confidence cao)
+            high_threshold: Ngưỡng confidence cao (None = self.high_conf)
+            frame_idx: Số frame hiện tại (None = frame tiếp theo)
+
+        Returns:
+            List cùng độ dài objects_rect: [x1, y1, x2, y2, id] hoặc None với
+            detection confidence thấp không khớp track nào
+        """
+        self._advance(frame_idx)
+        high_threshold = self.high_conf if high_threshold is None else high_threshold
+
+        rects = np.asarray(objects_rect, dtype=np.float64).reshape(-1, 4)
+        scores = np.ones(len(rects)) if scores is None else np.asarray(scores, dtype=np.float64)
+        high_idx = np.nonzero(scores >= high_threshold)[0]
+        low_idx = np.nonzero(scores < high_threshold)[0]
+
+        assigned = [None] * len(rects)
+        tracks = list(self.tracks.values())
+
+        # Lượt 1: detection confidence cao với mọi track
+        remaining = tracks
+        if len(high_idx) and tracks:
+            cost, max_cost = self._cost(rects[high_idx], tracks, self.min_iou, True)
+            matched_cols = set()
+            for row, col in assign(cost, max_cost):
+                assigned[high_idx[row]] = tracks[col]
+                matched_cols.add(col)
+            remaining = [track for col, track in enumerate(tracks) if col not in matched_cols]
+
+        # Lượt 2: detection confidence thấp chỉ với các track chưa khớp
+        if len(low_idx) and remaining:
+            cost, max_cost = self._cost(rects[low_idx], remaining, self.low_min_iou, False)
+            for row, col in assign(cost, max_cost):
+                assigned[low_idx[row]] = remaining[col]
+
+        results = []
+        matched_ids = set()
+        for i, (rect, track) in enumerate(zip(objects_rect, assigned)):
+            if track is None:
+                if scores[i] < high_threshold:
+                    results.append(None)
+                    continue
+                track = MotionTrack(self.id_count, rect, scores[i], self.frame_idx, self.max_history)
+                self.tracks[track.id] = track
+                self.id_count += 1
+            else:
+                track.kf.update(rect)
+
+            x1, y1, x2, y2 = rect
+            track.score = float(scores[i])
+            track.last_update = self.frame_idx
+            track.lost = False
+            track.history.append(((x1 + x2) // 2, (y1 + y2) // 2))
+            matched_ids.add(track.id)
+            results.append([x1, y1, x2, y2, track.id])
+
+        for track in tracks:
+            if track.id in matched_ids:
+                continue
+            track.lost = True
+            if self.frame_idx - track.last_update > self.max_age:
+                del self.tracks[track.id]
+
+        return results
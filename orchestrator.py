@@ -0,0 +1,165 @@
+"""
+Chia nhiều video/camera stream cho một pool tiến trình.
+
+Mỗi worker tự load model YOLO của mình và giới hạn số thread tính toán,
+kết quả từng file được ghi vào journal (JSON Lines) ngay khi xong để có thể
+chạy tiếp sau khi bị crash.
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+
+_worker_state = {}
+
+
+def _init_worker(detector_kwargs, run_kwargs, threads):
+    """Khởi tạo worker: giới hạn thread và load model một lần cho mỗi tiến trình"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from detector import VehicleDetector
+    _worker_state['detector'] = VehicleDetector(**{'num_threads': threads, **detector_kwargs})
+    _worker_state['run_kwargs'] = run_kwargs
+
+
+def _run_job(video_path):
+    """Xử lý một video trong worker, lỗi được trả về thay vì raise"""
+    from batch import process_video
+
+    start_time = time.perf_counter()
+    try:
+        result = process_video(video_path, _worker_state['detector'], **_worker_state['run_kwargs'])
+        return {'video': video_path, 'ok': True, 'result': result}
+    except Exception as e:
+        return {
+            'video': video_path,
+            'ok': False,
+            'error': f"{type(e).__name__}: {e}",
+            'traceback': traceback.format_exc(),
+            'elapsed': round(time.perf_counter() - start_time, 3)
+        }
+
+
+class Journal:
+    """File JSON Lines ghi lại kết quả từng video đã xử lý"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Đọc journal, trả về {video: record} (record sau ghi đè record trước)"""
+        records = {}
+        if not self.path or not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Dòng cuối có thể bị ghi dở khi crash
+                    continue
+                records[record['video']] = record
+        return records
+
+    def append(self, record):
+        if not self.path:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def print_progress(done, total, record):
+    """Callback tiến độ mặc định, in ra stderr"""
+    if record['ok']:
+        result = record['result']
+        status = f"ok {result['frames']} frames in {result['elapsed']}s"
+    else:
+        status = f"FAILED {record['error']}"
+    print(f"[{done}/{total}] {record['video']}: {status}", file=sys.stderr)
+
+
+def run_parallel(video_paths, detector_kwargs, run_kwargs, workers=None,
+                 threads_per_worker=None, journal_path=None, retry_failed=True,
+                 progress=print_progress):
+    """
+    Xử lý nhiều video song song trên nhiều tiến trình
+
+    Args:
+        video_paths: Danh sách file video hoặc URL stream
+        detector_kwargs: Tham số khởi tạo VehicleDetector cho mỗi worker
+        run_kwargs: Tham số truyền cho batch.process_video
+        workers: Số tiến trình (mặc định = số CPU)
+        threads_per_worker: Số thread tính toán mỗi worker (mặc định chia đều CPU)
+        journal_path: File journal để chạy tiếp sau crash (None = không dùng)
+        retry_failed: Khi chạy tiếp, xử lý lại các file đã lỗi lần trước
+        progress: Callback progress(done, total, record)
+
+    Returns:
+        (results, failures): kết quả các video thành công và danh sách lỗi
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = workers or cpu_count
+    threads_per_worker = threads_per_worker or max(1, cpu_count // workers)
+
+    journal = Journal(journal_path)
+    records = journal.load()
+    pending = []
+    for video_path in video_paths:
+        record = records.get(video_path)
+        if record and (record['ok'] or not retry_failed):
+            continue
+        if video_path not in pending:
+            pending.append(video_path)
+
+    total = len(pending)
+    done = 0
+    if pending:
+        # spawn để mỗi worker có runtime sạch (fork sau khi torch đã tạo thread dễ bị treo)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, total), mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(detector_kwargs, run_kwargs, threads_per_worker)) as executor:
+            futures = {executor.submit(_run_job, video_path): video_path for video_path in pending}
+            for future in as_completed(futures):
+                video_path = futures[future]
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    record = {'video': video_path, 'ok': False,
+                              'error': f"Worker crashed: {e}"}
+                journal.append(record)
+                records[video_path] = record
+                done += 1
+                if progress:
+                    progress(done, total, record)
+
+    results = []
+    failures = []
+    for video_path in video_paths:
+        record = records.get(video_path)
+        if record is None:
+            continue
+        if record['ok']:
+            results.append(record['result'])
+        else:
+            failures.append({'video': video_path, 'error': record['error']})
+    return results, failures
@@ -0,0 +1,644 @@
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from coords import scale_distance
+from video_source import LRUCache
+from stream_source import LatencyMeter
+
+
+DROP_OLDEST = "drop_oldest"  # Bỏ frame cũ nhất khi hàng đợi đầy (xem trực tiếp)
+BLOCK = "block"              # Chờ cho đến khi hàng đợi có chỗ (đếm offline)
+
+_END = object()  # Đánh dấu hết video
+
+
+def draw_roi_overlay(frame, rois, lines=None, line_counts=None):
+    """
+    Vẽ lớp phủ xanh và nhãn của các ROI/zone lên frame, cùng các vạch đếm
+
+    Args:
+        lines: {line_id: CountLine} (ROIManager.lines.lines)
+        line_counts: {line_id: {'in': {...}, 'out': {...}}} để ghi số lượt trên nhãn vạch
+    """
+    if rois:
+        overlay = frame.copy()
+        for roi_id, roi_data in rois.items():
+            x1, y1, x2, y2 = roi_data['coords']
+            if 'polygon' in roi_data:
+                cv2.fillPoly(overlay, [np.array(roi_data['polygon'], np.int32)], (0, 255, 0))
+            else:
+                cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 255, 0), -1)
+        cv2.addWeighted(overlay, 0.2, frame, 0.8, 0, frame)
+
+        for roi_id, roi_data in rois.items():
+            x1, y1, x2, y2 = roi_data['coords']
+            color = ((roi_id * 50) % 255, (roi_id * 80) % 255, (roi_id * 120) % 255)
+            if 'polygon' in roi_data:
+                cv2.polylines(frame, [np.array(roi_data['polygon'], np.int32)], True, color, 1)
+            else:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
+            cv2.putText(frame, f"ROI {roi_id}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_COMPLEX, 0.6, color, 2)
+
+    for line_id, line in (lines or {}).items():
+        cv2.line(frame, line.p1, line.p2, (0, 0, 255), 2)
+        # Mũi tên ở giữa vạch chỉ hướng 'in' (sang bên phải của p1 -> p2)
+        mx, my = (line.p1[0] + line.p2[0]) // 2, (line.p1[1] + line.p2[1]) // 2
+        length = max(np.hypot(line.dx, line.dy), 1)
+        tip = (int(mx - line.dy * 20 / length), int(my + line.dx * 20 / length))
+        cv2.arrowedLine(frame, (mx, my), tip, (0, 0, 255), 1, tipLength=0.4)
+        label = f"L{line_id}"
+        counts = (line_counts or {}).get(line_id)
+        if counts:
+            label += f" in:{sum(counts['in'].values())} out:{sum(counts['out'].values())}"
+        cv2.putText(frame, label, (line.p1[0], line.p1[1] - 10),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.6, (0, 0, 255), 2)
+    return frame
+
+
+class FrameQueue:
+    """Hàng đợi có giới hạn giữa hai stage, kèm drop policy"""
+
+    def __init__(self, maxsize=2, drop_policy=DROP_OLDEST):
+        """
+        Args:
+            maxsize: Số phần tử tối đa trong hàng đợi
+            drop_policy: DROP_OLDEST hoặc BLOCK
+        """
+        if drop_policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+
+    def put(self, item, stop_event):
+        """Đưa phần tử vào hàng đợi, trả về False nếu pipeline đã dừng"""
+        if self.drop_policy == BLOCK or item is _END:
+            while not stop_event.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, stop_event):
+        """Lấy phần tử, trả về None nếu pipeline đã dừng"""
+        while not stop_event.is_set():
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def get_many(self, max_items):
+        """Lấy thêm tối đa max_items phần tử đang có sẵn, không chờ"""
+        items = []
+        while len(items) < max_items:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def clear(self):
+        """Xóa toàn bộ phần tử đang chờ"""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+class FramePipeline:
+    """
+    Pipeline xử lý video gồm 3 stage chạy trên các thread riêng:
+    decode -> inference -> tracking/annotation, nối với nhau bằng FrameQueue.
+
+    Frame đã xử lý xong được trả về qua callback on_frame(frame, frame_idx),
+    callback này được gọi từ thread của stage cuối.
+    """
+
+    def __init__(self, source, detector, roi_manager, vehicle_processor,
+                 frame_size=None, detect_skip_frames=2,
+                 drop_policy=DROP_OLDEST, queue_size=2, realtime=True,
+                 annotate=True, batcher=None, source_id=0, roi_detect=False,
+                 motion_gate=None, controller=None, frame_cache_size=32, result_cache_size=512,
+                 detection_cache=None, metrics=None, tiling=None, on_frame=None, on_finished=None):
+        """
+        Args:
+            source: VideoSource đã mở (video_source.open_source), trả frame ở kích thước làm việc
+            detector: VehicleDetector (có thể None nếu chưa khởi tạo được)
+            roi_manager: ROIManager
+            vehicle_processor: VehicleProcessor
+            frame_size: Kích thước frame làm việc (width, height) (None = source.frame_size);
+                khi frame decode có kích thước khác (luồng trực tiếp chưa có frame, camera
+                đổi độ phân giải), ROI và ngưỡng tracker được đổi theo kích thước mới
+            detect_skip_frames: Số frames bỏ qua giữa các lần detect
+            drop_policy: DROP_OLDEST cho xem trực tiếp, BLOCK cho đếm offline
+            queue_size: Kích thước mỗi hàng đợi giữa các stage
+            realtime: Giữ nhịp theo FPS của video (False = chạy nhanh nhất có thể)
+            annotate: Vẽ ROI và kết quả lên frame (False khi chạy headless)
+            batcher: MicroBatcher dùng chung để detect theo batch (None = detect từng frame)
+            source_id: ID của nguồn video khi dùng chung batcher với pipeline khác
+            roi_detect: Chỉ detect phần ảnh quanh các ROI thay vì cả frame
+            motion_gate: MotionGate bỏ qua YOLO khi các ROI đứng yên (None = luôn detect)
+            controller: AdaptiveController tự chỉnh skip frames và imgsz theo độ trễ
+                (chỉ dùng khi detect từng frame, không dùng với batcher)
+            frame_cache_size: Số frame seek gần nhất giữ lại để tua qua lại không phải decode lại
+            result_cache_size: Số kết quả detect gần nhất giữ lại để tua không phải detect lại
+            detection_cache: detection_cache.VideoDetections của video, lưu kết quả thô
+                trên đĩa để lần chạy sau không phải detect lại (None = không dùng)
+            metrics: metrics.MetricsRegistry nhận thời gian từng stage, độ sâu hàng đợi,
+                frame bị bỏ, số track, ... (None = không đo)
+            tiling: Tham số VehicleDetector.tile_plan (dict: tile_size, overlap, global_pass,
+                padding) để detect các tile chồng nhau quanh ROI trên frame gốc chưa thu nhỏ
+                (None = detect trên frame làm việc)
+            on_frame: Callback nhận frame đã xử lý xong
+            on_finished: Callback khi hết video
+        """
+        self.source = source
+        self.detector = detector
+        self.roi_manager = roi_manager
+        self.vehicle_processor = vehicle_processor
+        self.frame_width, self.frame_height = frame_size or source.frame_size or roi_manager.frame_size
+        roi_manager.set_frame_size((self.frame_width, self.frame_height))
+        self.region_padding = scale_distance(32, (self.frame_width, self.frame_height))
+        self.detect_skip_frames = detect_skip_frames
+        self.realtime = realtime
+        self.annotate = annotate
+        self.batcher = batcher
+        self.source_id = source_id
+        self.roi_detect = roi_detect
+        self.motion_gate = motion_gate
+        if controller is not None and batcher is not None:
+            raise ValueError("Adaptive control cannot be used with a shared batcher")
+        self.controller = controller
+        self.detection_cache = detection_cache
+        self.metrics = metrics
+        self.tiling = dict(tiling) if tiling is not None else None
+        if self.tiling is not None and source is not None:
+            source.keep_native = True
+        self.on_frame = on_frame
+        self.on_finished = on_finished
+
+        # Khóa trạng thái dùng chung (ROI, vehicles) giữa GUI và pipeline
+        self.lock = threading.RLock()
+        self.target_classes = []
+
+        self.decode_queue = FrameQueue(queue_size, drop_policy)
+        self.result_queue = FrameQueue(queue_size, drop_policy)
+
+        # Frame (bản sao chưa vẽ) và kết quả detect theo số frame, dùng khi seek
+        self.frame_cache = LRUCache(frame_cache_size)
+        self.result_cache = LRUCache(result_cache_size)
+        self._resume_from = None
+
+        fps = source.fps if source else 0
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 0.03
+        # Độ trễ từ lúc nhận frame từ camera đến lúc trả frame đã xử lý (chỉ nguồn trực tiếp)
+        self.latency = LatencyMeter() if source is not None and source.is_live else None
+
+        self.current_frame = 0
+        self._seek_to = None
+        self._seek_lock = threading.Lock()
+        # Decode thread đã gửi _END (được đặt dưới _seek_lock cùng lúc kiểm tra _seek_to)
+        self._decode_finished = False
+        self._stop_event = threading.Event()
+        # Dừng riêng decode thread khi inference lỗi (stop() cũng đặt event này)
+        self._decode_stop = threading.Event()
+        # Lỗi làm inference thread dừng, wait() ném lại
+        self.error = None
+        self._play_event = threading.Event()
+        self._threads = []
+
+        # Chỉ đo thời gian từng stage khi có controller hoặc metrics
+        self._timed = controller is not None or metrics is not None
+        if metrics is not None:
+            self._metrics_source = str(source_id)
+            self._stage_seconds = metrics.histogram(
+                'pipeline_stage_seconds', "Time per stage run", ('source', 'stage'))
+            self._frames_total = metrics.counter(
+                'pipeline_frames_total', "Frames that finished the last stage", ('source',))
+            self._inferences_total = metrics.counter(
+                'pipeline_inferences_total', "Frames that ran object detection", ('source',))
+            self._latency_seconds = metrics.histogram(
+                'pipeline_latency_seconds', "Camera capture to processed frame (live sources)", ('source',))
+            metrics.add_collector(self._collect_metrics)
+
+    def _record(self, stage, seconds):
+        """Ghi độ trễ của một lần chạy stage cho controller và metrics"""
+        if self.controller and stage in ('decode', 'inference', 'annotate'):
+            self.controller.record(stage, seconds)
+        if self.metrics is not None:
+            self._stage_seconds.observe(seconds, self._metrics_source, stage)
+
+    def _collect_metrics(self):
+        """Số liệu đọc từ trạng thái hiện tại, chỉ gọi khi metrics được xuất"""
+        if not self._threads:
+            return []
+        labels = {'source': self._metrics_source}
+        samples = [
+            ('pipeline_queue_depth', 'gauge', "Items waiting between stages",
+             {**labels, 'queue': 'decode'}, self.decode_queue.qsize()),
+            ('pipeline_queue_depth', 'gauge', "Items waiting between stages",
+             {**labels, 'queue': 'result'}, self.result_queue.qsize()),
+            ('pipeline_dropped_frames_total', 'counter', "Frames dropped because a queue was full",
+             labels, self.dropped_frames),
+            ('pipeline_current_frame', 'gauge', "Last decoded frame number", labels, self.current_frame),
+            ('pipeline_detect_skip_frames', 'gauge', "Frames between detections", labels, self.detect_skip_frames),
+            ('tracker_active_tracks', 'gauge', "Tracks kept by the tracker",
+             labels, len(self.roi_manager.tracker.tracks)),
+            ('vehicle_pending_snapshots', 'gauge', "Tracks with a best crop not yet written",
+             labels, len(self.vehicle_processor.best_crops)),
+            ('vehicle_evicted_records_total', 'counter', "Vehicle records moved out of memory",
+             labels, self.vehicle_processor.evicted_total)
+        ]
+        if self.detector:
+            samples.append(('detector_imgsz', 'gauge', "Detection input size", labels, self.detector.detect_imgsz))
+        if self.motion_gate:
+            samples.append(('pipeline_skipped_inferences_total', 'counter',
+                            "Detections skipped because no ROI moved", labels,
+                            self.motion_gate.skipped_inferences))
+        writer = self.vehicle_processor.snapshot_writer
+        if writer:
+            stats = writer.stats()
+            samples += [
+                ('snapshot_queue_depth', 'gauge', "Snapshots waiting to be written", labels, stats['queue_depth']),
+                ('snapshot_written_total', 'counter', "Snapshots written", labels, stats['written']),
+                ('snapshot_dropped_total', 'counter', "Snapshots dropped because the queue was full",
+                 labels, stats['dropped'])
+            ]
+        if self.detection_cache:
+            stats = self.detection_cache.stats()
+            samples += [
+                ('detection_cache_hits_total', 'counter', "Frames read from the detection cache", labels, stats['hits']),
+                ('detection_cache_misses_total', 'counter', "Frames missing from the detection cache",
+                 labels, stats['misses'])
+            ]
+        if self.source.is_live:
+            stats = self.source.stats()
+            samples += [
+                ('stream_connected', 'gauge', "1 while the stream is delivering frames",
+                 labels, 1 if stats['state'] == 'streaming' else 0),
+                ('stream_reconnects_total', 'counter', "Stream reconnect attempts", labels, stats['reconnects']),
+                ('stream_stale_dropped_total', 'counter', "Camera frames replaced before being processed",
+                 labels, stats['stale_dropped'])
+            ]
+        return samples
+
+    @property
+    def dropped_frames(self):
+        """Tổng số frame bị bỏ do hàng đợi đầy"""
+        return self.decode_queue.dropped + self.result_queue.dropped
+
+    def set_target_classes(self, target_classes):
+        """Cập nhật loại phương tiện cần detect (gọi từ GUI thread)"""
+        self.target_classes = list(target_classes)
+        self.result_cache.clear()
+
+    def start(self, playing=True):
+        """Khởi động các thread của pipeline"""
+        self._stop_event.clear()
+        self._decode_stop.clear()
+        self._decode_finished = False
+        self.error = None
+        if playing:
+            self._play_event.set()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, name="decode", daemon=True),
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+            threading.Thread(target=self._annotate_loop, name="annotate", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Dừng pipeline và chờ các thread kết thúc"""
+        self._stop_event.set()
+        self._decode_stop.set()
+        self._play_event.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+    def wait(self):
+        """Chờ pipeline xử lý hết video, ném lại lỗi của inference thread nếu có"""
+        for thread in self._threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def pause(self):
+        self._play_event.clear()
+
+    def resume(self):
+        self._play_event.set()
+
+    def is_playing(self):
+        return self._play_event.is_set()
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def seek(self, frame_id):
+        """Yêu cầu decode thread nhảy đến frame_id (kể cả khi đang pause)"""
+        with self._seek_lock:
+            self._seek_to = frame_id
+            decoding = (not self._decode_finished and bool(self._threads)
+                        and self._threads[0].is_alive())
+        if not decoding:
+            # Decode đã hết video (_END có thể còn trên đường tới annotate): dừng các
+            # stage còn lại và khởi động lại ở trạng thái pause, giữ yêu cầu seek
+            self.stop()
+            self._play_event.clear()
+            self.start(playing=False)
+            return
+        # Decode thread sẽ thấy _seek_to trước khi gửi _END nên hàng đợi chưa có _END
+        self.decode_queue.clear()
+        self.result_queue.clear()
+
+    def _take_seek(self):
+        with self._seek_lock:
+            frame_id, self._seek_to = self._seek_to, None
+        return frame_id
+
+    def _decode_loop(self):
+        """Stage 1: đọc frame ở kích thước làm việc"""
+        next_deadline = time.perf_counter()
+        while not self._decode_stop.is_set():
+            seek_to = self._take_seek()
+            force = False
+            if seek_to is not None:
+                force = True
+                seek_to = max(seek_to, 1)
+                cached = self.frame_cache.get(seek_to)
+                if cached is not None:
+                    # Tua lại frame vừa xem: không decode, nguồn được seek khi phát tiếp
+                    self.current_frame = seek_to
+                    self._resume_from = seek_to
+                    if not self.decode_queue.put((seek_to, cached.copy(), force, None), self._decode_stop):
+                        return
+                    continue
+                # Frame số n (đánh số từ 1) có chỉ số n - 1 trong nguồn
+                self.source.seek(max(seek_to - 1, 0))
+                self._resume_from = None
+            elif not self._play_event.wait(timeout=0.05):
+                continue
+            elif self._resume_from is not None:
+                self.source.seek(self._resume_from)
+                self._resume_from = None
+
+            start_time = time.perf_counter()
+            ret, frame = self.source.read(self._decode_stop)
+            if not ret:
+                if seek_to is not None:
+                    continue
+                with self._seek_lock:
+                    if self._seek_to is not None:
+                        # seek() đến trong lúc đọc: xử lý seek thay vì kết thúc
+                        continue
+                    self._decode_finished = True
+                self.decode_queue.put(_END, self._decode_stop)
+                return
+
+            self.current_frame = self.source.position
+            if frame.shape[1] != self.frame_width or frame.shape[0] != self.frame_height:
+                self._set_frame_size((frame.shape[1], frame.shape[0]))
+            if force:
+                self.frame_cache.put(self.current_frame, frame.copy())
+            if self._timed:
+                self._record('decode', time.perf_counter() - start_time)
+
+            native = self.source.native_frame if self.tiling is not None else None
+            if not self.decode_queue.put((self.current_frame, frame, force, native), self._decode_stop):
+                return
+
+            # Nguồn trực tiếp tự giữ nhịp theo camera
+            if self.realtime and not force and not self.source.is_live:
+                next_deadline += self.frame_interval
+                delay = next_deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_deadline = time.perf_counter()
+
+    def _set_frame_size(self, frame_size):
+        """Đổi kích thước frame làm việc: tọa độ pixel của ROI, ngưỡng tracker, lề vùng detect"""
+        with self.lock:
+            self.frame_width, self.frame_height = frame_size
+            self.roi_manager.set_frame_size(frame_size)
+            self.region_padding = scale_distance(32, frame_size)
+            self.frame_cache.clear()
+
+    def _regions(self, native=None):
+        """Vùng ảnh cần detect theo các ROI hiện tại (None = cả frame)"""
+        tiled = self.tiling is not None and native is not None
+        if not self.detector or not (self.roi_detect or tiled):
+            return None
+        with self.lock:
+            padding = self.region_padding
+            roi_coords = list(self.roi_manager.watch_areas(padding).values())
+            frame_size = (self.frame_width, self.frame_height)
+        if tiled:
+            tiling = {'padding': padding, **self.tiling}
+            plan = self.detector.tile_plan(roi_coords, (native.shape[1], native.shape[0]),
+                                           frame_size, **tiling)
+            return plan.bind(native)
+        return self.detector.region_plan(roi_coords, frame_size, padding)
+
+    def _gate(self, frame, frame_idx, force):
+        """(run, force) theo motion gate; frame seek luôn được detect"""
+        if not self.motion_gate or force:
+            return True, force
+        with self.lock:
+            rois = self.roi_manager.watch_areas(self.region_padding)
+        return self.motion_gate.decide(frame, rois, frame_idx, self.detect_skip_frames)
+
+    def _inference_loop(self):
+        """
+        Stage 2: chạy YOLO detect
+
+        Lỗi khi detect dừng pipeline: lỗi được giữ ở self.error, decode thread
+        dừng và annotate vẫn nhận _END để kết thúc bình thường.
+        """
+        try:
+            if self.batcher:
+                self._batched_inference_loop()
+            else:
+                self._detect_loop()
+        except Exception as e:
+            self.error = e
+            self._decode_stop.set()
+            if self.metrics is not None:
+                self.metrics.error('inference')
+            print(f"Inference failed for source {self.source_id}: {e!r}", file=sys.stderr)
+        finally:
+            # Không thêm gì nếu pipeline đã dừng
+            self.result_queue.put(_END, self._stop_event)
+
+    def _detect_loop(self):
+        """Stage 2 khi detect từng frame, kết thúc khi gặp _END"""
+        while not self._stop_event.is_set():
+            item = self.decode_queue.get(self._stop_event)
+            if item is None or item is _END:
+                return
+
+            frame_idx, frame, force, native = item
+            vehicle_boxes = []
+            fresh = True
+            cached = self.result_cache.get(frame_idx) if force else None
+            if cached is not None:
+                # Tua lại frame đã detect: dùng lại kết quả
+                vehicle_boxes = cached
+                if self.detector:
+                    self.detector.use_cached(cached, frame_idx)
+            elif self.detector:
+                run, detect_now = self._gate(frame, frame_idx, force)
+                if run:
+                    start_time = time.perf_counter()
+                    vehicle_boxes = self.detector.detect(
+                        frame, self.target_classes, frame_idx,
+                        self.detect_skip_frames, force=detect_now, regions=self._regions(native),
+                        cache=self.detection_cache
+                    )
+                    fresh = self.detector.last_detect_frame == frame_idx
+                    if fresh:
+                        self.result_cache.put(frame_idx, vehicle_boxes)
+                    if fresh and self.motion_gate:
+                        self.motion_gate.detected(frame_idx)
+                    if fresh and self._timed:
+                        self._record('inference', time.perf_counter() - start_time)
+                    if fresh and self.metrics is not None:
+                        self._inferences_total.inc(1, self._metrics_source)
+                else:
+                    # ROI đứng yên: dùng lại kết quả detect cũ
+                    vehicle_boxes = self.detector.last_detections
+                    fresh = False
+
+            if self.controller and self.detector:
+                self._adapt(frame_idx)
+
+            if not self.result_queue.put((frame_idx, frame, vehicle_boxes, force, fresh), self._stop_event):
+                return
+
+    def _adapt(self, frame_idx):
+        """Áp dụng skip frames/imgsz mới do controller đề xuất"""
+        change = self.controller.update(frame_idx, self.frame_interval, self.detect_skip_frames,
+                                        self.detector.detect_imgsz, self.dropped_frames)
+        if change:
+            self.detect_skip_frames, self.detector.detect_imgsz = change
+
+    def _batched_inference_loop(self):
+        """Stage 2 khi dùng MicroBatcher: gửi nhiều frame đang chờ cùng lúc để gom batch, kết thúc khi gặp _END"""
+        while not self._stop_event.is_set():
+            item = self.decode_queue.get(self._stop_event)
+            if item is None:
+                return
+            items = [item] + self.decode_queue.get_many(self.batcher.batch_size - 1)
+
+            pending = []
+            regions = self._regions() if self.tiling is None else None
+            for item in items:
+                if item is _END:
+                    pending.append((item, None))
+                    break
+                frame_idx, frame, force, native = item
+                run, force = self._gate(frame, frame_idx, force)
+                request = None if run else self.batcher.reuse(self.source_id, frame_idx)
+                if request is None:
+                    if self.tiling is not None:
+                        # Tile được cắt từ frame gốc của từng frame
+                        regions = self._regions(native)
+                    request = self.batcher.submit(self.source_id, frame, self.target_classes,
+                                                  frame_idx, force, regions, self.detection_cache)
+                pending.append((item, request))
+
+            for item, request in pending:
+                if item is _END:
+                    return
+                frame_idx, frame, force, _ = item
+                vehicle_boxes = request.wait()
+                fresh = request.depends_on is None
+                if fresh and self.motion_gate:
+                    self.motion_gate.detected(frame_idx)
+                if fresh and self.metrics is not None:
+                    self._inferences_total.inc(1, self._metrics_source)
+                if not self.result_queue.put((frame_idx, frame, vehicle_boxes, force, fresh), self._stop_event):
+                    return
+
+    def _annotate_loop(self):
+        """Stage 3: tracking, vẽ kết quả và trả frame cho GUI"""
+        while not self._stop_event.is_set():
+            item = self.result_queue.get(self._stop_event)
+            if item is None:
+                return
+            if item is _END:
+                if self.on_finished:
+                    self.on_finished()
+                return
+
+            frame_idx, frame, vehicle_boxes, is_seek, fresh = item
+            start_time = time.perf_counter()
+            with self.lock:
+                if not is_seek:
+                    # Tracking và cắt ảnh xe trên frame chưa vẽ
+                    self.vehicle_processor.process_rois(
+                        frame, vehicle_boxes, self.roi_manager, frame_idx, draw=False, fresh=fresh
+                    )
+                    if self.metrics is not None:
+                        self._record('tracking', time.perf_counter() - start_time)
+                if self.annotate:
+                    draw_roi_overlay(frame, self.roi_manager.get_all_rois(), self.roi_manager.lines.lines,
+                                     self.vehicle_processor.line_counts)
+                    if is_seek:
+                        # Khi seek chỉ vẽ kết quả detect, không cập nhật tracker
+                        if vehicle_boxes:
+                            draw_detections(frame, vehicle_boxes.high())
+                    else:
+                        self.vehicle_processor.draw_tracks(frame)
+            if self._timed:
+                self._record('annotate', time.perf_counter() - start_time)
+
+            if self.on_frame:
+                self.on_frame(frame, frame_idx)
+            if self.metrics is not None:
+                self._frames_total.inc(1, self._metrics_source)
+            if self.latency:
+                captured = self.source.capture_time(frame_idx)
+                if captured is not None:
+                    latency = time.monotonic() - captured
+                    self.latency.record(latency)
+                    if self.metrics is not None:
+                        self._latency_seconds.observe(latency, self._metrics_source)
+
+
+def draw_detections(frame, vehicle_boxes):
+    """Vẽ bounding box và nhãn của kết quả detect (không tracking)"""
+    for box in vehicle_boxes:
+        x1, y1, x2, y2, cls_name, conf = box
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 1)
+        conf_percent = int(conf * 100)
+        label = f"{cls_name} {conf_percent}%"
+        cv2.putText(frame, label, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 255, 255), 1)
+    return frame
@@ -0,0 +1,54 @@
+import json
+import threading
+
+
+class JsonlSink:
+    """
+    Nơi lưu lâu dài các record xe đã bị VehicleProcessor bỏ khỏi bộ nhớ.
+
+    Mỗi xe (theo ROI) là một dòng JSON, ghi nối tiếp vào cuối file.
+    """
+
+    def __init__(self, path, context=None):
+        """
+        Args:
+            path: File JSON Lines (ghi nối tiếp nếu đã có)
+            context: Các trường thêm vào mỗi dòng, ví dụ {'video': đường dẫn video}
+        """
+        self.path = path
+        self.context = context or {}
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def write(self, roi_id, record):
+        """Ghi record (dict) của một xe trong một ROI"""
+        line = json.dumps({**self.context, 'roi_id': roi_id, **record}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.written += 1
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+class FanoutSink:
+    """Ghi mỗi record vào nhiều sink"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, roi_id, record):
+        for sink in self.sinks:
+            sink.write(roi_id, record)
+
+    def flush(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'flush'):
+                sink.flush()
@@ -0,0 +1,265 @@
+"""
+Chọn vùng ảnh cần detect từ các ROI.
+
+Thay vì detect cả frame, chỉ cắt phần ảnh quanh các ROI (thêm lề để xe nằm
+trên biên ROI vẫn đủ hình) và detect với imgsz thu nhỏ theo tỉ lệ để giữ
+nguyên mật độ pixel so với detect cả frame. Kết quả được dịch về tọa độ frame.
+
+Với camera độ phân giải cao, chia frame gốc (chưa thu nhỏ) quanh các ROI thành
+các tile chồng nhau, detect ở đúng độ phân giải gốc rồi gộp box trùng giữa các
+tile (xe nhỏ ở xa không bị thu nhỏ còn vài pixel).
+"""
+import math
+
+import numpy as np
+
+
+class RegionPlan:
+    """Các vùng cắt (x1, y1, x2, y2) của một frame và imgsz dùng khi detect chúng"""
+
+    __slots__ = ('rects', 'imgsz')
+
+    # Tọa độ vùng cắt đã là tọa độ frame làm việc; các vùng không chồng nhau
+    scale = None
+    overlapping = False
+    global_imgsz = None
+    cacheable = True
+
+    def __init__(self, rects, imgsz):
+        self.rects = rects
+        self.imgsz = imgsz
+
+    def crops(self, frame):
+        """Cắt các vùng từ frame (view, không copy)"""
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.rects]
+
+
+def merge_rects(rects):
+    """Gộp các hình chữ nhật chồng nhau cho đến khi không còn cặp nào chồng nhau"""
+    rects = [list(rect) for rect in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(rect) for rect in rects]
+
+
+def scaled_imgsz(size, frame_size, detect_imgsz, stride=32):
+    """imgsz giữ mật độ pixel của detect_imgsz trên cả frame, làm tròn lên bội số stride"""
+    scale = detect_imgsz / max(frame_size)
+    return max(stride, int(math.ceil(max(size) * scale / stride)) * stride)
+
+
+def plan_regions(roi_coords, frame_size, detect_imgsz, padding=32, fixed_imgsz=None, stride=32):
+    """
+    Chọn cách detect rẻ nhất cho các ROI: từng vùng riêng, một vùng bao tất cả
+    ROI, hoặc cả frame. Chi phí ước lượng bằng số vùng x imgsz^2.
+
+    Args:
+        roi_coords: Danh sách (x1, y1, x2, y2) của các ROI
+        frame_size: Kích thước frame (width, height)
+        detect_imgsz: imgsz khi detect cả frame
+        padding: Lề (pixel) thêm quanh mỗi ROI
+        fixed_imgsz: Kích thước input cố định của model (None = model nhận imgsz bất kỳ)
+        stride: Bội số của imgsz
+
+    Returns:
+        RegionPlan, hoặc None nếu detect cả frame rẻ hơn (hoặc không có ROI)
+    """
+    if not roi_coords:
+        return None
+    width, height = frame_size
+    padded = []
+    for x1, y1, x2, y2 in roi_coords:
+        x1, y1 = max(0, int(x1) - padding), max(0, int(y1) - padding)
+        x2, y2 = min(width, int(x2) + padding), min(height, int(y2) + padding)
+        if x2 > x1 and y2 > y1:
+            padded.append((x1, y1, x2, y2))
+    if not padded:
+        return None
+
+    def imgsz_for(rects):
+        if fixed_imgsz:
+            return fixed_imgsz
+        return max(scaled_imgsz((x2 - x1, y2 - y1), frame_size, detect_imgsz, stride)
+                   for x1, y1, x2, y2 in rects)
+
+    separate = merge_rects(padded)
+    union = [(min(r[0] for r in separate), min(r[1] for r in separate),
+              max(r[2] for r in separate), max(r[3] for r in separate))]
+
+    full_cost = (fixed_imgsz or detect_imgsz) ** 2
+    best = None
+    for rects in (union, separate):
+        imgsz = imgsz_for(rects)
+        cost = len(rects) * imgsz ** 2
+        if cost < full_cost and (best is None or cost < best[0]):
+            best = (cost, RegionPlan(rects, imgsz))
+    if best is None and fixed_imgsz and len(separate) == 1:
+        # Model cố định kích thước: cùng chi phí nhưng ảnh cắt có độ phân giải cao hơn
+        return RegionPlan(separate, fixed_imgsz)
+    return best[1] if best else None
+
+
+class TilePlan:
+    """
+    Các tile (x1, y1, x2, y2) trên frame gốc và imgsz khi detect chúng
+
+    scale (sx, sy) đổi tọa độ frame gốc sang frame làm việc; bind() gắn plan với frame
+    gốc của từng frame để truyền qua detector/batcher như một RegionPlan.
+    """
+
+    __slots__ = ('rects', 'imgsz', 'scale', 'global_imgsz')
+
+    def __init__(self, rects, imgsz, scale, global_imgsz=None):
+        self.rects = rects
+        self.imgsz = imgsz
+        self.scale = scale
+        self.global_imgsz = global_imgsz
+
+    def bind(self, native):
+        return TiledRegions(self, native)
+
+
+class TiledRegions:
+    """TilePlan gắn với frame gốc của một frame"""
+
+    __slots__ = ('plan', 'native')
+
+    overlapping = True
+    cacheable = False   # Cache detect chỉ lưu kết quả detect cả frame làm việc
+
+    def __init__(self, plan, native):
+        self.plan = plan
+        self.native = native
+
+    @property
+    def rects(self):
+        return self.plan.rects
+
+    @property
+    def imgsz(self):
+        return self.plan.imgsz
+
+    @property
+    def scale(self):
+        return self.plan.scale
+
+    @property
+    def global_imgsz(self):
+        return self.plan.global_imgsz
+
+    def crops(self, frame):
+        """Cắt các tile từ frame gốc (frame làm việc chỉ dùng cho lượt detect cả frame)"""
+        return [self.native[y1:y2, x1:x2] for x1, y1, x2, y2 in self.plan.rects]
+
+
+def _tile_starts(start, end, tile, step, limit):
+    """Vị trí bắt đầu các tile phủ [start, end) trong [0, limit), cách đều nhau"""
+    length = end - start
+    if length <= tile:
+        # Một tile, căn giữa vùng nhưng không vượt khỏi frame
+        return [min(max(0, start - (tile - length) // 2), limit - tile)]
+    count = int(math.ceil((length - tile) / step)) + 1
+    return [int(round(start + i * (length - tile) / (count - 1))) for i in range(count)]
+
+
+def plan_tiles(native_size, frame_size, roi_coords=None, tile_size=640, overlap=0.2,
+               padding=32, global_pass=True, detect_imgsz=416, fixed_imgsz=None):
+    """
+    Chia vùng quanh các ROI trên frame gốc thành các tile vuông chồng nhau
+
+    Args:
+        native_size: Kích thước frame gốc (width, height)
+        frame_size: Kích thước frame làm việc (width, height), tọa độ của ROI và kết quả
+        roi_coords: Danh sách (x1, y1, x2, y2) của các ROI theo frame làm việc
+            (None/rỗng = phủ cả frame)
+        tile_size: Cạnh tile (pixel của frame gốc), cũng là imgsz khi detect tile
+        overlap: Tỉ lệ chồng nhau giữa hai tile liền kề (0-0.9)
+        padding: Lề (pixel của frame làm việc) thêm quanh mỗi ROI
+        global_pass: Detect thêm cả frame làm việc ở detect_imgsz để bắt xe lớn hơn tile
+        detect_imgsz: imgsz của lượt detect cả frame
+        fixed_imgsz: Kích thước input cố định của model (None = model nhận imgsz bất kỳ)
+
+    Returns:
+        TilePlan
+    """
+    native_w, native_h = native_size
+    scale_x, scale_y = frame_size[0] / native_w, frame_size[1] / native_h
+    tile_w, tile_h = min(tile_size, native_w), min(tile_size, native_h)
+    step_w = max(1, int(tile_w * (1 - overlap)))
+    step_h = max(1, int(tile_h * (1 - overlap)))
+
+    areas = []
+    for x1, y1, x2, y2 in roi_coords or [(0, 0, frame_size[0], frame_size[1])]:
+        x1 = max(0, int((x1 - padding) / scale_x))
+        y1 = max(0, int((y1 - padding) / scale_y))
+        x2 = min(native_w, int(math.ceil((x2 + padding) / scale_x)))
+        y2 = min(native_h, int(math.ceil((y2 + padding) / scale_y)))
+        if x2 > x1 and y2 > y1:
+            areas.append((x1, y1, x2, y2))
+
+    tiles = []
+    for x1, y1, x2, y2 in merge_rects(areas):
+        for ty in _tile_starts(y1, y2, tile_h, step_h, native_h):
+            for tx in _tile_starts(x1, x2, tile_w, step_w, native_w):
+                tile = (tx, ty, tx + tile_w, ty + tile_h)
+                if tile not in tiles:
+                    tiles.append(tile)
+
+    imgsz = fixed_imgsz or int(math.ceil(max(tile_w, tile_h) / 32)) * 32
+    global_imgsz = (fixed_imgsz or detect_imgsz) if global_pass else None
+    return TilePlan(tiles, imgsz, (scale_x, scale_y), global_imgsz)
+
+
+def merge_tile_boxes(raw, threshold=0.5):
+    """
+    Gộp box trùng giữa các tile (NMS theo class)
+
+    Hai box cùng class trùng nhau khi diện tích giao chia diện tích box nhỏ hơn
+    >= threshold, nên phần xe bị cắt ở mép tile bị bỏ khi tile bên cạnh thấy
+    cả xe. Box confidence cao hơn được giữ.
+    """
+    if len(raw) < 2:
+        return raw
+    raw = raw[np.argsort(-raw[:, 4], kind='stable')]
+    xyxy, cls_id = raw[:, :4], raw[:, 5]
+    area = np.prod(np.clip(xyxy[:, 2:] - xyxy[:, :2], 0, None), axis=1)
+    keep = np.ones(len(raw), dtype=bool)
+    for i in range(len(raw)):
+        if not keep[i]:
+            continue
+        rest = np.nonzero(keep[i + 1:] & (cls_id[i + 1:] == cls_id[i]))[0] + i + 1
+        if len(rest) == 0:
+            continue
+        lt = np.maximum(xyxy[i, :2], xyxy[rest, :2])
+        rb = np.minimum(xyxy[i, 2:], xyxy[rest, 2:])
+        inter = np.prod(np.clip(rb - lt, 0, None), axis=1)
+        smaller = np.minimum(area[i], area[rest])
+        keep[rest[inter >= threshold * np.maximum(smaller, 1e-9)]] = False
+    return raw[keep]
+
+
+def shift_raw(raw, offset, scale=None):
+    """
+    Dịch kết quả thô (N, 6) [x1, y1, x2, y2, conf, cls_id] của ảnh cắt về tọa độ frame,
+    rồi nhân với scale (sx, sy) nếu ảnh cắt lấy từ frame có độ phân giải khác
+    """
+    if hasattr(raw, 'cpu'):
+        raw = raw.cpu().numpy()
+    raw = np.array(raw, dtype=np.float32).reshape(-1, 6)
+    raw[:, [0, 2]] += offset[0]
+    raw[:, [1, 3]] += offset[1]
+    if scale is not None:
+        raw[:, [0, 2]] *= scale[0]
+        raw[:, [1, 3]] *= scale[1]
+    return raw
@@ -1,52 +1,292 @@
+import cv2
+import numpy as np
+
+from coords import (REFERENCE_SIZE, normalize_points, normalize_rect, points_to_pixels,
+                    scale_distance, to_pixels)
+from counting import LineCounter
 from tracker import Tracker
+from motion_tracker import MotionTracker
+
+
+TRACKERS = {
+    'centroid': Tracker,       # Ghép cặp theo khoảng cách tâm
+    'motion': MotionTracker    # Kalman + ghép hai lượt, dự đoán vị trí khi skip frame
+}
+
+
+class ROIIndex:
+    """
+    Chỉ mục không gian cho các ROI: lưới đều chia khung hình thành các ô, mỗi ô
+    lưu danh sách ROI chồng lên nó. Tra cứu một điểm chỉ cần xét các ROI trong
+    ô chứa điểm đó thay vì toàn bộ ROI.
+
+    ROI đa giác (zone) được raster hóa một lần thành mask trên hình chữ nhật
+    bao; ô nằm trọn trong đa giác không cần tra mask, ô không chạm đa giác bị
+    bỏ qua, chỉ ô chứa cạnh của đa giác mới tra mask tại điểm.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def rebuild(self, rois):
+        """Dựng lại chỉ mục từ {roi_id: {'coords': (x1, y1, x2, y2), 'polygon': ..., ...}}"""
+        cells = {}
+        size = self.cell_size
+        for roi_id, roi_data in rois.items():
+            x1, y1, x2, y2 = roi_data['coords']
+            polygon = roi_data.get('polygon')
+            mask = None
+            if polygon is not None:
+                mask = np.zeros((y2 - y1 + 1, x2 - x1 + 1), np.uint8)
+                cv2.fillPoly(mask, [np.array(polygon, np.int32) - (x1, y1)], 1)
+            for gx in range(int(x1) // size, int(x2) // size + 1):
+                for gy in range(int(y1) // size, int(y2) // size + 1):
+                    cell_mask = None
+                    if mask is not None:
+                        # Phần của ô nằm trong hình chữ nhật bao, theo tọa độ của mask
+                        part = mask[max(gy * size - y1, 0):max((gy + 1) * size - y1, 0),
+                                    max(gx * size - x1, 0):max((gx + 1) * size - x1, 0)]
+                        if not part.any():
+                            continue
+                        if not part.all():
+                            cell_mask = mask
+                    cells.setdefault((gx, gy), []).append((roi_id, x1, y1, x2, y2, cell_mask))
+        self.cells = cells
+
+    def query(self, x, y):
+        """Danh sách roi_id chứa điểm (x, y)"""
+        candidates = self.cells.get((int(x) // self.cell_size, int(y) // self.cell_size))
+        if not candidates:
+            return []
+        return [roi_id for roi_id, x1, y1, x2, y2, mask in candidates
+                if x1 <= x <= x2 and y1 <= y <= y2
+                and (mask is None or mask[int(y) - y1, int(x) - x1])]
 
 
 class ROIManager:
-    """Quản lý ROI (Region of Interest)"""
-    
-    def __init__(self):
-        """Khởi tạo ROI manager"""
+    """
+    Quản lý ROI (Region of Interest)
+
+    Mỗi luồng video có một tracker chung cho mọi ROI, nên một xe nằm trong
+    nhiều ROI chồng nhau vẫn chỉ có một ID. ROI mà mỗi track đang nằm trong
+    được tính qua ROIIndex và thay đổi được trả về dưới dạng sự kiện vào/ra.
+    ROI có thể là hình chữ nhật hoặc đa giác (zone, thêm 'polygon' và
+    'polygon_normalized'; 'coords' là hình chữ nhật bao). Các vạch đếm theo
+    hướng nằm trong self.lines (counting.LineCounter) và dùng chung tracker.
+
+    Mỗi ROI lưu cả tọa độ chuẩn hóa ('normalized', 0-1) và tọa độ pixel của
+    frame làm việc hiện tại ('coords'); set_frame_size() tính lại tọa độ pixel
+    và khoảng cách của tracker khi kích thước frame thay đổi.
+    """
+
+    def __init__(self, tracker_type='centroid', frame_size=REFERENCE_SIZE, max_distance=100):
+        """
+        Khởi tạo ROI manager
+
+        Args:
+            tracker_type: Loại tracker dùng chung cho các ROI (xem TRACKERS)
+            frame_size: Kích thước frame làm việc (width, height) của tọa độ pixel
+            max_distance: Khoảng cách tâm tối đa của tracker theo frame tham chiếu
+                (coords.REFERENCE_SIZE), được chỉnh theo frame_size
+        """
+        if tracker_type not in TRACKERS:
+            raise ValueError(f"Unknown tracker type: {tracker_type}")
+        self.tracker_class = TRACKERS[tracker_type]
+        self.frame_size = tuple(frame_size)
+        self.max_distance = max_distance
+        self.tracker = self._new_tracker()
+        self.index = ROIIndex()
         self.rois = {}
+        self.memberships = {}
         self.next_roi_id = 1
-    
+        self.lines = LineCounter(self.frame_size)
+
+    def _new_tracker(self):
+        return self.tracker_class(max_distance=scale_distance(self.max_distance, self.frame_size))
+
+    def set_frame_size(self, frame_size):
+        """Đổi kích thước frame làm việc: tính lại tọa độ pixel của ROI và ngưỡng tracker"""
+        frame_size = tuple(frame_size)
+        if frame_size == self.frame_size:
+            return False
+        self.frame_size = frame_size
+        for roi_data in self.rois.values():
+            self._place(roi_data)
+        self.index.rebuild(self.rois)
+        self.lines.set_frame_size(frame_size)
+        # Giữ các track hiện có (ID không bắt đầu lại), chỉ đổi ngưỡng ghép cặp
+        self.tracker.max_distance = scale_distance(self.max_distance, frame_size)
+        return True
+
+    def _place(self, roi_data):
+        """Tính tọa độ pixel của ROI từ tọa độ chuẩn hóa"""
+        if 'polygon_normalized' in roi_data:
+            polygon = points_to_pixels(roi_data['polygon_normalized'], self.frame_size)
+            xs = [x for x, _ in polygon]
+            ys = [y for _, y in polygon]
+            roi_data['polygon'] = polygon
+            roi_data['coords'] = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            roi_data['coords'] = to_pixels(roi_data['normalized'], self.frame_size)
+
     def add_roi(self, x1, y1, x2, y2):
-        """roi_id: ID của ROI vừa tạo"""
+        """roi_id: ID của ROI vừa tạo (tọa độ pixel của frame làm việc hiện tại)"""
+        return self.add_roi_normalized(*normalize_rect((x1, y1, x2, y2), self.frame_size))
+
+    def add_roi_normalized(self, x1, y1, x2, y2):
+        """roi_id: ID của ROI vừa tạo (tọa độ chuẩn hóa 0-1 theo kích thước frame)"""
         roi_id = self.next_roi_id
+        normalized = (x1, y1, x2, y2)
         self.rois[roi_id] = {
-            'coords': (x1, y1, x2, y2),
-            'tracker': Tracker(),
-            'saved_ids': set()
+            'coords': to_pixels(normalized, self.frame_size),
+            'normalized': normalized
+        }
+        self.next_roi_id += 1
+        self.index.rebuild(self.rois)
+        return roi_id
+
+    def add_zone(self, points):
+        """roi_id của zone đa giác mới ([(x, y), ...] pixel của frame làm việc, >= 3 đỉnh)"""
+        return self.add_zone_normalized(normalize_points(points, self.frame_size))
+
+    def add_zone_normalized(self, points):
+        """roi_id của zone đa giác mới ([(x, y), ...] chuẩn hóa 0-1, >= 3 đỉnh)"""
+        if len(points) < 3:
+            raise ValueError("A zone needs at least 3 points")
+        polygon = [tuple(point) for point in points]
+        xs = [x for x, _ in polygon]
+        ys = [y for _, y in polygon]
+        roi_id = self.next_roi_id
+        roi_data = {
+            'normalized': (min(xs), min(ys), max(xs), max(ys)),
+            'polygon_normalized': polygon
         }
+        self._place(roi_data)
+        self.rois[roi_id] = roi_data
         self.next_roi_id += 1
+        self.index.rebuild(self.rois)
         return roi_id
-    
+
     def remove_roi(self, roi_id):
         """Xóa ROI"""
         if roi_id in self.rois:
             del self.rois[roi_id]
+            self._forget_roi(roi_id)
+            self.index.rebuild(self.rois)
             return True
         return False
-    
+
     def update_roi_coords(self, roi_id, x1, y1, x2, y2):
-        """Cập nhật tọa độ ROI"""
+        """Cập nhật tọa độ ROI (pixel của frame làm việc hiện tại)"""
         if roi_id in self.rois:
-            self.rois[roi_id]['coords'] = (x1, y1, x2, y2)
-            self.rois[roi_id]['tracker'] = Tracker()
-            self.rois[roi_id]['saved_ids'] = set()
+            roi_data = self.rois[roi_id]
+            normalized = normalize_rect((x1, y1, x2, y2), self.frame_size)
+            if 'polygon_normalized' in roi_data:
+                # Co giãn đa giác theo hình chữ nhật bao mới
+                ox1, oy1, ox2, oy2 = roi_data['normalized']
+                sx = (normalized[2] - normalized[0]) / ((ox2 - ox1) or 1)
+                sy = (normalized[3] - normalized[1]) / ((oy2 - oy1) or 1)
+                roi_data['polygon_normalized'] = [
+                    (normalized[0] + (x - ox1) * sx, normalized[1] + (y - oy1) * sy)
+                    for x, y in roi_data['polygon_normalized']
+                ]
+            roi_data['normalized'] = normalized
+            self._place(roi_data)
+            self.reset_roi(roi_id)
+            self.index.rebuild(self.rois)
             return True
         return False
-    
+
     def get_roi(self, roi_id):
         """Lấy thông tin ROI"""
         return self.rois.get(roi_id)
-    
+
     def get_all_rois(self):
         """Lấy tất cả ROI"""
         return self.rois
-    
+
     def reset_roi(self, roi_id):
-        """Reset tracker của ROI"""
+        """Reset các track đang nằm trong ROI"""
         if roi_id in self.rois:
-            self.rois[roi_id]['tracker'] = Tracker()
-            self.rois[roi_id]['saved_ids'] = set()
+            self._forget_roi(roi_id)
+
+    def reset_all(self):
+        """Reset tracker và trạng thái của mọi ROI (khi mở video mới/đổi bộ lọc)"""
+        self.tracker = self._new_tracker()
+        self.memberships = {}
+        self.lines.reset()
+
+    def watch_areas(self, line_padding=0):
+        """
+        Các vùng cần theo dõi: {roi_id: (x1, y1, x2, y2)} của ROI cộng với
+        {'line<id>': ...} hình chữ nhật bao các vạch đếm (thêm lề line_padding),
+        cho motion gate và detect theo vùng
+        """
+        areas = {roi_id: roi_data['coords'] for roi_id, roi_data in self.rois.items()}
+        for line_id, bounds in self.lines.bounds(line_padding).items():
+            x1, y1, x2, y2 = bounds
+            width, height = self.frame_size
+            areas[f"line{line_id}"] = (max(x1, 0), max(y1, 0), min(x2, width), min(y2, height))
+        return areas
+
+    def update_crossings(self, tracked):
+        """[(line_id, track_id, 'in'/'out'), ...] các lần cắt vạch đếm ở frame này"""
+        return self.lines.update(tracked, self.tracker.tracks)
+
+    def _forget_roi(self, roi_id):
+        """Xóa ROI khỏi tập ROI của mọi track (không sinh sự kiện ra)"""
+        for roi_ids in self.memberships.values():
+            roi_ids.discard(roi_id)
+
+    def update_memberships(self, tracked):
+        """
+        Tính ROI chứa tâm của mỗi track và sự kiện vào/ra ROI
+
+        Track không xuất hiện ở frame này nhưng tracker vẫn giữ (bị che, chưa
+        khớp) được coi là vẫn ở trong ROI cũ; track đã bị tracker xóa thì ra khỏi
+        mọi ROI.
+
+        Args:
+            tracked: [[x1, y1, x2, y2, id] hoặc None, ...] kết quả của tracker
+
+        Returns:
+            (roi_ids, events): roi_ids[i] là list ROI chứa tracked[i];
+            events là list (event, roi_id, track_id) với event 'enter' hoặc 'exit'
+        """
+        previous = self.memberships
+        current = {}
+        seen = set()
+        roi_ids = []
+        events = []
+
+        for tracked_box in tracked:
+            if tracked_box is None:
+                roi_ids.append([])
+                continue
+            x1, y1, x2, y2, track_id = tracked_box
+            inside = self.index.query((x1 + x2) // 2, (y1 + y2) // 2)
+            roi_ids.append(inside)
+            seen.add(track_id)
+
+            inside_set = set(inside)
+            before = previous.get(track_id, set())
+            for roi_id in inside_set - before:
+                events.append(('enter', roi_id, track_id))
+            for roi_id in before - inside_set:
+                events.append(('exit', roi_id, track_id))
+            if inside_set:
+                current[track_id] = inside_set
+
+        alive = self.tracker.tracks
+        for track_id, before in previous.items():
+            if track_id in seen or not before:
+                continue
+            if track_id in alive:
+                current[track_id] = before
+            else:
+                for roi_id in before:
+                    events.append(('exit', roi_id, track_id))
 
+        self.memberships = current
+        return roi_ids, events
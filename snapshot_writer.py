@@ -0,0 +1,156 @@
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+_STOP = object()
+
+# Tham số encode theo định dạng ảnh, quality trong khoảng 0-100
+ENCODE_PARAMS = {
+    'jpg': lambda quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+    'png': lambda quality: [cv2.IMWRITE_PNG_COMPRESSION, min(9, max(0, (100 - quality) // 10))],
+    'webp': lambda quality: [cv2.IMWRITE_WEBP_QUALITY, quality],
+}
+
+
+class SnapshotWriter:
+    """
+    Ghi ảnh phương tiện ra đĩa trên các thread nền.
+
+    Hàng đợi có giới hạn: khi đĩa không theo kịp, block=False bỏ ảnh mới (xem
+    trực tiếp, không làm chậm pipeline), block=True chờ có chỗ (đếm offline,
+    không mất ảnh). Cả hai trường hợp đều được ghi lại trong stats().
+    """
+
+    def __init__(self, save_dir, workers=1, queue_size=32, image_format='jpg',
+                 quality=90, block=False, warn_interval=5.0):
+        """
+        Args:
+            save_dir: Thư mục lưu ảnh
+            workers: Số thread ghi ảnh
+            queue_size: Số ảnh tối đa chờ ghi
+            image_format: 'jpg', 'png' hoặc 'webp'
+            quality: Chất lượng encode (0-100)
+            block: Chờ khi hàng đợi đầy thay vì bỏ ảnh
+            warn_interval: Khoảng thời gian tối thiểu (giây) giữa hai cảnh báo bỏ ảnh
+        """
+        if image_format not in ENCODE_PARAMS:
+            raise ValueError(f"Unknown image format: {image_format}")
+        os.makedirs(save_dir, exist_ok=True)
+        self.save_dir = save_dir
+        self.image_format = image_format
+        self.encode_params = ENCODE_PARAMS[image_format](int(quality))
+        self.block = block
+        self.warn_interval = warn_interval
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats_lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.blocked_seconds = 0.0
+        self.write_seconds = 0.0
+        # Thời gian (giây) của các lần ghi gần nhất, cho benchmark
+        self.write_samples = deque(maxlen=4096)
+        self._last_warning = 0.0
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"snapshot-writer-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def path_for(self, name):
+        """Đường dẫn file ảnh cho tên không có phần mở rộng"""
+        return os.path.join(self.save_dir, f"{name}.{self.image_format}")
+
+    def submit(self, name, image):
+        """
+        Đưa ảnh vào hàng đợi ghi
+
+        Args:
+            name: Tên file không có phần mở rộng
+            image: Ảnh BGR (không được sửa sau khi submit)
+
+        Returns:
+            True nếu ảnh được nhận, False nếu bị bỏ do hàng đợi đầy
+        """
+        item = (self.path_for(name), image)
+        if self.block:
+            start_time = time.perf_counter()
+            self.queue.put(item)
+            waited = time.perf_counter() - start_time
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self._on_dropped()
+                return False
+            waited = 0.0
+
+        depth = self.queue.qsize()
+        with self.stats_lock:
+            self.submitted += 1
+            self.blocked_seconds += waited
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return True
+
+    def _on_dropped(self):
+        with self.stats_lock:
+            self.dropped += 1
+            dropped = self.dropped
+            now = time.perf_counter()
+            if now - self._last_warning < self.warn_interval:
+                return
+            self._last_warning = now
+        print(f"Snapshot writer cannot keep up, {dropped} snapshots dropped so far", file=sys.stderr)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            path, image = item
+            start_time = time.perf_counter()
+            try:
+                ok = cv2.imwrite(path, image, self.encode_params)
+            except cv2.error:
+                ok = False
+            elapsed = time.perf_counter() - start_time
+            with self.stats_lock:
+                self.write_seconds += elapsed
+                self.write_samples.append(elapsed)
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+
+    def stats(self):
+        """Số liệu ghi ảnh và áp lực hàng đợi"""
+        with self.stats_lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'blocked_seconds': round(self.blocked_seconds, 3),
+                'avg_write_ms': round(1000 * self.write_seconds / max(1, self.written + self.failed), 2)
+            }
+
+    def close(self):
+        """Ghi hết ảnh còn trong hàng đợi và dừng các thread"""
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
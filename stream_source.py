@@ -0,0 +1,285 @@
+"""
+Nguồn video trực tiếp (camera IP qua RTSP/HTTP) cho pipeline.
+
+Một thread nền đọc frame liên tục ngay khi camera gửi tới và chỉ giữ frame
+mới nhất, nên bộ đệm của decoder không tích lại và độ trễ không tăng dần khi
+xử lý chậm hơn tốc độ camera. Mất kết nối thì tự kết nối lại với thời gian
+chờ tăng dần (exponential backoff).
+
+ReplaySource phát lại một file video theo đúng FPS của nó qua cùng cơ chế,
+có thể giả lập mất kết nối, dùng để thử mà không cần camera thật.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from coords import DEFAULT_LONG_SIDE
+from video_source import LRUCache, VideoSource
+
+
+STREAM_SCHEMES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+
+def is_stream_url(path):
+    """path là URL của luồng trực tiếp (không phải file)"""
+    return isinstance(path, str) and path.lower().startswith(STREAM_SCHEMES)
+
+
+class LatencyMeter:
+    """Thống kê độ trễ (giây) trên các mẫu gần nhất"""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.max_seconds = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def stats(self):
+        """Độ trễ (ms) trung bình, p50, p95 của các mẫu gần nhất và lớn nhất từ đầu"""
+        if not self.samples:
+            return {'count': 0}
+        samples = np.array(self.samples) * 1000
+        return {
+            'count': self.count,
+            'avg_ms': round(float(samples.mean()), 1),
+            'p50_ms': round(float(np.percentile(samples, 50)), 1),
+            'p95_ms': round(float(np.percentile(samples, 95)), 1),
+            'max_ms': round(self.max_seconds * 1000, 1)
+        }
+
+
+class StreamSource(VideoSource):
+    """
+    Luồng camera trực tiếp, chỉ giữ frame mới nhất
+
+    position là số thứ tự (từ 1) của frame vừa trả về trong số các frame đã
+    nhận từ camera; frame bị thay bằng frame mới hơn trước khi được đọc làm
+    position nhảy cách quãng, giữ đúng khoảng thời gian cho tracker.
+    """
+
+    is_live = True
+
+    def __init__(self, url, frame_size=DEFAULT_LONG_SIDE, reconnect_delay=(0.5, 30.0),
+                 max_retries=None, transport='tcp'):
+        """
+        Args:
+            url: URL luồng (rtsp://, http://, ...)
+            frame_size: Kích thước làm việc (xem coords.working_size); với cạnh dài hoặc
+                độ phân giải gốc, kích thước chỉ được biết khi nhận frame đầu tiên
+            reconnect_delay: (ban đầu, tối đa) thời gian chờ (giây) giữa các lần kết nối lại
+            max_retries: Số lần kết nối lại liên tiếp tối đa trước khi dừng (None = không giới hạn)
+            transport: Giao thức RTSP của FFmpeg ('tcp' hoặc 'udp')
+        """
+        self.url = url
+        self.size_spec = frame_size
+        if frame_size is not None and not isinstance(frame_size, int):
+            self.frame_size = tuple(frame_size)
+        self.reconnect_delay = reconnect_delay
+        self.max_retries = max_retries
+        self.transport = transport
+
+        self.fps = 0.0
+        self.frame_count = 0
+        self.position = 0
+        self.state = 'connecting'
+        self.frames_received = 0
+        self.frames_delivered = 0
+        self.stale_dropped = 0
+        self.reconnects = 0
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_seq = 0
+        self._frame_time = None
+        self._delivered_seq = 0
+        self._ended = False
+        self._closed = threading.Event()
+        self._capture_times = LRUCache(256)
+
+        self._thread = threading.Thread(target=self._reader_loop, name="stream-reader", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        """Mở kết nối tới camera, trả về đối tượng có read()/release() như cv2.VideoCapture"""
+        if self.url.lower().startswith(('rtsp://', 'rtsps://')):
+            os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", f"rtsp_transport;{self.transport}")
+        capture = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        if not capture.isOpened():
+            capture.release()
+            raise IOError(f"Cannot open stream: {self.url}")
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or self.fps
+        return capture
+
+    def _reader_loop(self):
+        delay, max_delay = self.reconnect_delay
+        failures = 0
+        while not self._closed.is_set():
+            try:
+                capture = self._open()
+            except IOError as e:
+                capture = None
+                print(f"{e}, retrying in {delay:.1f}s", file=sys.stderr)
+
+            if capture is not None:
+                self.state = 'streaming'
+                got_frame = False
+                while not self._closed.is_set():
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    got_frame = True
+                    self._publish(frame)
+                capture.release()
+                if self._closed.is_set():
+                    break
+                if got_frame:
+                    # Kết nối đã chạy được: bắt đầu lại backoff từ đầu
+                    delay, failures = self.reconnect_delay[0], 0
+                print(f"Stream lost: {self.url}, reconnecting in {delay:.1f}s", file=sys.stderr)
+
+            failures += 1
+            if self.max_retries is not None and failures > self.max_retries:
+                print(f"Giving up on stream after {self.max_retries} retries: {self.url}", file=sys.stderr)
+                break
+            self.state = 'reconnecting'
+            self.reconnects += 1
+            # Thêm nhiễu để nhiều camera không kết nối lại cùng lúc
+            self._closed.wait(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, max_delay)
+
+        with self._cond:
+            self.state = 'closed'
+            self._ended = True
+            self._cond.notify_all()
+
+    def _publish(self, frame):
+        """Thay frame mới nhất (frame cũ chưa được đọc thì bị bỏ)"""
+        now = time.monotonic()
+        with self._cond:
+            if self._frame_seq > self._delivered_seq:
+                self.stale_dropped += 1
+            self._frame = frame
+            self._frame_seq += 1
+            self._frame_time = now
+            self.frames_received += 1
+            self._cond.notify_all()
+
+    def read(self, stop_event=None):
+        """
+        Chờ frame mới hơn frame đã trả về lần trước; (False, None) khi nguồn đã đóng
+        hoặc stop_event được đặt (dừng pipeline khi camera đang mất kết nối)
+        """
+        with self._cond:
+            while True:
+                if self._ended or self._closed.is_set():
+                    return False, None
+                if stop_event is not None and stop_event.is_set():
+                    return False, None
+                if self._frame_seq > self._delivered_seq:
+                    break
+                self._cond.wait(0.1)
+            frame, seq, captured = self._frame, self._frame_seq, self._frame_time
+            self._frame = None
+            self._delivered_seq = seq
+
+        self.position = seq
+        self.frames_delivered += 1
+        self._capture_times.put(seq, captured)
+        if self.keep_native:
+            self.native_frame = frame
+        if (frame.shape[1], frame.shape[0]) != self.native_size:
+            # Frame đầu tiên hoặc camera đổi độ phân giải sau khi kết nối lại
+            self._set_native_size(frame.shape[1], frame.shape[0])
+        if self.frame_size != self.native_size:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        return True, frame
+
+    def capture_time(self, index):
+        return self._capture_times.get(index)
+
+    def seek(self, index):
+        """Luồng trực tiếp không seek được"""
+
+    def release(self):
+        self._closed.set()
+        self._thread.join(timeout=2)
+
+    def stats(self):
+        """Số frame nhận/trả về/bỏ vì cũ, số lần kết nối lại và trạng thái hiện tại"""
+        return {
+            'state': self.state,
+            'frames_received': self.frames_received,
+            'frames_delivered': self.frames_delivered,
+            'stale_dropped': self.stale_dropped,
+            'reconnects': self.reconnects
+        }
+
+
+class _PacedCapture:
+    """Đọc file video theo đúng FPS của nó như một camera, có thể giả lập mất kết nối"""
+
+    def __init__(self, path, loop, disconnect_after):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.loop = loop
+        self.disconnect_after = disconnect_after
+        self.frames = 0
+        self.next_time = time.monotonic()
+
+    def read(self):
+        if self.disconnect_after is not None and self.frames >= self.disconnect_after:
+            return False, None
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        if not ok:
+            return False, None
+
+        self.next_time += 1.0 / self.fps
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.frames += 1
+        return True, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ReplaySource(StreamSource):
+    """Phát lại file video như camera trực tiếp (thử nghiệm không cần camera thật)"""
+
+    def __init__(self, path, frame_size=DEFAULT_LONG_SIDE, loop=True, disconnect_after=None,
+                 reconnect_delay=(0.5, 30.0), max_retries=None):
+        """
+        Args:
+            path: File video
+            frame_size: Kích thước làm việc (xem coords.working_size); với cạnh dài hoặc
+                độ phân giải gốc, kích thước chỉ được biết khi nhận frame đầu tiên
+            loop: Phát lại từ đầu khi hết file (False = hết file coi như mất kết nối)
+            disconnect_after: Giả lập mất kết nối sau chừng này frame mỗi lần kết nối (None = không)
+            reconnect_delay: (ban đầu, tối đa) thời gian chờ (giây) giữa các lần kết nối lại
+            max_retries: Số lần kết nối lại liên tiếp tối đa trước khi dừng (None = không giới hạn)
+        """
+        self.loop = loop
+        self.disconnect_after = disconnect_after
+        super().__init__(path, frame_size, reconnect_delay, max_retries)
+
+    def _open(self):
+        capture = _PacedCapture(self.url, self.loop, self.disconnect_after)
+        self.fps = capture.fps
+        return capture
@@ -0,0 +1,34 @@
+"""Số liệu tài nguyên của tiến trình hiện tại"""
+import os
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def process_rss():
+    """
+    Bộ nhớ thường trú (RSS, bytes) hiện tại của tiến trình
+
+    Dùng psutil nếu đã cài, nếu không thì đọc /proc/self/statm (Linux); trên
+    hệ khác chỉ có RSS lớn nhất từ đầu (getrusage), None nếu không đo được.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS trả bytes, Linux/BSD trả KB
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
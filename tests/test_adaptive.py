@@ -0,0 +1,46 @@
+from adaptive import AdaptiveController
+
+
+DEADLINE = 1 / 25
+
+
+def _simulate(controller, state, frames, start_idx, seconds_at_416):
+    """Chạy controller với model giả có độ trễ tỉ lệ với imgsz^2, trả về các cấu hình đã qua"""
+    seen = []
+    for frame_idx in range(start_idx, start_idx + frames):
+        skip, imgsz = state
+        if frame_idx % skip == 0:
+            controller.record('inference', seconds_at_416 * (imgsz / 416) ** 2)
+        change = controller.update(frame_idx, DEADLINE, skip, imgsz)
+        if change:
+            state = change
+            seen.append(state)
+    return state, seen
+
+
+def test_high_latency_degrades_within_bounds_then_recovers():
+    controller = AdaptiveController(skip_range=(1, 4), imgsz_levels=(256, 320, 416, 512),
+                                    interval=10, verbose=False)
+    controller.record('decode', 0.005)
+    controller.record('annotate', 0.005)
+
+    # Mỗi lần detect 0.5 s: tăng skip đến tối đa rồi giảm imgsz đến mức thấp nhất
+    state, seen = _simulate(controller, (2, 416), 400, 1, 0.5)
+    assert state == (4, 256)
+    assert seen[:2] == [(3, 416), (4, 416)]
+    assert all(1 <= skip <= 4 and imgsz in (256, 320, 416, 512) for skip, imgsz in seen)
+    assert [change['reason'] for change in controller.changes] == ["over deadline"] * len(seen)
+
+    # Model nhanh trở lại: về imgsz cao nhất và skip thấp nhất, không vượt giới hạn
+    state, seen = _simulate(controller, state, 1000, 401, 0.004)
+    assert state == (1, 512)
+    assert all(1 <= skip <= 4 and imgsz in (256, 320, 416, 512) for skip, imgsz in seen)
+    assert controller.changes[-1]['reason'] == "headroom"
+
+
+def test_dropped_frames_raise_skip():
+    controller = AdaptiveController(skip_range=(1, 8), interval=10, verbose=False)
+    controller.record('inference', 0.001)
+    assert controller.update(1, DEADLINE, 2, 416) is None
+    assert controller.update(11, DEADLINE, 2, 416, dropped_frames=5) == (3, 416)
+    assert controller.changes[-1]['reason'] == "dropping frames"
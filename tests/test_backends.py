@@ -0,0 +1,59 @@
+import numpy as np
+
+from backends import ExportedModelBackend, decode_yolov8, letterbox
+
+
+def _output(*boxes):
+    """Output thô (84, N) của YOLOv8 từ các box (cx, cy, w, h, cls_id, conf) trên ảnh letterbox"""
+    output = np.zeros((84, len(boxes)), dtype=np.float32)
+    for i, (cx, cy, w, h, cls_id, conf) in enumerate(boxes):
+        output[:4, i] = (cx, cy, w, h)
+        output[4 + cls_id, i] = conf
+    return output
+
+
+# Frame 640x320 letterbox về 320: ratio 0.5, viền 80 pixel ở trên và dưới
+OUTPUT = _output(
+    (100, 140, 100, 80, 2, 0.9),    # frame (100, 40, 300, 200)
+    (102, 140, 100, 80, 2, 0.6),    # trùng box trên, cùng class: bị NMS bỏ
+    (100, 140, 100, 80, 7, 0.8),    # cùng chỗ nhưng khác class: giữ
+    (250, 150, 40, 40, 2, 0.3),     # dưới ngưỡng confidence
+    (310, 200, 40, 20, 5, 0.7),     # tràn mép phải: cắt theo frame
+)
+
+
+def test_decode_yolov8_maps_boxes_to_frame():
+    frame = np.zeros((320, 640, 3), dtype=np.uint8)
+    image, ratio, pad = letterbox(frame, 320)
+    assert image.shape == (320, 320, 3)
+    assert (ratio, pad) == (0.5, (0, 80))
+
+    result = decode_yolov8(OUTPUT, 0.5, ratio, pad, frame.shape)
+    np.testing.assert_allclose(result[np.argsort(-result[:, 4])], [
+        (100.0, 40.0, 300.0, 200.0, 0.9, 2.0),
+        (100.0, 40.0, 300.0, 200.0, 0.8, 7.0),
+        (580.0, 220.0, 640.0, 260.0, 0.7, 5.0),
+    ], atol=1e-3)
+
+
+def test_decode_yolov8_below_threshold_is_empty():
+    result = decode_yolov8(OUTPUT, 0.95, 0.5, (0, 80), (320, 640, 3))
+    assert result.shape == (0, 6)
+
+
+class FixedOutputBackend(ExportedModelBackend):
+    """Model giả trả về cùng một output cho mọi ảnh"""
+
+    def _infer(self, blob):
+        assert blob.shape[1:] == (3, 320, 320)
+        return np.stack([OUTPUT] * len(blob))
+
+
+def test_exported_backend_predict_unletterboxes_each_frame():
+    """predict: letterbox theo kích thước từng frame rồi đổi box về tọa độ frame đó"""
+    frames = [np.zeros((320, 640, 3), dtype=np.uint8), np.zeros((640, 320, 3), dtype=np.uint8)]
+    wide, tall = FixedOutputBackend().predict(frames, 320, 0.5)
+    assert len(wide) == len(tall) == 3
+    np.testing.assert_allclose(wide[wide[:, 4].argmax()], (100.0, 40.0, 300.0, 200.0, 0.9, 2.0), atol=1e-3)
+    # Frame đứng: viền 80 pixel ở trái và phải, phần box nằm trên viền bị cắt
+    np.testing.assert_allclose(tall[tall[:, 4].argmax()], (0.0, 200.0, 140.0, 360.0, 0.9, 2.0), atol=1e-3)
@@ -0,0 +1,36 @@
+from counting import LineCounter
+
+
+def _track(counter, track_id, centers):
+    """Đưa lần lượt các tâm của một track qua counter, trả về mọi lần cắt"""
+    crossings = []
+    for cx, cy in centers:
+        crossings += counter.update([[cx - 10, cy - 10, cx + 10, cy + 10, track_id]], {track_id: None})
+    return crossings
+
+
+def test_crossing_counted_once_with_direction():
+    counter = LineCounter((900, 520))
+    line_id = counter.add_line(0, 300, 900, 300)
+    # Vạch trái -> phải: đi xuống là 'in'
+    assert _track(counter, 1, [(100, 250), (100, 320), (100, 280), (100, 330)]) == [(line_id, 1, 'in')]
+    assert _track(counter, 2, [(500, 350), (500, 250)]) == [(line_id, 2, 'out')]
+
+
+def test_touching_the_line_and_turning_back_is_not_a_crossing():
+    counter = LineCounter((900, 520))
+    counter.add_line(0, 300, 900, 300)
+    assert _track(counter, 1, [(100, 320), (100, 300), (100, 300), (100, 330)]) == []
+    assert _track(counter, 2, [(200, 280), (200, 300), (200, 260)]) == []
+
+
+def test_crossing_through_a_point_on_the_line():
+    counter = LineCounter((900, 520))
+    line_id = counter.add_line(0, 300, 900, 300)
+    assert _track(counter, 1, [(100, 280), (100, 300), (100, 320)]) == [(line_id, 1, 'in')]
+
+
+def test_segment_outside_line_extent_is_ignored():
+    counter = LineCounter((900, 520))
+    counter.add_line(0, 300, 100, 300)
+    assert _track(counter, 1, [(500, 250), (500, 350)]) == []
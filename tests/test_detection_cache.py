@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+from detection_cache import DetectionCache
+
+
+def _video(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(name.encode() * 100)
+    return str(path)
+
+
+def _raw(count, conf=0.9):
+    return np.array([[10 * i, 10, 10 * i + 8, 18, conf, 2] for i in range(count)], dtype=np.float32)
+
+
+def test_put_save_load_round_trip(tmp_path):
+    """Kết quả lưu ở lần chạy trước được đọc lại theo imgsz và số frame"""
+    cache_dir = str(tmp_path / "cache")
+    video = _video(tmp_path, "a.mp4")
+    detections = DetectionCache(cache_dir).open(video, "model", (640, 360))
+    detections.put(416, 1, _raw(3))
+    detections.put(416, 2, np.empty((0, 6), dtype=np.float32))
+    detections.put(320, 1, _raw(1))
+    detections.save()
+
+    detections = DetectionCache(cache_dir).open(video, "model", (640, 360))
+    np.testing.assert_array_equal(detections.get(416, 1), _raw(3))
+    assert detections.get(416, 2).shape == (0, 6)
+    np.testing.assert_array_equal(detections.get(320, 1), _raw(1))
+    assert detections.get(416, 3) is None
+    assert detections.stats() == {'hits': 3, 'misses': 1, 'cached_frames': 3}
+
+    # Model hoặc kích thước frame khác: không dùng chung kết quả
+    assert DetectionCache(cache_dir).open(video, "model", (1280, 720)).get(416, 1) is None
+    assert DetectionCache(cache_dir).open(video, "other", (640, 360)).get(416, 1) is None
+
+
+def test_put_drops_boxes_below_floor(tmp_path):
+    detections = DetectionCache(str(tmp_path / "cache"), floor=0.2).open(
+        _video(tmp_path, "a.mp4"), "model", (640, 360))
+    detections.put(416, 1, np.concatenate([_raw(2, conf=0.5), _raw(3, conf=0.1), _raw(1, conf=0.2)]))
+    np.testing.assert_array_equal(detections.get(416, 1)[:, 4], np.float32([0.5, 0.5, 0.2]))
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    """Vượt dung lượng: xóa file cũ nhất, giữ file vừa ghi dù cùng mtime với file cũ"""
+    cache = DetectionCache(str(tmp_path / "cache"))
+    old = cache.open(_video(tmp_path, "old.mp4"), "model", (640, 360))
+    old.put(416, 1, _raw(200))
+    old.save()
+    new = cache.open(_video(tmp_path, "new.mp4"), "model", (640, 360))
+    new.put(416, 1, _raw(20))
+    new.save()
+
+    # Hệ thống file lưu mtime theo giây: hai file có cùng mtime
+    for path in (old.path_for(416), new.path_for(416)):
+        os.utime(path, (1_700_000_000, 1_700_000_000))
+    cache.max_bytes = os.path.getsize(new.path_for(416))
+    cache.evict()
+    assert not os.path.exists(old.path_for(416))
+    assert os.path.exists(new.path_for(416))
+
+    # File vừa ghi luôn được giữ kể cả khi một mình nó vượt dung lượng
+    cache.max_bytes = 0
+    new.put(416, 2, _raw(5))
+    new.save()
+    assert os.path.exists(new.path_for(416))
@@ -0,0 +1,41 @@
+from event_store import EventStore
+
+
+def _record(last_frame, track_id=3):
+    return {'id': track_id, 'type': 'car', 'count': last_frame, 'first_frame': 10,
+            'last_frame': last_frame, 'best_conf': 0.8}
+
+
+def test_rerecorded_track_is_counted_once(tmp_path):
+    """Ghi lại cùng một xe và cùng sự kiện: rollups không tăng, dòng xe được cập nhật"""
+    store = EventStore(str(tmp_path / "events.db"), bucket_seconds=60, flush_interval=0.05)
+    recorder = store.recorder("cam", fps=10, start_time=6000)
+    enter = {'roi_id': 1, 'id': 3, 'type': 'car', 'event': 'enter', 'frame': 10}
+    recorder.on_event(enter)
+    recorder.write(1, _record(20))
+    store.close()
+
+    store = EventStore(str(tmp_path / "events.db"), bucket_seconds=60, flush_interval=0.05)
+    recorder = store.recorder("cam", fps=10, start_time=6000)
+    recorder.on_event(enter)
+    recorder.write(1, _record(30))
+    recorder.write(1, _record(40))
+    recorder.write(1, _record(40, track_id=4))
+    store.close()
+
+    counts = store.counts()
+    assert [(row['bucket'], row['vehicles'], row['entries']) for row in counts] == [(6000, 2, 1)]
+    tracks = {row['track_id']: row for row in store.tracks()}
+    assert sorted(tracks) == [3, 4]
+    assert tracks[3]['last_frame'] == 40
+
+
+def test_counts_rounds_until_up_to_a_bucket(tmp_path):
+    """until ở giữa khung: khung chứa until được tính, khung sau thì không"""
+    store = EventStore(str(tmp_path / "events.db"), bucket_seconds=60, flush_interval=0.05)
+    for start_time in (6000, 6060, 6120):
+        store.recorder("cam", fps=10, start_time=start_time).write(1, _record(20))
+    store.close()
+
+    assert [row['bucket'] for row in store.counts(since=6030, until=6090)] == [6000, 6060]
+    assert [row['bucket'] for row in store.counts(since=6060, until=6120)] == [6060]
@@ -0,0 +1,57 @@
+import numpy as np
+
+from motion_gate import MotionGate
+
+
+ROIS = {1: (160, 120, 320, 240)}
+
+
+def _frame(blob_x=None, blob_y=160):
+    """Nền xám tĩnh, thêm một khối trắng 30x30 tại (blob_x, blob_y)"""
+    frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+    if blob_x is not None:
+        frame[blob_y:blob_y + 30, blob_x:blob_x + 30] = 255
+    return frame
+
+
+def _run(gate, frames, start_idx, detect_skip_frames=2):
+    """Quyết định của gate cho từng frame, báo detected() khi YOLO chạy"""
+    decisions = []
+    for frame_idx, frame in enumerate(frames, start_idx):
+        run, force = gate.decide(frame, ROIS, frame_idx, detect_skip_frames)
+        if run:
+            gate.detected(frame_idx)
+        decisions.append((run, force))
+    return decisions
+
+
+def test_static_frames_skip_inference():
+    gate = MotionGate(refresh_interval=None)
+    decisions = _run(gate, [_frame()] * 20, 1)
+    # Frame đầu chưa có frame trước để so: luôn detect
+    assert decisions[0] == (True, False)
+    assert all(decision == (False, False) for decision in decisions[1:])
+    assert gate.static_frames == 19
+    assert gate.skipped_inferences == 9
+
+
+def test_motion_inside_roi_forces_inference():
+    gate = MotionGate(refresh_interval=None)
+    _run(gate, [_frame()] * 5, 1)
+    # Khối di chuyển bên ngoài ROI không làm chạy YOLO
+    outside = _run(gate, [_frame(blob_x=10 + 8 * i, blob_y=20) for i in range(5)], 6)
+    assert all(decision == (False, False) for decision in outside)
+
+    inside = _run(gate, [_frame(blob_x=180 + 8 * i) for i in range(5)], 11)
+    assert inside[0] == (True, True)
+    assert all(decision == (True, False) for decision in inside[1:])
+    assert gate.motion_starts == 1
+
+    # Khối dừng lại: quay về dùng kết quả cũ
+    assert _run(gate, [_frame(blob_x=212)] * 3, 16)[1:] == [(False, False)] * 2
+
+
+def test_refresh_interval_detects_static_scene():
+    gate = MotionGate(refresh_interval=10)
+    decisions = _run(gate, [_frame()] * 25, 1)
+    assert [idx for idx, (run, _) in enumerate(decisions, 1) if run] == [1, 11, 21]
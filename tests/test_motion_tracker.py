@@ -0,0 +1,16 @@
+from motion_tracker import MotionTracker
+
+
+def test_backward_jump_drops_tracks_from_later_frames():
+    tracker = MotionTracker(max_age=30)
+    for frame_idx in range(1, 11):
+        x = 100 + 5 * frame_idx
+        tracker.update([(x, 100, x + 40, 140)], [0.9], 0.4, frame_idx)
+    first_id = next(iter(tracker.tracks))
+
+    # Phát lại từ frame 3 sau khi tua lùi: track cũ không được giữ lại
+    tracked = tracker.update([(300, 300, 340, 340)], [0.9], 0.4, 3)
+    assert first_id not in tracker.tracks
+    assert tracked[0][4] != first_id
+    assert all(3 - track.last_update >= 0 for track in tracker.tracks.values())
+
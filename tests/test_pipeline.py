@@ -0,0 +1,161 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+from metrics import MetricsRegistry
+from pipeline import FramePipeline, BLOCK
+from roi_manager import ROIManager
+from stream_source import StreamSource
+from vehicle_processor import VehicleProcessor
+from video_source import VideoSource
+
+
+class ListSource(VideoSource):
+    """Nguồn video gồm các frame đen trong bộ nhớ"""
+
+    def __init__(self, count, size=(64, 48)):
+        self.frames = [np.full((size[1], size[0], 3), i % 256, dtype=np.uint8) for i in range(count)]
+        self.frame_count = count
+        self.fps = 25.0
+        self.position = 0
+        self._set_native_size(*size)
+
+    def read(self, stop_event=None):
+        if self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position].copy()
+        self.position += 1
+        return True, frame
+
+    def seek(self, index):
+        self.position = min(max(index, 0), len(self.frames))
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_seek_after_decode_finished_is_not_lost():
+    """Seek khi decode đã gửi _END nhưng frame cuối chưa được vẽ"""
+    shown = []
+    finished = threading.Event()
+
+    def on_frame(frame, frame_idx):
+        shown.append(frame_idx)
+        time.sleep(0.02)
+
+    source = ListSource(8)
+    pipeline = FramePipeline(source, None, ROIManager(frame_size=source.frame_size), VehicleProcessor(save_dir=None),
+                             drop_policy=BLOCK, queue_size=8, realtime=False, annotate=False,
+                             on_frame=on_frame, on_finished=finished.set)
+    pipeline.start()
+    assert _wait(lambda: not pipeline._threads[0].is_alive())
+    assert not finished.is_set()
+
+    pipeline.seek(3)
+    assert _wait(lambda: shown and shown[-1] == 3)
+    assert pipeline.is_running() and not pipeline.is_playing()
+
+    pipeline.resume()
+    assert finished.wait(5)
+    assert shown[-1] == 8
+    pipeline.stop()
+
+
+class DownStream(StreamSource):
+    """Camera không kết nối được"""
+
+    def _open(self):
+        raise IOError(f"Cannot open stream: {self.url}")
+
+
+def test_stop_while_stream_is_down_does_not_block():
+    source = DownStream("rtsp://camera/down", frame_size=(64, 48), reconnect_delay=(5.0, 5.0))
+    pipeline = FramePipeline(source, None, ROIManager(frame_size=(64, 48)), VehicleProcessor(save_dir=None),
+                             annotate=False)
+    pipeline.start()
+    time.sleep(0.1)
+    decode = pipeline._threads[0]
+
+    start = time.monotonic()
+    pipeline.stop()
+    assert time.monotonic() - start < 1.0
+    assert not decode.is_alive()
+    source.release()
+
+
+class FailingDetector:
+    """Detector lỗi ở mọi frame"""
+
+    detect_imgsz = 640
+    last_detect_frame = 0
+    last_detections = []
+
+    def detect(self, frame, target_classes, frame_idx, skip_frames, **kwargs):
+        raise RuntimeError("model failed")
+
+    def detect_batch(self, frames, target_classes, regions, caches, frame_indices):
+        raise RuntimeError("model failed")
+
+
+def _wait_in_thread(pipeline, timeout=5.0):
+    """Gọi pipeline.wait() ở thread khác: (đã xong, lỗi wait() ném ra)"""
+    raised = []
+
+    def run():
+        try:
+            pipeline.wait()
+        except Exception as e:
+            raised.append(e)
+
+    waiter = threading.Thread(target=run, daemon=True)
+    waiter.start()
+    waiter.join(timeout)
+    return not waiter.is_alive(), raised
+
+
+def test_inference_error_ends_pipeline():
+    """Detector lỗi: wait() không bị treo (decode BLOCK với video dài) và ném lại lỗi"""
+    finished = threading.Event()
+    metrics = MetricsRegistry()
+    source = ListSource(500)
+    pipeline = FramePipeline(source, FailingDetector(), ROIManager(frame_size=source.frame_size),
+                             VehicleProcessor(save_dir=None), drop_policy=BLOCK, realtime=False,
+                             annotate=False, metrics=metrics, on_finished=finished.set)
+    pipeline.start()
+    done, raised = _wait_in_thread(pipeline)
+    assert done
+    assert len(raised) == 1 and str(raised[0]) == "model failed"
+    assert finished.is_set()
+    assert metrics.counter('errors_total', "Errors by component", ('where',)).values[('inference',)] == 1
+    with pytest.raises(RuntimeError):
+        pipeline.wait()
+    pipeline.stop()
+
+
+def test_batched_inference_error_ends_pipeline():
+    """Model của batcher lỗi: request.wait() ném lỗi nhưng wait() của pipeline vẫn trả về"""
+    finished = threading.Event()
+    detector = FailingDetector()
+    batcher = MicroBatcher(detector, batch_size=4)
+    batcher.start()
+    source = ListSource(500)
+    pipeline = FramePipeline(source, detector, ROIManager(frame_size=source.frame_size),
+                             VehicleProcessor(save_dir=None), drop_policy=BLOCK, realtime=False,
+                             annotate=False, batcher=batcher, on_finished=finished.set)
+    pipeline.set_target_classes(['car'])
+    pipeline.start()
+    done, raised = _wait_in_thread(pipeline)
+    batcher.stop()
+    assert done
+    assert len(raised) == 1 and str(raised[0]) == "model failed"
+    assert finished.is_set()
+    pipeline.stop()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from regions import merge_tile_boxes, plan_regions, plan_tiles, shift_raw
+
+
+def test_region_crop_offsets_map_back_to_frame():
+    """Box tìm thấy trong ảnh cắt được dịch về đúng vị trí trên frame"""
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    frame[410:430, 900:940] = 255   # "xe" nằm trong ROI thứ hai
+
+    plan = plan_regions([(100, 100, 200, 200), (850, 380, 1000, 480)], (1280, 720), 640, padding=16)
+    assert plan is not None
+    assert plan.rects == [(84, 84, 216, 216), (834, 364, 1016, 496)]
+    assert plan.imgsz < 640
+
+    crops = plan.crops(frame)
+    assert [crop.shape[:2] for crop in crops] == [(132, 132), (132, 182)]
+    ys, xs = np.nonzero(crops[1][:, :, 0])
+    raw = [[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1, 0.9, 2]]
+    x1, y1 = plan.rects[1][:2]
+    np.testing.assert_array_equal(shift_raw(raw, (x1, y1))[0, :4], (900, 410, 940, 430))
+
+
+def test_large_roi_detects_full_frame():
+    """ROI gần bằng cả frame: detect cả frame rẻ hơn nên không cắt"""
+    assert plan_regions([(0, 0, 1250, 700)], (1280, 720), 640) is None
+    assert plan_regions([], (1280, 720), 640) is None
+
+
+def test_tiles_cover_frame_not_multiple_of_tile_size():
+    """Frame 1000x700 với tile 320: mọi pixel nằm trong ít nhất một tile, tile không vượt frame"""
+    plan = plan_tiles((1000, 700), (500, 350), tile_size=320, overlap=0.2, padding=0)
+    covered = np.zeros((700, 1000), dtype=bool)
+    for x1, y1, x2, y2 in plan.rects:
+        assert (x2 - x1, y2 - y1) == (320, 320)
+        assert 0 <= x1 and 0 <= y1 and x2 <= 1000 and y2 <= 700
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    assert plan.scale == (0.5, 0.5)
+    assert plan.imgsz == 320
+
+
+def test_box_spanning_two_tiles_is_merged():
+    """Xe nằm trên mép hai tile: phần bị cắt ở tile trái bị bỏ, giữ box đầy đủ của tile phải"""
+    plan = plan_tiles((1000, 320), (500, 160), tile_size=320, overlap=0.2, padding=0)
+    left, right = plan.rects[0], plan.rects[1]
+    assert left[2] > right[0]
+    # Xe ở x 280..360 của frame gốc: tile trái chỉ thấy đến mép 320
+    car = (280, 100, 360, 160)
+    cut = [[car[0] - left[0], car[1], left[2] - left[0], car[3], 0.6, 2]]
+    full = [[car[0] - right[0], car[1], car[2] - right[0], car[3], 0.9, 2]]
+    other = [[car[0] - right[0], car[1], car[2] - right[0], car[3], 0.5, 7]]
+    raw = np.concatenate([
+        shift_raw(cut, left[:2], plan.scale),
+        shift_raw(full, right[:2], plan.scale),
+        shift_raw(other, right[:2], plan.scale),
+    ])
+    merged = merge_tile_boxes(raw)
+    np.testing.assert_allclose(merged, [(140, 50, 180, 80, 0.9, 2), (140, 50, 180, 80, 0.5, 7)])
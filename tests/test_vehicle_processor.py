@@ -0,0 +1,75 @@
+import numpy as np
+
+from detections import Detections
+from roi_manager import ROIManager
+from vehicle_processor import VehicleProcessor
+
+
+CLASS_NAMES = ['car']
+
+
+def _boxes(*rects):
+    return Detections(
+        np.array(rects, dtype=np.int32).reshape(-1, 4),
+        np.full(len(rects), 0.9, dtype=np.float32),
+        np.zeros(len(rects), dtype=np.int32),
+        CLASS_NAMES
+    )
+
+
+def test_centroid_track_expires_during_gap():
+    """Xe mới sau một khoảng đường vắng được đếm là xe khác"""
+    roi_manager = ROIManager(tracker_type='centroid')
+    roi_id = roi_manager.add_roi(0, 0, 900, 520)
+    processor = VehicleProcessor(save_dir=None)
+    frame = np.zeros((520, 900, 3), dtype=np.uint8)
+
+    processor.process_rois(frame, _boxes((100, 100, 140, 140)), roi_manager, 0, draw=False)
+    for frame_idx in range(1, 500):
+        processor.process_rois(frame, Detections.empty(CLASS_NAMES), roi_manager, frame_idx, draw=False)
+    assert not roi_manager.tracker.tracks
+    assert not roi_manager.memberships
+
+    processor.process_rois(frame, _boxes((110, 100, 150, 140)), roi_manager, 500, draw=False)
+    assert len(processor.detected_vehicles[roi_id]) == 2
+    assert processor.get_class_counts()[roi_id] == {'car': 2}
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, roi_id, record):
+        self.rows.append((roi_id, record['id']))
+
+
+def test_filter_reset_does_not_duplicate_sink_rows():
+    """Đổi bộ lọc hai lần rồi đếm lại: mỗi xe chỉ có một dòng trong sink"""
+    roi_manager = ROIManager(tracker_type='centroid')
+    roi_id = roi_manager.add_roi(0, 0, 900, 520)
+    sink = ListSink()
+    processor = VehicleProcessor(save_dir=None, sink=sink)
+    frame = np.zeros((520, 900, 3), dtype=np.uint8)
+
+    processor.process_rois(frame, _boxes((100, 100, 140, 140)), roi_manager, 0, draw=False)
+    for _ in range(2):
+        processor.reset_all()
+        roi_manager.reset_all()
+    processor.process_rois(frame, _boxes((100, 100, 140, 140)), roi_manager, 1, draw=False)
+    processor.close()
+    assert sink.rows == [(roi_id, 0)]
+
+
+def test_source_reset_flushes_records_once():
+    """Đổi nguồn video: record còn trong bộ nhớ được lưu vào sink một lần"""
+    roi_manager = ROIManager(tracker_type='centroid')
+    roi_id = roi_manager.add_roi(0, 0, 900, 520)
+    sink = ListSink()
+    processor = VehicleProcessor(save_dir=None, sink=sink)
+    frame = np.zeros((520, 900, 3), dtype=np.uint8)
+
+    processor.process_rois(frame, _boxes((100, 100, 140, 140)), roi_manager, 0, draw=False)
+    processor.reset_all(flush=True)
+    processor.reset_all(flush=True)
+    processor.close()
+    assert sink.rows == [(roi_id, 0)]
@@ -1,51 +1,137 @@
-from collections import defaultdict
-import math
+from collections import deque
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """Ma trận IoU giữa hai tập box (N, 4) và (M, 4)"""
+    lt = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    rb = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def assign(cost, max_cost):
+    """
+    Ghép cặp một-một giữa hàng (detection) và cột (track) với tổng cost nhỏ nhất.
+    Cặp có cost >= max_cost bị loại.
+
+    Dùng thuật toán Hungarian của scipy nếu có, nếu không thì ghép tham lam
+    theo cost tăng dần (vẫn đảm bảo một-một).
+
+    Returns:
+        List các cặp (row, col)
+    """
+    if cost.size == 0:
+        return []
+
+    if linear_sum_assignment is not None:
+        gated = np.where(cost < max_cost, cost, max_cost + 1e6)
+        rows, cols = linear_sum_assignment(gated)
+        return [(r, c) for r, c in zip(rows.tolist(), cols.tolist()) if cost[r, c] < max_cost]
+
+    rows, cols = np.nonzero(cost < max_cost)
+    order = np.argsort(cost[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    pairs = []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+class Track:
+    """Trạng thái của một đối tượng đang được theo dõi"""
+
+    __slots__ = ('id', 'box', 'history', 'missed')
+
+    def __init__(self, track_id, box, max_history):
+        self.id = track_id
+        self.box = box
+        self.history = deque(maxlen=max_history)
+        self.missed = 0
+
 
 class Tracker:
-    def __init__(self, max_distance=100, max_history=30):
-        self.track_history = defaultdict(lambda: [])
+    def __init__(self, max_distance=100, max_history=30, max_missed=5, metric='distance', min_iou=0.3):
+        """
+        Args:
+            max_distance: Khoảng cách tâm tối đa để coi là cùng đối tượng (metric='distance')
+            max_history: Số điểm lịch sử tối đa lưu cho mỗi track
+            max_missed: Số lần update liên tiếp một track được phép không khớp trước khi bị xóa
+            metric: 'distance' (khoảng cách tâm) hoặc 'iou'
+            min_iou: IoU tối thiểu để coi là cùng đối tượng (metric='iou')
+        """
+        if metric not in ('distance', 'iou'):
+            raise ValueError(f"Unknown metric: {metric}")
+        self.tracks = {}
         self.id_count = 0
         self.max_distance = max_distance
         self.max_history = max_history
+        self.max_missed = max_missed
+        self.metric = metric
+        self.min_iou = min_iou
+
+    @property
+    def track_history(self):
+        """Lịch sử tâm của các track đang hoạt động {id: [(cx, cy), ...]}"""
+        return {track_id: list(track.history) for track_id, track in self.tracks.items()}
+
+    def _cost_matrix(self, rects, track_boxes):
+        """Ma trận cost (detections x tracks) và ngưỡng cost tối đa"""
+        if self.metric == 'iou':
+            return 1.0 - box_iou_matrix(rects, track_boxes), 1.0 - self.min_iou
+
+        centers = (rects[:, :2] + rects[:, 2:]) / 2.0
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2.0
+        diff = centers[:, None, :] - track_centers[None, :, :]
+        return np.hypot(diff[..., 0], diff[..., 1]), self.max_distance
 
     def update(self, objects_rect):
         """
         Cập nhật tracker với danh sách bounding box mới.
         objects_rect: [(x1, y1, x2, y2), ...]
-        return: [(x1, y1, x2, y2, id), ...]
+        return: [(x1, y1, x2, y2, id), ...] theo đúng thứ tự objects_rect
         """
-        objects_bbs_ids = []
-
-        for rect in objects_rect:
-            x1, y1, x2, y2 = rect
-            cx = (x1 + x2) // 2
-            cy = (y1 + y2) // 2
-
-            same_object_detected = False
-
-            for obj_id, track in self.track_history.items():
-                prev_center = track[-1]
-                dist = math.hypot(cx - prev_center[0], cy - prev_center[1])
-                
-                if dist < self.max_distance:
-                    self.track_history[obj_id].append((cx, cy))
-
-                    if len(self.track_history[obj_id]) > self.max_history:
-                        self.track_history[obj_id].pop(0)
+        rects = np.asarray(objects_rect, dtype=np.float32).reshape(-1, 4)
+        tracks = list(self.tracks.values())
 
-                    objects_bbs_ids.append([x1, y1, x2, y2, obj_id])
-                    same_object_detected = True
-                    break
+        assigned = [None] * len(rects)
+        if len(rects) and tracks:
+            track_boxes = np.array([track.box for track in tracks], dtype=np.float32)
+            cost, max_cost = self._cost_matrix(rects, track_boxes)
+            for row, col in assign(cost, max_cost):
+                assigned[row] = tracks[col]
 
-            if not same_object_detected:
-                self.track_history[self.id_count].append((cx, cy))
-                objects_bbs_ids.append([x1, y1, x2, y2, self.id_count])
+        objects_bbs_ids = []
+        matched_ids = set()
+        for rect, track in zip(objects_rect, assigned):
+            x1, y1, x2, y2 = rect
+            if track is None:
+                track = Track(self.id_count, None, self.max_history)
+                self.tracks[track.id] = track
                 self.id_count += 1
 
-        new_track_history = defaultdict(lambda: [])
-        for obj_bb_id in objects_bbs_ids:
-            _, _, _, _, object_id = obj_bb_id
-            new_track_history[object_id] = self.track_history[object_id]
+            track.box = (x1, y1, x2, y2)
+            track.history.append(((x1 + x2) // 2, (y1 + y2) // 2))
+            track.missed = 0
+            matched_ids.add(track.id)
+            objects_bbs_ids.append([x1, y1, x2, y2, track.id])
+
+        for track in tracks:
+            if track.id not in matched_ids:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[track.id]
 
-        self.track_history = new_track_history.copy()
         return objects_bbs_ids
@@ -1,18 +1,35 @@
 import sys
-import cv2
+import contextlib
+import sqlite3
 import time
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton,
-    QVBoxLayout, QHBoxLayout, QListWidget,
+    QVBoxLayout, QHBoxLayout, QListWidget, QListView,
     QCheckBox, QGroupBox, QFileDialog, QSlider,
-    QSpinBox
+    QSpinBox, QInputDialog
 )
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
 
+from coords import DEFAULT_LONG_SIDE, REFERENCE_SIZE
 from video_widget import VideoWidget
+from vehicle_model import VehicleListModel
 from detector import VehicleDetector
 from roi_manager import ROIManager
 from vehicle_processor import VehicleProcessor
+from pipeline import FramePipeline, DROP_OLDEST
+from motion_gate import MotionGate
+from adaptive import AdaptiveController
+from detection_cache import DetectionCache
+from record_sink import JsonlSink
+from event_store import EventStore
+from metrics import MetricsRegistry, MetricsServer, MetricsLogger
+from video_source import open_source
+
+
+class PipelineSignals(QObject):
+    """Signal để chuyển frame từ thread của pipeline về GUI thread"""
+    frame_ready = pyqtSignal(object, int)
+    finished = pyqtSignal()
 
 
 class MainWindow(QWidget):
@@ -23,24 +40,78 @@ class MainWindow(QWidget):
         self.setWindowTitle("Vehicle Detection Dashboard")
         self.resize(1300, 720)
 
-        self.cap = None
+        self.source = None
+        self.pipeline = None
         self.total_frames = 0
         self.current_frame = 0
         self.is_playing = False
         
-        self.frame_width = 900
-        self.frame_height = 520
+        # Frame làm việc: cạnh dài (giữ tỉ lệ video), (width, height) cố định hoặc None = độ phân giải gốc
+        self.frame_size = DEFAULT_LONG_SIDE
+        # Kích thước làm việc hiện tại, đổi theo video đang mở (tọa độ của ô nhập ROI)
+        self.frame_width, self.frame_height = REFERENCE_SIZE
         
         self.model_path = "yolov8s.pt"
         self.class_file = "coco.txt"
         self.confidence_threshold = 40
         self.detect_skip_frames = 2
         self.detect_imgsz = 416
+        self.tracker_type = "centroid"  # "motion" để dự đoán vị trí xe khi skip frames
+        self.low_confidence = None      # Ví dụ 0.1 khi dùng tracker "motion"
+        self.roi_detect = False         # True: chỉ detect phần ảnh quanh các ROI
+        # Detect các tile quanh ROI trên frame gốc để thấy xe nhỏ ở xa,
+        # ví dụ {'tile_size': 640, 'overlap': 0.2} (None = tắt)
+        self.tiling = None
+        # Vạch đếm theo hướng [(x1, y1, x2, y2), ...] chuẩn hóa 0-1, ví dụ [(0.0, 0.6, 1.0, 0.6)]
+        self.count_lines = []
+        self.use_motion_gate = False    # True: bỏ qua YOLO khi các ROI đứng yên
+        self.adaptive = False           # True: tự chỉnh skip frames/imgsz khi máy quá tải
+        # Cache kết quả detect thô trên đĩa: xem lại video với ROI/loại xe/ngưỡng khác
+        # không cần chạy lại YOLO (None = tắt)
+        self.detection_cache_dir = ".detection_cache"
+        self.display_fps = 30           # Số lần vẽ video tối đa mỗi giây, độc lập với tốc độ xử lý
+        self.max_vehicle_rows = 2000    # Số xe tối đa giữ trong danh sách (xe cũ nhất bị bỏ)
+        # Chạy camera liên tục: bỏ record xe khỏi bộ nhớ sau chừng này giây không xuất hiện
+        self.evict_after_seconds = 600
+        self.vehicle_log = None         # File JSON Lines lưu record xe khi không dùng event_db
+        # Database SQLite lưu xe, sự kiện vào/ra và số xe theo khung 5 phút (None = không lưu)
+        self.event_db = "events.db"
+        # Số liệu pipeline: /metrics và /profile trên cổng này (None = tắt, không tốn gì),
+        # ghi ra stderr mỗi metrics_log_interval giây (None = không ghi)
+        self.metrics_port = None
+        self.metrics_log_interval = None
+        
+        self.metrics = None
+        self.metrics_server = None
+        self.metrics_log = None
+        if self.metrics_port is not None or self.metrics_log_interval:
+            self.metrics = MetricsRegistry()
+            if self.metrics_port is not None:
+                try:
+                    self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+                except OSError as e:
+                    print(f"Error starting metrics server: {e}")
+            if self.metrics_log_interval:
+                self.metrics_log = MetricsLogger(self.metrics, self.metrics_log_interval)
         
         self.detector = None
-        self.roi_manager = ROIManager()
-        self.vehicle_processor = VehicleProcessor()
+        self.roi_manager = ROIManager(tracker_type=self.tracker_type,
+                                      frame_size=(self.frame_width, self.frame_height))
+        for coords in self.count_lines:
+            self.roi_manager.lines.add_line_normalized(*coords)
+        self.vehicle_processor = VehicleProcessor(
+            sink=JsonlSink(self.vehicle_log) if self.vehicle_log and not self.event_db else None
+        )
+        self.event_store = None
+        if self.event_db:
+            try:
+                self.event_store = EventStore(self.event_db)
+            except sqlite3.Error as e:
+                print(f"Error opening event store: {e}")
+                self.count_error('event_store')
         self.current_roi_id = None
+        self.detection_cache = DetectionCache(self.detection_cache_dir) if self.detection_cache_dir else None
+        self.video_cache = None
         
         self.fps_start_time = time.time()
         self.fps_frame_count = 0
@@ -51,19 +122,22 @@ class MainWindow(QWidget):
 
     def setup_ui(self):
         """Thiết lập giao diện"""
-        self.video_widget = VideoWidget()
+        self.video_widget = VideoWidget(max_fps=self.display_fps)
         self.slider = QSlider(Qt.Horizontal)
         self.slider.sliderMoved.connect(self.seek_video)
 
         self.btn_open = QPushButton("Open Video")
+        self.btn_stream = QPushButton("Open Stream")
         self.btn_play = QPushButton("Play")
         self.btn_open.clicked.connect(self.open_video)
+        self.btn_stream.clicked.connect(self.open_stream)
         self.btn_play.clicked.connect(self.toggle_play)
 
         self.tools_panel = self.create_tools_panel()
 
         top_bar = QHBoxLayout()
         top_bar.addWidget(self.btn_open)
+        top_bar.addWidget(self.btn_stream)
         top_bar.addWidget(self.btn_play)
         top_bar.addStretch()
 
@@ -76,8 +150,9 @@ class MainWindow(QWidget):
         main_layout.addLayout(left_layout, 3)
         main_layout.addWidget(self.tools_panel, 1)
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_video)
+        self.pipeline_signals = PipelineSignals()
+        self.pipeline_signals.frame_ready.connect(self.on_frame_ready)
+        self.pipeline_signals.finished.connect(self.on_pipeline_finished)
 
     def init_detector(self):
         """Khởi tạo YOLO detector"""
@@ -86,7 +161,8 @@ class MainWindow(QWidget):
                 model_path=self.model_path,
                 class_file=self.class_file,
                 confidence_threshold=self.confidence_threshold,
-                detect_imgsz=self.detect_imgsz
+                detect_imgsz=self.detect_imgsz,
+                low_confidence=self.low_confidence
             )
             
             self.roi_manager.add_roi(0, 100, 600, 400)
@@ -95,6 +171,12 @@ class MainWindow(QWidget):
             print("Detector initialized successfully!")
         except Exception as e:
             print(f"Error initializing detector: {e}")
+            self.count_error('init_detector')
+
+    def count_error(self, where):
+        """Đếm lỗi vào metrics (errors_total) nếu đang bật"""
+        if self.metrics:
+            self.metrics.error(where)
 
     def get_target_classes(self):
         """Lấy danh sách loại phương tiện được chọn"""
@@ -167,7 +249,7 @@ class MainWindow(QWidget):
         hbox_x1.addWidget(QLabel("X1:"))
         self.spin_x1 = QSpinBox()
         self.spin_x1.setMinimum(0)
-        self.spin_x1.setMaximum(900)
+        self.spin_x1.setMaximum(self.frame_width)
         self.spin_x1.setValue(0)
         self.spin_x1.valueChanged.connect(self.on_roi_coords_changed)
         hbox_x1.addWidget(self.spin_x1)
@@ -176,7 +258,7 @@ class MainWindow(QWidget):
         hbox_y1.addWidget(QLabel("Y1:"))
         self.spin_y1 = QSpinBox()
         self.spin_y1.setMinimum(0)
-        self.spin_y1.setMaximum(520)
+        self.spin_y1.setMaximum(self.frame_height)
         self.spin_y1.setValue(0)
         self.spin_y1.valueChanged.connect(self.on_roi_coords_changed)
         hbox_y1.addWidget(self.spin_y1)
@@ -185,7 +267,7 @@ class MainWindow(QWidget):
         hbox_x2.addWidget(QLabel("X2:"))
         self.spin_x2 = QSpinBox()
         self.spin_x2.setMinimum(0)
-        self.spin_x2.setMaximum(900)
+        self.spin_x2.setMaximum(self.frame_width)
         self.spin_x2.setValue(600)
         self.spin_x2.valueChanged.connect(self.on_roi_coords_changed)
         hbox_x2.addWidget(self.spin_x2)
@@ -194,7 +276,7 @@ class MainWindow(QWidget):
         hbox_y2.addWidget(QLabel("Y2:"))
         self.spin_y2 = QSpinBox()
         self.spin_y2.setMinimum(0)
-        self.spin_y2.setMaximum(520)
+        self.spin_y2.setMaximum(self.frame_height)
         self.spin_y2.setValue(400)
         self.spin_y2.valueChanged.connect(self.on_roi_coords_changed)
         hbox_y2.addWidget(self.spin_y2)
@@ -208,8 +290,14 @@ class MainWindow(QWidget):
 
         group_list = QGroupBox("Xe trong ROI")
         vbox_list = QVBoxLayout()
-        self.list_widget = QListWidget()
-        vbox_list.addWidget(self.list_widget)
+        self.vehicle_model = VehicleListModel(max_rows=self.max_vehicle_rows, parent=self)
+        self.vehicle_view = QListView()
+        self.vehicle_view.setModel(self.vehicle_model)
+        self.vehicle_view.setUniformItemSizes(True)
+        self.counts_label = QLabel("")
+        self.counts_label.setWordWrap(True)
+        vbox_list.addWidget(self.counts_label)
+        vbox_list.addWidget(self.vehicle_view)
         group_list.setLayout(vbox_list)
 
         self.fps_label = QLabel("FPS: 0")
@@ -234,10 +322,18 @@ class MainWindow(QWidget):
 
     def reset_vehicle_list(self):
         """Reset danh sách vehicles khi thay đổi loại phương tiện"""
-        self.vehicle_processor.reset_all()
-        rois = self.roi_manager.get_all_rois()
-        for roi_id in rois:
-            self.roi_manager.reset_roi(roi_id)
+        if self.pipeline:
+            self.pipeline.set_target_classes(self.get_target_classes())
+        with self.state_lock():
+            self.vehicle_processor.reset_all()
+            self.roi_manager.reset_all()
+        self.update_vehicle_list()
+
+    def state_lock(self):
+        """Khóa trạng thái ROI/vehicles dùng chung với pipeline"""
+        if self.pipeline:
+            return self.pipeline.lock
+        return contextlib.nullcontext()
 
     def update_roi_list(self):
         """Cập nhật danh sách ROI trong list widget"""
@@ -248,6 +344,28 @@ class MainWindow(QWidget):
             item_text = f"ROI {roi_id}: ({x1}, {y1}) -> ({x2}, {y2})"
             self.roi_list_widget.addItem(item_text)
 
+    def set_frame_size(self, frame_size):
+        """Đổi kích thước frame làm việc: ROI giữ vị trí tương đối, ô nhập ROI theo kích thước mới"""
+        if tuple(frame_size) == (self.frame_width, self.frame_height):
+            return
+        self.frame_width, self.frame_height = frame_size
+        with self.state_lock():
+            self.roi_manager.set_frame_size(frame_size)
+        for spin, limit in ((self.spin_x1, self.frame_width), (self.spin_y1, self.frame_height),
+                            (self.spin_x2, self.frame_width), (self.spin_y2, self.frame_height)):
+            spin.blockSignals(True)
+            spin.setMaximum(limit)
+            spin.blockSignals(False)
+        self.roi_list_widget.blockSignals(True)
+        self.update_roi_list()
+        for i in range(self.roi_list_widget.count()):
+            item = self.roi_list_widget.item(i)
+            if f"ROI {self.current_roi_id}:" in item.text():
+                self.roi_list_widget.setCurrentItem(item)
+                break
+        self.roi_list_widget.blockSignals(False)
+        self.on_roi_selected()
+
     def on_roi_selected(self):
         """Khi chọn ROI từ list"""
         selected_items = self.roi_list_widget.selectedItems()
@@ -302,8 +420,9 @@ class MainWindow(QWidget):
             if x1 >= x2 or y1 >= y2:
                 return
             
-            self.roi_manager.update_roi_coords(self.current_roi_id, x1, y1, x2, y2)
-            self.vehicle_processor.reset_roi_vehicles(self.current_roi_id)
+            with self.state_lock():
+                self.roi_manager.update_roi_coords(self.current_roi_id, x1, y1, x2, y2)
+                self.vehicle_processor.reset_roi_vehicles(self.current_roi_id)
             self.roi_list_widget.blockSignals(True)
             self.update_roi_list()
             for i in range(self.roi_list_widget.count()):
@@ -317,7 +436,8 @@ class MainWindow(QWidget):
         """Thêm ROI mới với tọa độ mặc định"""
         x1, y1 = 0, 0
         x2, y2 = 200, 200
-        roi_id = self.roi_manager.add_roi(x1, y1, x2, y2)
+        with self.state_lock():
+            roi_id = self.roi_manager.add_roi(x1, y1, x2, y2)
         self.current_roi_id = roi_id
         self.spin_x1.blockSignals(True)
         self.spin_y1.blockSignals(True)
@@ -343,19 +463,33 @@ class MainWindow(QWidget):
     def on_delete_roi_clicked(self):
         """Xóa ROI được chọn"""
         if self.current_roi_id:
-            self.roi_manager.remove_roi(self.current_roi_id)
-            self.vehicle_processor.reset_roi_vehicles(self.current_roi_id)
+            with self.state_lock():
+                self.roi_manager.remove_roi(self.current_roi_id)
+                self.vehicle_processor.reset_roi_vehicles(self.current_roi_id)
             self.update_roi_list()
             if self.current_roi_id:
                 self.current_roi_id = None
                 self.clear_roi_editor()
 
     def update_vehicle_list(self):
-        """Cập nhật danh sách vehicles trong list widget"""
-        self.list_widget.clear()
-        vehicle_list = self.vehicle_processor.get_vehicle_list()
-        for item_text in vehicle_list:
-            self.list_widget.addItem(item_text)
+        """Cập nhật danh sách vehicles (chỉ các xe mới/thay đổi) và số xe theo ROI, loại"""
+        with self.state_lock():
+            changes = self.vehicle_processor.take_changes()
+            class_counts = self.vehicle_processor.get_class_counts()
+            line_summary = self.vehicle_processor.get_line_summary()
+        self.vehicle_model.apply_changes(changes)
+        lines = []
+        for roi_id in sorted(class_counts):
+            counts = ", ".join(f"{cls_name}: {count}" for cls_name, count in sorted(class_counts[roi_id].items()))
+            lines.append(f"ROI{roi_id} - {counts}")
+        for line_id in sorted(line_summary):
+            directions = " | ".join(
+                f"{direction}: " + ", ".join(f"{cls_name}: {count}"
+                                             for cls_name, count in sorted(line_summary[line_id][direction].items()))
+                for direction in ('in', 'out')
+            )
+            lines.append(f"Line{line_id} - {directions}")
+        self.counts_label.setText("\n".join(lines))
 
     def open_video(self):
         """Mở video file"""
@@ -364,132 +498,177 @@ class MainWindow(QWidget):
         )
         if not file_path:
             return
+        self.start_source(file_path)
+
+    def open_stream(self):
+        """Mở luồng camera trực tiếp (RTSP/HTTP)"""
+        url, ok = QInputDialog.getText(self, "Open Stream", "Stream URL (rtsp://, http://):")
+        url = url.strip()
+        if ok and url:
+            self.start_source(url)
+
+    def start_source(self, path):
+        """Mở file video hoặc URL luồng trực tiếp và khởi động pipeline"""
+        self.stop_pipeline()
+        self.save_detection_cache()
+        self.video_cache = None
+        if self.source:
+            self.source.release()
+            self.source = None
 
-        if self.cap:
-            self.cap.release()
-
-        self.cap = cv2.VideoCapture(file_path)
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        try:
+            self.source = open_source(path, self.frame_size)
+        except IOError as e:
+            print(f"Error opening video: {e}")
+            self.count_error('open_source')
+            return
+        if self.source.frame_size:
+            # Luồng trực tiếp: kích thước được cập nhật khi nhận frame đầu tiên
+            self.set_frame_size(self.source.frame_size)
+        if self.detection_cache and self.detector and not self.source.is_live and self.source.frame_size:
+            self.video_cache = self.detection_cache.open(
+                path, self.detector.cache_key(), self.source.frame_size
+            )
+        self.total_frames = self.source.frame_count
+        if self.evict_after_seconds is not None:
+            self.vehicle_processor.evict_after = int(self.evict_after_seconds * (self.source.fps or 25))
         self.slider.setMaximum(self.total_frames)
+        self.slider.setEnabled(not self.source.is_live)
         self.current_frame = 0
         
-        self.vehicle_processor.reset_all()
-        rois = self.roi_manager.get_all_rois()
-        for roi_id in rois:
-            self.roi_manager.reset_roi(roi_id)
-        self.list_widget.clear()
+        self.vehicle_processor.reset_all(flush=True)
+        self.roi_manager.reset_all()
+        self.update_vehicle_list()
+        if self.event_store:
+            # Sự kiện và xe của video mới được ghi với tên nguồn của nó
+            recorder = self.event_store.recorder(path, self.source.fps)
+            self.vehicle_processor.sink = recorder
+            self.vehicle_processor.on_event = recorder.on_event
         if self.detector:
-            self.detector.last_detect_frame = -1
-            self.detector.last_detections = []
+            self.detector.reset_cache()
+            self.detector.detect_imgsz = self.detect_imgsz  # Bỏ điều chỉnh của video trước
         self.fps_frame_count = 0
         self.fps_start_time = time.time()
         
+        self.pipeline = FramePipeline(
+            self.source, self.detector, self.roi_manager, self.vehicle_processor,
+            detect_skip_frames=self.detect_skip_frames,
+            drop_policy=DROP_OLDEST,
+            roi_detect=self.roi_detect,
+            tiling=self.tiling,
+            motion_gate=MotionGate() if self.use_motion_gate else None,
+            controller=AdaptiveController() if self.adaptive else None,
+            detection_cache=self.video_cache,
+            metrics=self.metrics,
+            on_frame=self.pipeline_signals.frame_ready.emit,
+            on_finished=self.pipeline_signals.finished.emit
+        )
+        self.pipeline.set_target_classes(self.get_target_classes())
+        
         self.is_playing = True
         self.btn_play.setText("Pause")
-        self.timer.start(30)
+        self.pipeline.start()
+
+    def stop_pipeline(self):
+        """Dừng pipeline đang chạy (nếu có)"""
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def save_detection_cache(self):
+        """Ghi các kết quả detect mới của video hiện tại vào cache trên đĩa"""
+        if not self.video_cache:
+            return
+        try:
+            self.video_cache.save()
+        except OSError as e:
+            print(f"Error saving detection cache: {e}")
+            self.count_error('detection_cache')
 
     def toggle_play(self):
         """Play/Pause video"""
-        if not self.cap:
+        if not self.pipeline:
             return
 
         self.is_playing = not self.is_playing
         if self.is_playing:
-            self.timer.start(30)
+            if not self.pipeline.is_running():
+                self.pipeline.start()
+            self.pipeline.resume()
             self.btn_play.setText("Pause")
         else:
-            self.timer.stop()
+            self.pipeline.pause()
             self.btn_play.setText("Play")
 
     def seek_video(self, frame_id):
         """Seek đến frame cụ thể"""
-        if not self.cap:
+        if not self.pipeline or self.source.is_live:
             return
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
         self.current_frame = frame_id
-        
-        ret, frame = self.cap.read()
-        if ret:
-            frame = cv2.resize(frame, (self.frame_width, self.frame_height))
-            
-            rois = self.roi_manager.get_all_rois()
-            for roi_id, roi_data in rois.items():
-                x1, y1, x2, y2 = roi_data['coords']
-                overlay = frame.copy()
-                cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 255, 0), -1)
-                cv2.addWeighted(overlay, 0.2, frame, 0.8, 0, frame)
-                color = ((roi_id * 50) % 255, (roi_id * 80) % 255, (roi_id * 120) % 255)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
-                cv2.putText(frame, f"ROI {roi_id}", (x1, y1 - 10), 
-                           cv2.FONT_HERSHEY_COMPLEX, 0.6, color, 2)
-            
-            if self.detector:
-                target_classes = self.get_target_classes()
-                vehicle_boxes = self.detector.detect(frame, target_classes, self.current_frame, self.detect_skip_frames, force=True)
-                if vehicle_boxes:
-                    for box in vehicle_boxes:
-                        x1, y1, x2, y2, cls_name, conf = box
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 1)
-                        conf_percent = int(conf * 100)
-                        label = f"{cls_name} {conf_percent}%"
-                        cv2.putText(frame, label, (x1, y1 - 10), 
-                                   cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 255, 255), 1)
-            
-            self.video_widget.update_frame(frame)
-
-    def update_video(self):
-        """Cập nhật video frame"""
-        if not self.cap or not self.is_playing:
-            return
-
-        ret, frame = self.cap.read()
-        if not ret:
-            self.timer.stop()
-            return
+        self.pipeline.seek(frame_id)
 
-        self.current_frame += 1
+    def on_frame_ready(self, frame, frame_idx):
+        """Nhận frame đã xử lý xong từ pipeline (chạy trên GUI thread)"""
+        if frame.shape[1] != self.frame_width or frame.shape[0] != self.frame_height:
+            self.set_frame_size((frame.shape[1], frame.shape[0]))
+        self.current_frame = frame_idx
         self.slider.blockSignals(True)
         self.slider.setValue(self.current_frame)
         self.slider.blockSignals(False)
-
-        frame = cv2.resize(frame, (self.frame_width, self.frame_height))
-        
-        rois = self.roi_manager.get_all_rois()
-        if rois:
-            overlay = frame.copy()
-            for roi_id, roi_data in rois.items():
-                x1, y1, x2, y2 = roi_data['coords']
-                cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 255, 0), -1)
-            cv2.addWeighted(overlay, 0.2, frame, 0.8, 0, frame)
-            
-            for roi_id, roi_data in rois.items():
-                x1, y1, x2, y2 = roi_data['coords']
-                color = ((roi_id * 50) % 255, (roi_id * 80) % 255, (roi_id * 120) % 255)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
-                cv2.putText(frame, f"ROI {roi_id}", (x1, y1 - 10), 
-                           cv2.FONT_HERSHEY_COMPLEX, 0.6, color, 2)
-        
-        if self.detector:
-            target_classes = self.get_target_classes()
-            vehicle_boxes = self.detector.detect(frame, target_classes, self.current_frame, self.detect_skip_frames)
-            
-            if vehicle_boxes:
-                frame = self.vehicle_processor.process_rois(frame, vehicle_boxes, rois)
         
+        # Đếm theo số frame nhận được vì pipeline có thể bỏ frame khi quá tải
         self.fps_frame_count += 1
-        if self.current_frame % 30 == 0:
+        if self.fps_frame_count % 30 == 0:
             elapsed = time.time() - self.fps_start_time
             if elapsed > 0:
                 self.current_fps = 30 / elapsed
-                self.fps_label.setText(f"FPS: {self.current_fps:.1f}")
+                text = f"FPS: {self.current_fps:.1f}"
+                if self.pipeline and self.pipeline.motion_gate:
+                    text += f" | Skipped: {self.pipeline.motion_gate.skipped_inferences}"
+                if self.pipeline and self.pipeline.latency:
+                    latency = self.pipeline.latency.stats()
+                    if latency['count']:
+                        text += f" | Latency: {latency['p50_ms']:.0f} ms"
+                    if self.source.state != 'streaming':
+                        text += f" | {self.source.state}"
+                with self.state_lock():
+                    memory = self.vehicle_processor.memory_stats()
+                if memory['rss_bytes']:
+                    text += f" | Mem: {memory['rss_bytes'] / (1 << 20):.0f} MB"
+                text += f" | Records: {memory['records']}"
+                self.fps_label.setText(text)
             self.fps_start_time = time.time()
-        
-        if self.current_frame % 30 == 0:
             self.update_vehicle_list()
         
         self.video_widget.update_frame(frame)
 
+    def on_pipeline_finished(self):
+        """Khi pipeline đã xử lý hết video"""
+        self.is_playing = False
+        self.btn_play.setText("Play")
+        with self.state_lock():
+            self.vehicle_processor.flush_snapshots()
+        self.save_detection_cache()
+        self.update_vehicle_list()
+
+    def closeEvent(self, event):
+        self.stop_pipeline()
+        self.save_detection_cache()
+        if self.source:
+            self.source.release()
+        sink = self.vehicle_processor.sink
+        self.vehicle_processor.close()
+        if isinstance(sink, JsonlSink):
+            sink.close()
+        if self.event_store:
+            self.event_store.close()
+        if self.metrics_log:
+            self.metrics_log.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,100 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+
+class VehicleListModel(QAbstractListModel):
+    """
+    Danh sách xe trong các ROI cho QListView, cập nhật theo từng thay đổi.
+
+    Model nhận các thay đổi của VehicleProcessor.take_changes(): xe mới được
+    thêm vào cuối (beginInsertRows), xe đã có chỉ phát dataChanged cho dòng
+    của nó; chuỗi hiển thị chỉ được tạo khi view cần vẽ dòng đó. Khi vượt
+    max_rows, các dòng cũ nhất bị bỏ theo từng khối.
+    """
+
+    def __init__(self, max_rows=2000, parent=None):
+        """
+        Args:
+            max_rows: Số dòng tối đa được giữ (xe cũ nhất bị bỏ trước)
+            parent: QObject cha
+        """
+        super().__init__(parent)
+        self.max_rows = max_rows
+        self.trim_chunk = max(1, max_rows // 10)
+        self.keys = []      # [(roi_id, vehicle_id)] theo thứ tự dòng
+        self.rows = {}      # {(roi_id, vehicle_id): chỉ số dòng}
+        self.records = {}   # {(roi_id, vehicle_id): record}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.keys):
+            return None
+        roi_id, vehicle_id = self.keys[index.row()]
+        record = self.records[(roi_id, vehicle_id)]
+        if role == Qt.DisplayRole:
+            return f"ROI{roi_id} - ID {vehicle_id}: {record['type']} (Count: {record['count']})"
+        if role == Qt.ToolTipRole:
+            tooltip = f"Frames {record['first_frame']} - {record['last_frame']}"
+            if record.get('snapshot'):
+                tooltip += f"\n{record['snapshot']}"
+            return tooltip
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.keys = []
+        self.rows = {}
+        self.records = {}
+        self.endResetModel()
+
+    def apply_changes(self, changes):
+        """Áp dụng kết quả của VehicleProcessor.take_changes()"""
+        if changes['cleared']:
+            self.clear()
+        if changes['removed_rois']:
+            self._remove_rois(changes['removed_rois'])
+
+        new_keys = []
+        changed_rows = []
+        for roi_id, record in changes['records']:
+            key = (roi_id, record['id'])
+            if key in self.rows:
+                changed_rows.append(self.rows[key])
+            elif key not in self.records:
+                new_keys.append(key)
+            self.records[key] = record
+
+        if changed_rows:
+            # Một tín hiệu cho cả khoảng dòng thay đổi thay vì từng dòng
+            self.dataChanged.emit(self.index(min(changed_rows)), self.index(max(changed_rows)),
+                                  [Qt.DisplayRole, Qt.ToolTipRole])
+        if new_keys:
+            first = len(self.keys)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_keys) - 1)
+            for row, key in enumerate(new_keys, first):
+                self.keys.append(key)
+                self.rows[key] = row
+            self.endInsertRows()
+        if len(self.keys) > self.max_rows:
+            self._trim()
+
+    def _trim(self):
+        """Bỏ các dòng cũ nhất để còn tối đa max_rows - trim_chunk dòng"""
+        count = len(self.keys) - self.max_rows + self.trim_chunk
+        self.beginRemoveRows(QModelIndex(), 0, count - 1)
+        for key in self.keys[:count]:
+            del self.records[key]
+        self.keys = self.keys[count:]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.endRemoveRows()
+
+    def _remove_rois(self, roi_ids):
+        """Bỏ mọi dòng của các ROI đã reset"""
+        if not any(roi_id in roi_ids for roi_id, _ in self.keys):
+            return
+        self.beginResetModel()
+        self.keys = [key for key in self.keys if key[0] not in roi_ids]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.records = {key: self.records[key] for key in self.keys}
+        self.endResetModel()
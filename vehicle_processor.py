@@ -1,107 +1,453 @@
+from collections import OrderedDict, deque
+
 import cv2
-import os
+
+from snapshot_writer import SnapshotWriter
+from sysinfo import process_rss
+
+
+class VehicleRecord:
+    """Thông tin một xe trong một ROI (dùng __slots__ để mỗi record nhỏ gọn)"""
+
+    __slots__ = ('id', 'type', 'count', 'first_frame', 'last_frame', 'best_conf', 'snapshot')
+
+    def __init__(self, vehicle_id, cls_name, frame_idx):
+        self.id = vehicle_id
+        self.type = cls_name
+        self.count = 0
+        self.first_frame = frame_idx
+        self.last_frame = frame_idx
+        self.best_conf = 0.0
+        self.snapshot = None
+
+    def as_dict(self):
+        record = {
+            'id': self.id,
+            'type': self.type,
+            'count': self.count,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'best_conf': round(self.best_conf, 4)
+        }
+        if self.snapshot is not None:
+            record['snapshot'] = self.snapshot
+        return record
 
 
 class VehicleProcessor:
     """Xử lý và tracking vehicles trong ROI"""
     
-    def __init__(self, save_dir="Cars"):
-        """Khởi tạo processor"""
+    def __init__(self, save_dir="Cars", on_event=None, max_events=1000,
+                 snapshot_writer=None, snapshot_metric='area', evict_after=None, sink=None):
+        """
+        Khởi tạo processor
+        
+        Args:
+            save_dir: Thư mục lưu ảnh vehicles (None = không lưu ảnh)
+            on_event: Callback on_event(record) khi xe vào/ra một ROI
+            max_events: Số sự kiện gần nhất giữ lại trong self.events (và self.crossings)
+            snapshot_writer: SnapshotWriter dùng để ghi ảnh (None = tạo mới trong save_dir)
+            snapshot_metric: Chọn ảnh tốt nhất của mỗi xe theo 'area' (box lớn nhất) hoặc 'conf'
+            evict_after: Bỏ record của xe khỏi bộ nhớ sau chừng này frame không xuất hiện
+                và tracker đã kết thúc track (None = giữ đến khi reset)
+            sink: Nơi lưu record trước khi bỏ khỏi bộ nhớ, có write(roi_id, record_dict)
+                (ví dụ record_sink.JsonlSink; None = không lưu)
+        """
+        if snapshot_metric not in ('area', 'conf'):
+            raise ValueError(f"Unknown snapshot metric: {snapshot_metric}")
         self.save_dir = save_dir
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
+        if snapshot_writer is None and save_dir:
+            snapshot_writer = SnapshotWriter(save_dir)
+        self.snapshot_writer = snapshot_writer
+        self.snapshot_metric = snapshot_metric
         
-        self.detected_vehicles = {}
+        self.detected_vehicles = {}   # {roi_id: {vehicle_id: VehicleRecord}}
+        # Số xe theo loại của mỗi ROI {roi_id: {cls_name: số xe}}, cập nhật khi có xe mới
+        self.class_counts = {}
+        self.track_types = {}
+        self.on_event = on_event
+        self.events = deque(maxlen=max_events)
+        self.event_counts = {}
+        # Số lượt cắt vạch đếm {line_id: {'in': {cls_name: n}, 'out': {cls_name: n}}}
+        self.line_counts = {}
+        self.crossings = deque(maxlen=max_events)
+        
+        # Ảnh tốt nhất của các track chưa kết thúc {id: (score, crop, roi_ids)}
+        self.best_crops = {}
+        self.last_tracked = []
+        
+        # Thay đổi từ lần take_changes() trước, cho danh sách xe trên GUI
+        self._changed = {}
+        self._removed_rois = set()
+        self._cleared = False
+        
+        # Record theo thứ tự xuất hiện gần nhất (cũ nhất ở đầu) để bỏ xe không còn xuất hiện
+        self.evict_after = evict_after
+        self.sink = sink
+        self._activity = OrderedDict()
+        self.evicted = {}
+        self.evicted_total = 0
     
-    def process_rois(self, frame, vehicle_boxes, rois):
+    def process_rois(self, frame, vehicle_boxes, roi_manager, frame_idx=None, draw=True, fresh=True):
         """
-        Xử lý tất cả ROI và tracking vehicles
+        Tracking vehicles bằng tracker chung của luồng và cập nhật từng ROI
+        
+        Ảnh xe được cắt từ frame trước khi vẽ; ảnh tốt nhất của mỗi xe được
+        ghi khi tracker kết thúc track đó.
         
         Args:
-            frame: Frame cần xử lý
-            vehicle_boxes: Danh sách vehicles đã detect [[x1, y1, x2, y2, cls_name, conf], ...]
-            rois: Dictionary các ROI từ ROIManager
+            frame: Frame cần xử lý (chưa vẽ)
+            vehicle_boxes: Detections đã detect
+            roi_manager: ROIManager của luồng (chứa ROI và tracker)
+            frame_idx: Số frame hiện tại (để lưu frame đầu/cuối của mỗi vehicle)
+            draw: Vẽ bounding box và nhãn lên frame
+            fresh: vehicle_boxes vừa được detect ở frame này (False = kết quả cũ do skip frames)
             
         Returns:
             Frame đã được vẽ vehicles
         """
-        if not vehicle_boxes or not rois:
+        self.last_tracked = []
+        rois = roi_manager.get_all_rois()
+        if not rois and not roi_manager.lines.lines:
             return frame
         
-        for roi_id, roi_data in rois.items():
-            x1_roi, y1_roi, x2_roi, y2_roi = roi_data['coords']
-            tracker = roi_data['tracker']
-            saved_ids = roi_data['saved_ids']
-            
-            roi_boxes = []
-            vehicle_info_map = []
-            
-            for box in vehicle_boxes:
-                x1, y1, x2, y2, cls_name, conf = box
-                cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-                
-                if x1_roi <= cx <= x2_roi and y1_roi <= cy <= y2_roi:
-                    roi_boxes.append([x1, y1, x2, y2])
-                    vehicle_info_map.append((cls_name, conf))
-            
-            if not roi_boxes:
+        tracker = roi_manager.tracker
+        uses_scores = getattr(tracker, 'uses_scores', False)
+        
+        if not fresh and hasattr(tracker, 'predict'):
+            # Frame không detect: dùng vị trí dự đoán của tracker thay vì box cũ
+            tracked = tracker.predict(frame_idx)
+            cls_names, confs = [], []
+        else:
+            boxes = vehicle_boxes if uses_scores or not vehicle_boxes else vehicle_boxes.high()
+            if uses_scores:
+                # Tracker cần cả frame không có detection để đánh dấu track bị mất
+                if boxes:
+                    tracked = tracker.update(boxes.xyxy.tolist(), boxes.conf.tolist(),
+                                             boxes.high_threshold, frame_idx)
+                else:
+                    tracked = tracker.update([], frame_idx=frame_idx)
+            else:
+                # Cả frame không có detection, để track bị mất hết hạn
+                tracked = tracker.update(boxes.xyxy.tolist() if boxes else [])
+            cls_names = boxes.names() if boxes else []
+            confs = boxes.conf.tolist() if boxes else []
+        
+        track_rois, events = roi_manager.update_memberships(tracked)
+        crossings = roi_manager.update_crossings(tracked) if roi_manager.lines.lines else ()
+        
+        for i, tracked_box in enumerate(tracked):
+            if tracked_box is None:
+                # Detection confidence thấp không khớp track nào
+                continue
+            x3, y3, x4, y4, vehicle_id = tracked_box
+            detected = i < len(cls_names)
+            if detected:
+                # Cả xe ngoài mọi ROI, để lượt cắt vạch đếm có loại xe
+                self.track_types[vehicle_id] = cls_names[i]
+            if not track_rois[i]:
                 continue
             
-            tracked = tracker.update(roi_boxes)
-            
-            if roi_id not in self.detected_vehicles:
-                self.detected_vehicles[roi_id] = {}
+            if detected:
+                cls_name, conf = cls_names[i], confs[i]
+            else:
+                cls_name = self.track_types.get(vehicle_id, "vehicle")
+                conf = getattr(tracker.tracks.get(vehicle_id), 'score', 0.0)
+            self.last_tracked.append((x3, y3, x4, y4, vehicle_id, cls_name, conf))
             
-            for i, (x3, y3, x4, y4, vehicle_id) in enumerate(tracked):
-                cx, cy = (int(x3 + x4) // 2, int(y3 + y4) // 2)
-                
-                if i < len(vehicle_info_map):
-                    cls_name, conf = vehicle_info_map[i]
-                else:
-                    cls_name = "vehicle"
-                    conf = 0.0
+            for roi_id in track_rois[i]:
+                roi_records = self.detected_vehicles.setdefault(roi_id, {})
+                record = roi_records.get(vehicle_id)
+                if record is None:
+                    record = roi_records[vehicle_id] = VehicleRecord(vehicle_id, cls_name, frame_idx)
+                    counts = self.class_counts.setdefault(roi_id, {})
+                    counts[cls_name] = counts.get(cls_name, 0) + 1
                 
-                
-                cv2.rectangle(frame, (x3, y3), (x4, y4), (255, 0, 0), 1) # Vẽ viền xung quanh xe
-                cv2.circle(frame, (cx, cy), 4, (0, 0, 255), -1)          # Vẽ chấm đỏ
-                
-                # Vẽ thông tin xe
-                conf_percent = int(conf * 100)
-                label = f"ID:{vehicle_id} {cls_name} {conf_percent}%"
-                cv2.putText(frame, label, (x3, y3 - 10), cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 255, 255), 1)
-                
-                if vehicle_id not in self.detected_vehicles[roi_id]:
-                    self.detected_vehicles[roi_id][vehicle_id] = {
-                        'id': vehicle_id,
-                        'type': cls_name,
-                        'count': 0
-                    }
-                
-                self.detected_vehicles[roi_id][vehicle_id]['count'] += 1
-                
-                if vehicle_id not in saved_ids:
-                    car_img = frame[y3:y4, x3:x4]
-                    if car_img.size != 0:
-                        cv2.imwrite(f"{self.save_dir}/roi{roi_id}_car_{vehicle_id}.jpg", car_img)
-                        saved_ids.add(vehicle_id)
+                record.count += 1
+                record.last_frame = frame_idx
+                if detected and conf > record.best_conf:
+                    record.best_conf = conf
+                key = (roi_id, vehicle_id)
+                self._changed[key] = record
+                self._activity[key] = record
+                self._activity.move_to_end(key)
+            
+            if self.snapshot_writer and detected:
+                self._update_best_crop(frame, tracked_box, conf, track_rois[i])
+        
+        for event, roi_id, vehicle_id in events:
+            self._emit_event(event, roi_id, vehicle_id, frame_idx)
+        for line_id, vehicle_id, direction in crossings:
+            self._count_crossing(line_id, vehicle_id, direction, frame_idx)
+        
+        if self.best_crops:
+            # Track đã bị tracker xóa: ghi ảnh tốt nhất của nó
+            for vehicle_id in [v for v in self.best_crops if v not in tracker.tracks]:
+                self._write_snapshot(vehicle_id)
+        
+        if self.evict_after is not None and frame_idx is not None:
+            self._evict_idle(frame_idx, tracker)
         
+        if len(self.track_types) > 2 * len(tracker.tracks) + 64:
+            # Bỏ loại xe của các track tracker đã xóa
+            self.track_types = {track_id: cls_name for track_id, cls_name in self.track_types.items()
+                                if track_id in tracker.tracks}
+        
+        if draw:
+            self.draw_tracks(frame)
         return frame
     
+    def draw_tracks(self, frame):
+        """Vẽ các xe trong ROI của lần process_rois gần nhất"""
+        for x3, y3, x4, y4, vehicle_id, cls_name, conf in self.last_tracked:
+            cx, cy = (int(x3 + x4) // 2, int(y3 + y4) // 2)
+            cv2.rectangle(frame, (x3, y3), (x4, y4), (255, 0, 0), 1) # Vẽ viền xung quanh xe
+            cv2.circle(frame, (cx, cy), 4, (0, 0, 255), -1)          # Vẽ chấm đỏ
+            
+            # Vẽ thông tin xe
+            conf_percent = int(conf * 100)
+            label = f"ID:{vehicle_id} {cls_name} {conf_percent}%"
+            cv2.putText(frame, label, (x3, y3 - 10), cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 255, 255), 1)
+        return frame
+    
+    def _update_best_crop(self, frame, tracked_box, conf, roi_ids):
+        """Giữ lại ảnh cắt tốt nhất của track (box lớn nhất hoặc confidence cao nhất)"""
+        x3, y3, x4, y4, vehicle_id = tracked_box
+        x3, y3 = max(int(x3), 0), max(int(y3), 0)
+        x4, y4 = int(x4), int(y4)
+        if x4 <= x3 or y4 <= y3:
+            return
+        score = conf if self.snapshot_metric == 'conf' else (x4 - x3) * (y4 - y3)
+        best = self.best_crops.get(vehicle_id)
+        if best is not None and best[0] >= score:
+            best[2].update(roi_ids)
+            return
+        crop = frame[y3:y4, x3:x4].copy()
+        if crop.size == 0:
+            return
+        merged_rois = set(roi_ids) if best is None else best[2] | set(roi_ids)
+        self.best_crops[vehicle_id] = (score, crop, merged_rois)
+    
+    def _write_snapshot(self, vehicle_id):
+        """Gửi ảnh tốt nhất của track cho writer và ghi tên file vào record của các ROI"""
+        score, crop, roi_ids = self.best_crops.pop(vehicle_id)
+        name = f"car_{vehicle_id}"
+        if not self.snapshot_writer.submit(name, crop):
+            return
+        path = self.snapshot_writer.path_for(name)
+        for roi_id in roi_ids:
+            record = self.detected_vehicles.get(roi_id, {}).get(vehicle_id)
+            if record is not None:
+                record.snapshot = path
+                self._changed[(roi_id, vehicle_id)] = record
+    
+    def _evict_idle(self, frame_idx, tracker):
+        """Lưu vào sink rồi bỏ khỏi bộ nhớ các record đã không xuất hiện evict_after frame"""
+        while self._activity:
+            key, record = next(iter(self._activity.items()))
+            if frame_idx - record.last_frame < self.evict_after:
+                return
+            if record.id in tracker.tracks or record.id in self.best_crops:
+                # Track vẫn còn (ví dụ đứng ngoài ROI) hoặc ảnh chưa ghi: xét lại sau
+                self._activity.move_to_end(key)
+                return
+            self._evict(key)
+    
+    def _evict(self, key):
+        roi_id, vehicle_id = key
+        record = self._activity.pop(key, None)
+        if record is None:
+            return
+        self.detected_vehicles.get(roi_id, {}).pop(vehicle_id, None)
+        self._changed.pop(key, None)
+        if self.sink is not None:
+            self.sink.write(roi_id, record.as_dict())
+        self.evicted[roi_id] = self.evicted.get(roi_id, 0) + 1
+        self.evicted_total += 1
+    
+    def _flush_records(self):
+        """Lưu mọi record còn trong bộ nhớ vào sink (khi đổi nguồn/đóng)"""
+        if self.sink is None:
+            return
+        for (roi_id, _), record in self._activity.items():
+            self.sink.write(roi_id, record.as_dict())
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+    
+    def memory_stats(self):
+        """Số record/ảnh đang giữ trong bộ nhớ, số record đã bỏ và RSS của tiến trình"""
+        return {
+            'records': len(self._activity),
+            'evicted': self.evicted_total,
+            'pending_snapshots': len(self.best_crops),
+            'snapshot_bytes': sum(crop.nbytes for _, crop, _ in self.best_crops.values()),
+            'track_types': len(self.track_types),
+            'events': len(self.events),
+            'rss_bytes': process_rss()
+        }
+    
+    def flush_snapshots(self):
+        """Ghi ảnh của mọi track chưa kết thúc (khi hết video/đổi video)"""
+        for vehicle_id in list(self.best_crops):
+            self._write_snapshot(vehicle_id)
+    
+    def snapshot_stats(self):
+        """Số liệu của snapshot writer (None nếu không lưu ảnh)"""
+        return self.snapshot_writer.stats() if self.snapshot_writer else None
+    
+    def close(self):
+        """Ghi nốt ảnh còn lại, dừng snapshot writer và lưu record còn lại vào sink"""
+        if self.snapshot_writer:
+            self.flush_snapshots()
+            self.snapshot_writer.close()
+            self.snapshot_writer = None
+        if self.sink is not None:
+            self._flush_records()
+            self.sink = None
+    
+    def _emit_event(self, event, roi_id, vehicle_id, frame_idx):
+        """Ghi nhận sự kiện xe vào/ra ROI và gọi callback on_event"""
+        record = {
+            'event': event,
+            'roi_id': roi_id,
+            'id': vehicle_id,
+            'type': self.track_types.get(vehicle_id, "vehicle"),
+            'frame': frame_idx
+        }
+        counts = self.event_counts.setdefault(roi_id, {'enter': 0, 'exit': 0})
+        counts[event] += 1
+        self.events.append(record)
+        if self.on_event:
+            self.on_event(record)
+    
+    def _count_crossing(self, line_id, vehicle_id, direction, frame_idx):
+        """Tăng bộ đếm của vạch theo hướng và loại xe"""
+        cls_name = self.track_types.get(vehicle_id, "vehicle")
+        counts = self.line_counts.setdefault(line_id, {'in': {}, 'out': {}})[direction]
+        counts[cls_name] = counts.get(cls_name, 0) + 1
+        self.crossings.append({
+            'line_id': line_id,
+            'direction': direction,
+            'id': vehicle_id,
+            'type': cls_name,
+            'frame': frame_idx
+        })
+    
+    def get_line_summary(self):
+        """
+        Tổng hợp lượt cắt theo vạch đếm
+        
+        Returns:
+            {line_id: {'in': {cls_name: n}, 'out': {cls_name: n}, 'total': n}}
+        """
+        return {
+            line_id: {
+                'in': dict(counts['in']),
+                'out': dict(counts['out']),
+                'total': sum(counts['in'].values()) + sum(counts['out'].values())
+            }
+            for line_id, counts in self.line_counts.items()
+        }
+    
+    def reset_line_counts(self, line_id):
+        """Reset bộ đếm của một vạch (khi vạch bị xóa/di chuyển)"""
+        self.line_counts.pop(line_id, None)
+    
     def get_vehicle_list(self):
         """Lấy danh sách vehicles để hiển thị"""
         vehicle_list = []
         for roi_id, vehicles in self.detected_vehicles.items():
             for vehicle_id, info in vehicles.items():
-                item_text = f"ROI{roi_id} - ID {vehicle_id}: {info['type']} (Count: {info['count']})"
+                item_text = f"ROI{roi_id} - ID {vehicle_id}: {info.type} (Count: {info.count})"
                 vehicle_list.append(item_text)
         return vehicle_list
     
+    def take_changes(self):
+        """
+        Lấy và xóa các thay đổi từ lần gọi trước (GUI chỉ cập nhật phần thay đổi)
+        
+        Returns:
+            {'cleared': True nếu reset_all() đã được gọi,
+             'removed_rois': các ROI đã bị reset_roi_vehicles(),
+             'records': [(roi_id, bản sao record), ...] của các xe mới hoặc thay đổi}
+        """
+        changes = {
+            'cleared': self._cleared,
+            'removed_rois': self._removed_rois,
+            'records': [(roi_id, record.as_dict()) for (roi_id, _), record in self._changed.items()]
+        }
+        self._changed = {}
+        self._removed_rois = set()
+        self._cleared = False
+        return changes
+    
+    def get_class_counts(self):
+        """Bản sao số xe theo loại của mỗi ROI {roi_id: {cls_name: số xe}}"""
+        return {roi_id: dict(counts) for roi_id, counts in self.class_counts.items()}
+    
+    def get_roi_summary(self):
+        """
+        Tổng hợp kết quả theo ROI
+        
+        Returns:
+            {roi_id: {'counts': {cls_name: số xe}, 'entries': số lượt vào,
+                      'exits': số lượt ra, 'tracks': [info, ...]}}
+        """
+        summary = {}
+        for roi_id, vehicles in self.detected_vehicles.items():
+            counts = dict(self.class_counts.get(roi_id, {}))
+            events = self.event_counts.get(roi_id, {})
+            summary[roi_id] = {
+                'counts': counts,
+                'entries': events.get('enter', 0),
+                'exits': events.get('exit', 0),
+                'tracks': [info.as_dict() for info in vehicles.values()],
+                'evicted': self.evicted.get(roi_id, 0)
+            }
+        return summary
+    
     def reset_roi_vehicles(self, roi_id):
         """Reset vehicles của ROI"""
         if roi_id in self.detected_vehicles:
+            if self.sink is not None:
+                for record in self.detected_vehicles[roi_id].values():
+                    self.sink.write(roi_id, record.as_dict())
             del self.detected_vehicles[roi_id]
+        self._activity = OrderedDict(
+            (key, record) for key, record in self._activity.items() if key[0] != roi_id
+        )
+        self.evicted.pop(roi_id, None)
+        self.class_counts.pop(roi_id, None)
+        self.event_counts.pop(roi_id, None)
+        self._changed = {key: record for key, record in self._changed.items() if key[0] != roi_id}
+        self._removed_rois.add(roi_id)
     
-    def reset_all(self):
-        """Reset tất cả vehicles"""
+    def reset_all(self, flush=False):
+        """
+        Reset tất cả vehicles (ảnh của các track đang theo dõi được ghi trước)
+
+        Args:
+            flush: Lưu record còn trong bộ nhớ vào sink trước khi reset (khi đổi
+                nguồn video). Đổi bộ lọc chỉ bắt đầu đếm lại nên không lưu, tránh
+                ghi trùng xe vào sink mỗi lần bộ lọc thay đổi.
+        """
+        if self.snapshot_writer:
+            self.flush_snapshots()
+        if flush:
+            self._flush_records()
         self.detected_vehicles = {}
+        self._activity = OrderedDict()
+        self.evicted = {}
+        self.evicted_total = 0
+        self.class_counts = {}
+        self.track_types = {}
+        self.best_crops = {}
+        self.last_tracked = []
+        self.events.clear()
+        self.event_counts = {}
+        self.line_counts = {}
+        self.crossings.clear()
+        self._changed = {}
+        self._removed_rois = set()
+        self._cleared = True
 
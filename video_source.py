@@ -0,0 +1,301 @@
+"""
+Nguồn video cho pipeline: đọc frame ở kích thước làm việc, seek nhanh và
+cache các frame vừa decode.
+
+Kích thước làm việc được tính từ độ phân giải gốc (coords.working_size): mặc
+định giữ tỉ lệ của video với cạnh dài 900 pixel; khi bằng độ phân giải gốc thì
+frame decode được dùng thẳng, không resize.
+
+- PyAVSource: FFmpeg qua PyAV, decode đa luồng, chuyển màu và resize trong
+  cùng một bước (swscale), index keyframe để seek không phải decode lại từ đầu GOP.
+- OpenCVSource: cv2.VideoCapture (thử tăng tốc phần cứng), dùng khi không có PyAV.
+- URL luồng trực tiếp (rtsp://, http://, ...) được mở bằng stream_source.StreamSource.
+"""
+import bisect
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import cv2
+
+from coords import DEFAULT_LONG_SIDE, working_size
+
+try:
+    import av
+    AVError = getattr(av, 'FFmpegError', None) or getattr(av, 'AVError')
+except ImportError:
+    av = None
+
+
+class LRUCache:
+    """Cache giới hạn số phần tử, bỏ phần tử dùng lâu nhất khi đầy"""
+
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class VideoSource(ABC):
+    """
+    Giao diện chung của nguồn video
+
+    Attributes:
+        fps: FPS của video (0 nếu không biết)
+        frame_count: Tổng số frame (0 nếu không biết)
+        position: Chỉ số (bắt đầu từ 0) của frame sẽ được read() trả về tiếp theo
+        is_live: Nguồn trực tiếp (camera), không seek được
+        keep_native: Giữ frame ở độ phân giải gốc của lần read() gần nhất trong
+            native_frame (cho detect theo tile)
+        native_size: Độ phân giải gốc (width, height), None khi chưa biết
+        frame_size: Kích thước làm việc (width, height), None khi chưa biết (luồng
+            trực tiếp chưa nhận frame nào)
+    """
+
+    fps = 0.0
+    frame_count = 0
+    position = 0
+    is_live = False
+    keep_native = False
+    native_frame = None
+    size_spec = DEFAULT_LONG_SIDE
+    native_size = None
+    frame_size = None
+
+    def _set_native_size(self, width, height):
+        """Tính kích thước làm việc khi biết (hoặc camera đổi) độ phân giải gốc"""
+        self.native_size = (width, height)
+        self.frame_size = working_size(self.native_size, self.size_spec)
+
+    @abstractmethod
+    def read(self, stop_event=None):
+        """
+        (ok, frame BGR ở kích thước làm việc)
+
+        Args:
+            stop_event: threading.Event của pipeline; nguồn có thể chờ lâu (camera
+                mất kết nối) trả về (False, None) ngay khi event được đặt
+        """
+
+    @abstractmethod
+    def seek(self, index):
+        """Để read() tiếp theo trả về frame có chỉ số index"""
+
+    def capture_time(self, index):
+        """Thời điểm (time.monotonic) nhận frame index từ camera; None với file video"""
+        return None
+
+    def release(self):
+        pass
+
+
+class OpenCVSource(VideoSource):
+    """Đọc video bằng cv2.VideoCapture rồi resize về kích thước làm việc"""
+
+    # Seek tới trong khoảng này thì grab() tiếp thay vì seek (không phải decode lại từ keyframe)
+    max_forward_grab = 30
+
+    def __init__(self, path, frame_size=DEFAULT_LONG_SIDE, hw_accel=True):
+        self.path = path
+        self.size_spec = frame_size
+        self.cap = None
+        if hw_accel and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+            if cap.isOpened():
+                self.cap = cap
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.frame_count = max(0, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.position = 0
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width > 0 and height > 0:
+            self._set_native_size(width, height)
+
+    def read(self, stop_event=None):
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        self.position += 1
+        if self.keep_native:
+            self.native_frame = frame
+        if (frame.shape[1], frame.shape[0]) != self.native_size:
+            self._set_native_size(frame.shape[1], frame.shape[0])
+        if self.frame_size != self.native_size:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        return True, frame
+
+    def seek(self, index):
+        index = max(0, int(index))
+        if 0 <= index - self.position <= self.max_forward_grab:
+            while self.position < index and self.cap.grab():
+                self.position += 1
+            return
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        self.position = index
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVSource(VideoSource):
+    """Đọc video bằng PyAV: decode đa luồng, resize khi chuyển màu, seek theo index keyframe"""
+
+    def __init__(self, path, frame_size=DEFAULT_LONG_SIDE, threads=0):
+        """
+        Args:
+            path: Đường dẫn file video
+            frame_size: Kích thước làm việc (xem coords.working_size)
+            threads: Số thread decode (0 = FFmpeg tự chọn)
+        """
+        if av is None:
+            raise ImportError("PyAV is not installed (pip install av)")
+        self.path = path
+        self.size_spec = frame_size
+        try:
+            self.container = av.open(path)
+        except AVError as e:
+            raise IOError(f"Cannot open video: {path} ({e})")
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.stream.thread_count = threads
+        if self.stream.codec_context.width and self.stream.codec_context.height:
+            self._set_native_size(self.stream.codec_context.width, self.stream.codec_context.height)
+
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 0.0
+        self.time_base = self.stream.time_base
+        self.start_pts = self.stream.start_time or 0
+        self.frame_count = self.stream.frames
+        if not self.frame_count and self.container.duration and self.fps:
+            self.frame_count = int(self.container.duration / av.time_base * self.fps)
+
+        self.position = 0
+        self.keyframes = None
+        self._frames = self.container.decode(self.stream)
+        self._skip_until = None
+        self._last_pts = None
+
+    def _index_to_pts(self, index):
+        return self.start_pts + int(round(index / self.fps / self.time_base))
+
+    def _pts_to_index(self, pts):
+        return int(round(float((pts - self.start_pts) * self.time_base) * self.fps))
+
+    def _build_keyframe_index(self):
+        """Đọc pts của các keyframe bằng cách demux (không decode) toàn bộ file"""
+        keyframes = []
+        with av.open(self.path) as container:
+            stream = container.streams.video[0]
+            for packet in container.demux(stream):
+                if packet.is_keyframe and packet.pts is not None:
+                    keyframes.append(packet.pts)
+        self.keyframes = sorted(keyframes) or [self.start_pts]
+
+    def read(self, stop_event=None):
+        while True:
+            try:
+                frame = next(self._frames)
+            except (StopIteration, AVError):
+                return False, None
+            if self._skip_until is not None and frame.pts is not None and frame.pts < self._skip_until:
+                # Frame trước vị trí seek: chỉ decode, không chuyển màu
+                self._last_pts = frame.pts
+                continue
+            self._skip_until = None
+            break
+
+        if frame.pts is not None and self.fps:
+            self.position = self._pts_to_index(frame.pts) + 1
+            self._last_pts = frame.pts
+        else:
+            self.position += 1
+        if (frame.width, frame.height) != self.native_size:
+            self._set_native_size(frame.width, frame.height)
+        if self.frame_size == self.native_size:
+            image = frame.to_ndarray(format="bgr24")
+            if self.keep_native:
+                self.native_frame = image
+        elif self.keep_native:
+            # Chuyển màu một lần ở độ phân giải gốc rồi thu nhỏ bằng OpenCV
+            self.native_frame = frame.to_ndarray(format="bgr24")
+            image = cv2.resize(self.native_frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        else:
+            width, height = self.frame_size
+            image = frame.to_ndarray(width=width, height=height, format="bgr24")
+        return True, image
+
+    def seek(self, index):
+        index = max(0, int(index))
+        if not self.fps:
+            raise IOError(f"Cannot seek in video without frame rate: {self.path}")
+        if self.keyframes is None:
+            self._build_keyframe_index()
+        target_pts = self._index_to_pts(index)
+        keyframe_pts = self.keyframes[max(0, bisect.bisect_right(self.keyframes, target_pts) - 1)]
+
+        # Đích nằm phía trước trong cùng GOP với vị trí hiện tại: decode tiếp, không seek
+        same_gop = (self._last_pts is not None and index >= self.position
+                    and keyframe_pts <= self._last_pts)
+        if not same_gop:
+            self.container.seek(keyframe_pts, stream=self.stream, backward=True, any_frame=False)
+            self._frames = self.container.decode(self.stream)
+            self._last_pts = None
+        self._skip_until = target_pts
+        self.position = index
+
+    def release(self):
+        self.container.close()
+
+
+def open_source(path, frame_size=DEFAULT_LONG_SIDE, backend='auto', threads=0):
+    """
+    Mở nguồn video
+
+    Args:
+        path: Đường dẫn file video hoặc URL luồng trực tiếp (rtsp://, http://, ...)
+        frame_size: Kích thước làm việc: (width, height) cố định, cạnh dài (int, giữ
+            tỉ lệ) hoặc None = độ phân giải gốc (xem coords.working_size)
+        backend: 'pyav', 'opencv' hoặc 'auto' (PyAV nếu đã cài)
+        threads: Số thread decode của PyAV (0 = tự chọn)
+    """
+    if backend not in ('auto', 'pyav', 'opencv'):
+        raise ValueError(f"Unknown decode backend: {backend}")
+    # Import tại chỗ: stream_source dùng VideoSource/LRUCache của module này
+    from stream_source import StreamSource, is_stream_url
+    if is_stream_url(path):
+        return StreamSource(path, frame_size)
+    if backend == 'pyav' or (backend == 'auto' and av is not None):
+        try:
+            return PyAVSource(path, frame_size, threads)
+        except (IOError, IndexError):
+            if backend == 'pyav':
+                raise
+    return OpenCVSource(path, frame_size)
@@ -1,24 +1,100 @@
+import time
+
 import cv2
-from PyQt5.QtWidgets import QLabel
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import Qt
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtCore import Qt, QTimer
+
+
+# Qt >= 5.14 đọc thẳng buffer BGR của OpenCV, không cần chuyển sang RGB
+HAS_BGR888 = hasattr(QImage, 'Format_BGR888')
+
+
+class VideoWidget(QWidget):
+    """
+    Widget để hiển thị video frame
 
+    update_frame() chỉ giữ lại frame mới nhất; việc vẽ diễn ra trong
+    paintEvent với tần suất tối đa max_fps, độc lập với tốc độ xử lý của
+    pipeline. Frame được thu nhỏ một lần bằng OpenCV về đúng kích thước hiển
+    thị (giữ tỉ lệ) rồi bọc thành QImage không copy. Khi widget bị che hoặc
+    cửa sổ thu nhỏ thì không vẽ.
+    """
 
-class VideoWidget(QLabel):
-    """Widget để hiển thị video frame"""
-    
-    def __init__(self):
+    def __init__(self, max_fps=30):
+        """
+        Args:
+            max_fps: Số lần vẽ tối đa mỗi giây (None = vẽ mọi frame)
+        """
         super().__init__()
-        self.setAlignment(Qt.AlignCenter)
         self.setMinimumSize(800, 500)
-        self.setStyleSheet("background:black;")
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+
+        self._frame = None
+        self._pending = False
+        self._last_paint = 0.0
+        self._buffer = None       # Ảnh đã thu nhỏ (BGR)
+        self._rgb_buffer = None   # Chỉ dùng khi Qt không có Format_BGR888
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.update)
+
+        self.displayed_frames = 0
+        self.skipped_frames = 0
 
     def update_frame(self, frame):
-        """Cập nhật frame hiển thị"""
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb.shape
-        bytes_per_line = ch * w
-        img = QImage(rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pix = QPixmap.fromImage(img)
-        self.setPixmap(pix)
+        """Cập nhật frame hiển thị (frame không được sửa sau khi truyền vào)"""
+        if self._pending:
+            # Frame trước chưa kịp vẽ đã có frame mới
+            self.skipped_frames += 1
+        self._frame = frame
+        self._pending = True
+        if self.visibleRegion().isEmpty() or self._timer.isActive():
+            return
+        wait = self.min_interval - (time.perf_counter() - self._last_paint)
+        if wait > 0:
+            self._timer.start(int(wait * 1000) + 1)
+        else:
+            self.update()
+
+    def _display_image(self, frame):
+        """(QImage, x, y): frame thu nhỏ giữ tỉ lệ, căn giữa widget"""
+        h, w = frame.shape[:2]
+        scale = min(self.width() / w, self.height() / h)
+        target_w, target_h = max(1, int(w * scale)), max(1, int(h * scale))
+        if (target_w, target_h) == (w, h):
+            image = np.ascontiguousarray(frame)
+        else:
+            if self._buffer is None or self._buffer.shape[:2] != (target_h, target_w):
+                self._buffer = np.empty((target_h, target_w, 3), dtype=np.uint8)
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            image = cv2.resize(frame, (target_w, target_h), dst=self._buffer, interpolation=interpolation)
+
+        if HAS_BGR888:
+            image_format = QImage.Format_BGR888
+        else:
+            if self._rgb_buffer is None or self._rgb_buffer.shape != image.shape:
+                self._rgb_buffer = np.empty_like(image)
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb_buffer)
+            image_format = QImage.Format_RGB888
+        # QImage dùng chung bộ nhớ với mảng NumPy (chỉ dùng trong paintEvent này)
+        qimage = QImage(image.data, target_w, target_h, image.strides[0], image_format)
+        return qimage, (self.width() - target_w) // 2, (self.height() - target_h) // 2
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        if self._frame is not None:
+            qimage, x, y = self._display_image(self._frame)
+            painter.drawImage(x, y, qimage)
+            if self._pending:
+                self.displayed_frames += 1
+        painter.end()
+        self._pending = False
+        self._last_paint = time.perf_counter()
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update()